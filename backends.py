@@ -0,0 +1,176 @@
+# backends.py
+"""检测模型推理后端
+
+所有后端提供相同的 predict(frames, imgsz, conf) 接口，返回与输入顺序一致的
+(N, 6) 数组列表 [x1, y1, x2, y2, score, class_id]，坐标对应原始图像。
+"""
+import cv2
+import numpy as np
+from config import YOLO_MODEL, ONNX_MODEL, NMS_IOU_THRESHOLD, MAX_DETECTIONS
+from monitor import get_logger
+
+logger = get_logger('backends')
+
+# letterbox 填充颜色，与 ultralytics 一致
+LETTERBOX_COLOR = 114
+
+
+def letterbox(image, size):
+    """等比缩放并填充到 size×size，返回 (图像, 缩放比例, (左边距, 上边距))"""
+    h, w = image.shape[:2]
+    gain = min(size / h, size / w)
+    new_h, new_w = round(h * gain), round(w * gain)
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    canvas = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas, gain, (left, top)
+
+
+def preprocess(images, size):
+    """BGR图像列表转为模型输入 (B, 3, size, size) 以及每张图的还原参数"""
+    blobs = []
+    params = []
+    for image in images:
+        canvas, gain, pad = letterbox(image, size)
+        blobs.append(canvas[..., ::-1].transpose(2, 0, 1))
+        params.append((gain, pad, image.shape[:2]))
+    batch = np.ascontiguousarray(np.stack(blobs), dtype=np.float32) / 255.0
+    return batch, params
+
+
+def nms(boxes, scores, iou_threshold, over_smaller=False):
+    """非极大值抑制，boxes为 (N, 4) xyxy，返回保留的下标（按分数降序）
+
+    over_smaller=True 时用交集占较小框面积的比例代替IoU，被截断的框与完整的框也能互相抑制。
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        if over_smaller:
+            iou = inter / (np.minimum(areas[i], areas[order[1:]]) + 1e-9)
+        else:
+            iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(detections, iou_threshold, over_smaller=False):
+    """按类别分别做非极大值抑制，detections为 (N, 6) 数组"""
+    if len(detections) == 0:
+        return detections
+    # 不同类别的框加上足够大的偏移，使它们互不重叠
+    offsets = detections[:, 5:6] * (detections[:, :4].max() + 1)
+    keep = nms(detections[:, :4] + offsets, detections[:, 4], iou_threshold, over_smaller)
+    return detections[keep]
+
+
+def postprocess(output, params, conf, iou_threshold=NMS_IOU_THRESHOLD, max_det=MAX_DETECTIONS):
+    """解码YOLOv8输出 (B, 4+nc, anchors)，还原到原始图像坐标"""
+    results = []
+    for pred, (gain, (left, top), (h, w)) in zip(output, params):
+        pred = pred.T
+        class_scores = pred[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(pred)), class_ids]
+        mask = scores > conf
+        if not mask.any():
+            results.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+
+        cx, cy, bw, bh = pred[mask, :4].T
+        detections = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2,
+                               scores[mask], class_ids[mask]], axis=1).astype(np.float32)
+        detections = batched_nms(detections, iou_threshold)[:max_det]
+
+        detections[:, [0, 2]] = ((detections[:, [0, 2]] - left) / gain).clip(0, w)
+        detections[:, [1, 3]] = ((detections[:, [1, 3]] - top) / gain).clip(0, h)
+        results.append(detections)
+    return results
+
+
+class UltralyticsBackend:
+    """通过 ultralytics/PyTorch 加载 .pt 模型"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model_path=YOLO_MODEL):
+        from ultralytics import YOLO
+        self.model_path = model_path
+        self.model = YOLO(model_path)
+
+    def predict(self, frames, imgsz, conf):
+        results = self.model(frames, conf=conf, imgsz=imgsz, iou=NMS_IOU_THRESHOLD,
+                             max_det=MAX_DETECTIONS, verbose=False)
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+
+class OnnxBackend:
+    """通过 ONNX Runtime 运行导出的 .onnx 模型，不依赖 PyTorch"""
+
+    name = 'onnxruntime'
+
+    def __init__(self, model_path=ONNX_MODEL, providers=('CPUExecutionProvider',)):
+        import onnxruntime as ort
+        available = ort.get_available_providers()
+        missing = [p for p in providers if p not in available]
+        if missing:
+            logger.warning("onnxruntime 不支持 %s，改用 %s", ', '.join(missing),
+                           ', '.join(p for p in providers if p in available) or 'CPUExecutionProvider')
+        providers = [p for p in providers if p in available] or ['CPUExecutionProvider']
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, providers=providers)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 导出时未开启动态尺寸的模型只能按固定批大小和分辨率推理
+        batch_dim, _, height, _ = model_input.shape
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) else None
+        self.fixed_imgsz = height if isinstance(height, int) else None
+
+    def predict(self, frames, imgsz, conf):
+        imgsz = self.fixed_imgsz or imgsz
+        step = self.fixed_batch or len(frames)
+        results = []
+        for start in range(0, len(frames), step):
+            batch, params = preprocess(frames[start:start + step], imgsz)
+            output = self.session.run(None, {self.input_name: batch})[0]
+            results.extend(postprocess(output, params, conf))
+        return results
+
+
+class OpenVinoBackend(OnnxBackend):
+    """通过 ONNX Runtime 的 OpenVINO 执行器运行 .onnx 模型"""
+
+    name = 'openvino'
+
+    def __init__(self, model_path=ONNX_MODEL):
+        import onnxruntime as ort
+        # 没有 OpenVINO 执行器时不退回CPU执行器，以免把CPU的结果当作OpenVINO的结果
+        if 'OpenVINOExecutionProvider' not in ort.get_available_providers():
+            raise RuntimeError("当前安装的 onnxruntime 不包含 OpenVINO 执行器，请安装 onnxruntime-openvino")
+        super().__init__(model_path, providers=('OpenVINOExecutionProvider', 'CPUExecutionProvider'))
+
+
+BACKENDS = {
+    'ultralytics': UltralyticsBackend,
+    'onnxruntime': OnnxBackend,
+    'openvino': OpenVinoBackend,
+}
+
+
+def create_backend(name, model_path=None):
+    """按名称创建推理后端，model_path为None时使用config中的默认模型"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {name}，可选: {', '.join(BACKENDS)}")
+    backend_class = BACKENDS[name]
+    return backend_class(model_path) if model_path else backend_class()
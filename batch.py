@@ -0,0 +1,212 @@
+# batch.py
+"""批量检测图片目录
+
+递归读取目录中的图片，由线程池并行解码，按批送入 HelmetDetector 检测，每处理
+commit_size 张图片把检测记录用一个事务写入数据库。已处理的图片记录在检查点文件中，中断后重新运行
+同一命令会跳过这些图片，从中断处继续。检测时间取图片文件的修改时间。
+
+用法:
+    python batch.py /data/site_photos --site 工地名称 [--decode-workers 4] [--batch-size 8]
+    python batch.py /data/site_photos --site 工地名称 --restart    # 忽略检查点从头处理
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import cv2
+from box_store import pack_boxes
+from config import (DB_PATH, DETECT_BATCH_SIZE, DETECTION_STORE_CONF, RECORD_BATCH_SIZE,
+                    STORE_DETECTIONS)
+from database import Database
+from detector import HelmetDetector
+from image_store import ImageStore, iter_image_files
+from monitor import get_logger, setup_logging
+
+logger = get_logger('batch')
+
+CHECKPOINT_NAME = '.batch_checkpoint'
+
+
+class Checkpoint:
+    """已处理图片的路径列表，每次提交后追加写入并同步到磁盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+
+    def add(self, paths):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(f'{path}\n' for path in paths)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(paths)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = set()
+
+
+def find_images(directory):
+    """按路径排序列出目录中的全部图片（不含缩略图）"""
+    return sorted(path for path, _, _ in iter_image_files(directory))
+
+
+def decode(path):
+    return path, cv2.imread(path)
+
+
+def decode_ahead(executor, paths, prefetch):
+    """在线程池中提前解码最多 prefetch 张图片，按原顺序产出 (路径, 图像)"""
+    paths = iter(paths)
+    pending = deque(executor.submit(decode, path) for path in islice(paths, prefetch))
+    while pending:
+        result = pending.popleft().result()
+        path = next(paths, None)
+        if path is not None:
+            pending.append(executor.submit(decode, path))
+        yield result
+
+
+class BatchProcessor:
+    """批量检测图片并写入检测记录
+
+    images 为 ImageStore 时保存绘制了检测框的截图，为None时记录不关联图片。
+    """
+
+    def __init__(self, db, detector, site_id, images=None, batch_size=DETECT_BATCH_SIZE, decode_workers=4,
+                 commit_size=RECORD_BATCH_SIZE, store_detections=STORE_DETECTIONS):
+        self.db = db
+        self.detector = detector
+        self.site_id = site_id
+        self.images = images
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.commit_size = commit_size
+        self.store_detections = store_detections
+        self.processed = 0
+        self.records = 0
+        self.failed = 0
+
+    def _detect(self, batch):
+        """检测一批 (路径, 图像)，返回检测记录列表"""
+        paths, frames = zip(*batch)
+        results = self.detector.detect_batch(list(frames), annotate=self.images is not None,
+                                             with_candidates=True)
+        records = []
+        for path, (frame, total, with_helmet, without_helmet, _, candidates) in zip(paths, results):
+            # 没有检测到人的图片只计入进度，不写记录
+            if total == 0:
+                continue
+            image_path = ''
+            if self.images is not None:
+                image_path = self.images.save(frame, prefix='batch', copy=False)
+            detection_time = datetime.fromtimestamp(os.path.getmtime(path))
+            boxes = pack_boxes(candidates) if self.store_detections else None
+            records.append((self.site_id, detection_time, total, with_helmet, without_helmet, image_path, boxes))
+        return records
+
+    def _commit(self, records, paths, checkpoint):
+        # paths 中的图片必须都已检测完（或读取失败），它们的记录都在 records 中。
+        # 先提交记录再写检查点，中断时最多重复处理最后一次提交的图片，不会遗漏
+        if records:
+            self.db.add_detection_records(records)
+        checkpoint.add(paths)
+        self.records += len(records)
+
+    def run(self, paths, checkpoint, report_interval=2.0):
+        """处理 paths 中尚未记录在检查点里的图片，返回 (处理的图片数, 写入的记录数, 读取失败数)"""
+        todo = [path for path in paths if path not in checkpoint.done]
+        skipped = len(paths) - len(todo)
+        if skipped:
+            print(f"检查点中已有 {skipped} 张图片，跳过")
+        start = last_report = time.perf_counter()
+        batch, records, committed_paths = [], [], []
+        with ThreadPoolExecutor(self.decode_workers) as executor:
+            try:
+                for path, image in decode_ahead(executor, todo, self.batch_size * 4):
+                    committed_paths.append(path)
+                    if image is None:
+                        logger.warning("无法读取图片: %s", path)
+                        self.failed += 1
+                    else:
+                        batch.append((path, image))
+                    if len(batch) >= self.batch_size:
+                        records.extend(self._detect(batch))
+                        self.processed += len(batch)
+                        batch = []
+                    # 只在整批检测完成后提交，检查点中不会包含还在 batch 中等待检测的图片
+                    if not batch and len(committed_paths) >= self.commit_size:
+                        self._commit(records, committed_paths, checkpoint)
+                        records, committed_paths = [], []
+                    now = time.perf_counter()
+                    if now - last_report >= report_interval:
+                        last_report = now
+                        done = self.processed + self.failed
+                        print(f"已处理 {done}/{len(todo)} 张，{done / (now - start):.1f} 张/秒，"
+                              f"写入 {self.records} 条记录")
+                if batch:
+                    records.extend(self._detect(batch))
+                    self.processed += len(batch)
+                    batch = []
+            except KeyboardInterrupt:
+                # 已检测的图片照常提交，未检测的留到下次运行
+                unfinished = {path for path, _ in batch}
+                committed_paths = [path for path in committed_paths if path not in unfinished]
+                print("已中断，保存进度")
+            self._commit(records, committed_paths, checkpoint)
+        elapsed = time.perf_counter() - start
+        done = self.processed + self.failed
+        print(f"完成 {done} 张，用时 {elapsed:.1f} 秒，{done / elapsed if elapsed else 0:.1f} 张/秒，"
+              f"写入 {self.records} 条记录，读取失败 {self.failed} 张")
+        return self.processed, self.records, self.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量检测图片目录')
+    parser.add_argument('directory', help='图片目录（递归查找）')
+    parser.add_argument('--site', required=True, help='检测记录所属的工地名称')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    parser.add_argument('--checkpoint', default=None, help=f'检查点文件，默认为图片目录下的 {CHECKPOINT_NAME}')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头处理')
+    parser.add_argument('--batch-size', type=int, default=DETECT_BATCH_SIZE, help='每次送入模型的图片数')
+    parser.add_argument('--decode-workers', type=int, default=4, help='解码图片的线程数')
+    parser.add_argument('--commit-size', type=int, default=RECORD_BATCH_SIZE, help='每个事务处理的图片数')
+    parser.add_argument('--no-images', action='store_true', help='不保存绘制了检测框的截图')
+    args = parser.parse_args()
+
+    setup_logging()
+    db = Database(args.db)
+    site = db.get_site_by_name(args.site)
+    if site is None:
+        raise SystemExit(f"工地不存在: {args.site}")
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.directory, CHECKPOINT_NAME))
+    if args.restart:
+        checkpoint.clear()
+
+    paths = find_images(args.directory)
+    print(f"共找到 {len(paths)} 张图片")
+    # 目录中重复的图片以及 --restart 重新处理时（配置了 RESULT_CACHE_PATH）不再推理
+    detector = HelmetDetector(batch_size=args.batch_size,
+                              candidate_conf=DETECTION_STORE_CONF if STORE_DETECTIONS else None,
+                              result_cache=True)
+    images = None if args.no_images else ImageStore(db=db)
+    processor = BatchProcessor(db, detector, site[0], images, args.batch_size, args.decode_workers,
+                               args.commit_size)
+    try:
+        processor.run(paths, checkpoint)
+    finally:
+        if images is not None:
+            images.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,649 @@
+# benchmark.py
+"""检测与数据库热路径的基准测试
+
+用法:
+    python benchmark.py all [--output bench.json] [--compare baseline.json]
+    python benchmark.py latency [--images captured_images] [--repeats 3]
+    python benchmark.py throughput [--batch-sizes 1 4 8] [--sizes 256 416 640]
+    python benchmark.py db-insert [--records 2000]
+    python benchmark.py db-query [--rows 10000 1000000]
+    python benchmark.py export [--rows 1000000] [--formats csv parquet]
+    python benchmark.py db-concurrency [--readers 4] [--writers 2] [--duration 5]
+    python benchmark.py rescore [--rows 1000000]
+    python benchmark.py startup [--runs 3]
+    python benchmark.py imgsz [--sizes 256 416 640] [--data hardhat_dataset/dataset.yaml]
+    python benchmark.py roi --images site_4k --polygon 0 900 3840 700 3840 2160 0 2160 [--tile-sizes 640 1280]
+    python benchmark.py backends [--backends ultralytics onnxruntime onnxruntime:exp12/weights/best_int8.onnx]
+
+每次运行的结果连同提交号、运行环境写入 --output 指定的JSON文件，
+--compare 与之前保存的结果对比，便于在不同提交之间发现性能回退。
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+from box_store import BOX_DTYPE, BoxArchive
+from config import CAPTURE_DIR, DETECTION_STORE_CONF, INFER_IMGSZ
+from database import Database, RecordWriter
+from detector import HelmetDetector
+from export import export_records
+from roi import RegionOfInterest
+from tracker import iou_matrix
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.jfif')
+
+
+def load_images(image_dir, limit=None, with_paths=False):
+    """读取目录中的测试图片，with_paths=True 时返回 (路径列表, 图片列表)"""
+    # 截图按日期保存在子目录中
+    paths = sorted(p for pattern in IMAGE_PATTERNS
+                   for p in glob.glob(os.path.join(image_dir, '**', pattern), recursive=True))
+    loaded = [(p, image) for p, image in ((p, cv2.imread(p)) for p in paths[:limit]) if image is not None]
+    if not loaded:
+        raise RuntimeError(f"目录中没有可用的测试图片: {image_dir}")
+    paths, images = (list(items) for items in zip(*loaded))
+    return (paths, images) if with_paths else images
+
+
+def load_labels(label_dir, paths, images):
+    """读取与图片同名的YOLO格式标注（每行 class cx cy w h，相对坐标），返回每张图片的 (N, 6) 数组"""
+    labels = []
+    for path, image in zip(paths, images):
+        label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + '.txt')
+        rows = np.loadtxt(label_path, ndmin=2) if os.path.exists(label_path) else np.zeros((0, 5))
+        h, w = image.shape[:2]
+        cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+        labels.append(np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2,
+                                np.ones(len(rows)), rows[:, 0]], axis=1).astype(np.float32))
+    return labels
+
+
+def latency_summary(latencies_ms):
+    latencies = np.asarray(latencies_ms)
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def timed(func, *args, **kwargs):
+    """执行函数，返回 (耗时毫秒, 返回值)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def match_recall(reference, detections, iou_threshold=0.5):
+    """以参考结果为准，统计同类别且IoU达到阈值的检测框所占比例"""
+    if len(reference) == 0:
+        return 1.0 if len(detections) == 0 else 0.0
+    if len(detections) == 0:
+        return 0.0
+    ious = iou_matrix(reference[:, :4], detections[:, :4])
+    ious[reference[:, None, 5] != detections[None, :, 5]] = 0
+    return float(np.count_nonzero(ious.max(axis=1) >= iou_threshold)) / len(reference)
+
+
+# ---------------------------------------------------------------- 检测
+
+def run_detector(detector, images, repeats, region=None):
+    """逐张检测图片（region不为None时只检测其中的检测区域），返回 (每次检测耗时列表, 最后一轮的检测结果)"""
+    detector.detect_batch(images[:1], annotate=False, regions=[region])  # 预热
+    latencies = []
+    outputs = []
+    for _ in range(repeats):
+        outputs = []
+        for image in images:
+            latency, result = timed(detector.detect_batch, [image], annotate=False, regions=[region])
+            outputs.append(result[0][4])
+            latencies.append(latency)
+    return latencies, outputs
+
+
+def compare_to_reference(latencies, outputs, reference):
+    result = latency_summary(latencies)
+    result['recall_vs_reference'] = float(np.mean([match_recall(r, o) for r, o in zip(reference, outputs)]))
+    result['count_error_vs_reference'] = float(np.mean([abs(len(r) - len(o)) for r, o in zip(reference, outputs)]))
+    return result
+
+
+def bench_latency(images, repeats=3, imgsz=INFER_IMGSZ):
+    """detect_frame 单帧耗时（含绘制）"""
+    detector = HelmetDetector(imgsz=imgsz)
+    detector.detect_frame(images[0].copy())  # 预热
+    latencies = []
+    for _ in range(repeats):
+        for image in images:
+            latency, _ = timed(detector.detect_frame, image.copy())
+            latencies.append(latency)
+    result = latency_summary(latencies)
+    result['frames'] = len(latencies)
+    return result
+
+
+def bench_throughput(images, batch_sizes, sizes, repeats=3):
+    """不同批大小和推理分辨率下 detect_batch 的吞吐量（帧/秒）"""
+    results = {}
+    for size in sizes:
+        detector = HelmetDetector(imgsz=size)
+        detector.detect_batch(images[:1], annotate=False)  # 预热
+        for batch_size in batch_sizes:
+            # 图片不足一个批次时循环补齐
+            frames = [images[i % len(images)] for i in range(max(batch_size, len(images)))]
+            elapsed_ms, _ = timed(lambda: [detector.detect_batch(frames, batch_size=batch_size, annotate=False)
+                                           for _ in range(repeats)])
+            results[f'imgsz{size}_batch{batch_size}'] = {
+                'frames_per_sec': len(frames) * repeats / (elapsed_ms / 1000),
+            }
+    return results
+
+
+def bench_imgsz(images, sizes, repeats=3, data=None):
+    """比较不同推理分辨率的速度，以及与最高分辨率结果的一致程度"""
+    results = {}
+    reference = None
+    for size in sorted(sizes, reverse=True):
+        detector = HelmetDetector(imgsz=size)
+        latencies, outputs = run_detector(detector, images, repeats)
+        if reference is None:
+            reference = outputs
+        result = compare_to_reference(latencies, outputs, reference)
+        if data:
+            # 有标注数据集时计算 mAP50
+            result['map50'] = float(detector.backend.model.val(data=data, imgsz=size, verbose=False).box.map50)
+        results[str(size)] = result
+    return dict(sorted(results.items(), key=lambda item: int(item[0])))
+
+
+def bench_backends(images, backends, repeats=3):
+    """比较不同推理后端的速度，以及与第一个后端结果的一致程度
+
+    backends中每项为后端名称，或 "名称:模型路径" 以指定模型文件（如INT8量化模型）。
+    """
+    results = {}
+    reference = None
+    for spec in backends:
+        name, _, model_path = spec.partition(':')
+        try:
+            detector = HelmetDetector(backend=name, model_path=model_path or None)
+        except (ImportError, RuntimeError) as e:
+            print(f'无法创建后端 {spec}，跳过: {e}')
+            continue
+        latencies, outputs = run_detector(detector, images, repeats)
+        if reference is None:
+            reference = outputs
+        results[spec] = compare_to_reference(latencies, outputs, reference)
+    return results
+
+
+def bench_roi(images, polygons=None, tile_sizes=(640, 1280), repeats=3, labels=None):
+    """比较整幅画面推理、只推理检测区域和分块推理的耗时与检测区域内目标的召回率
+
+    labels 为与 images 对应的标注框时以标注为准计算召回率，否则以整幅画面推理的结果为准，
+    此时分块推理多检出的小目标不体现在召回率中，可比较 detections_per_frame。
+    """
+    detector = HelmetDetector()
+    modes = {'full': None}
+    if polygons:
+        modes['roi'] = RegionOfInterest(polygons)
+    for size in tile_sizes:
+        modes[f'tiled{size}'] = RegionOfInterest(polygons, tile_size=size)
+    # 只统计检测区域内的目标，整幅画面推理的结果也按检测区域筛选后比较
+    area = RegionOfInterest(polygons)
+    reference = None
+    if labels is not None:
+        reference = [label[area.contains(label, image.shape)] for label, image in zip(labels, images)]
+    results = {}
+    for name, region in modes.items():
+        latencies, outputs = run_detector(detector, images, repeats, region)
+        outputs = [output[area.contains(output, image.shape)] for output, image in zip(outputs, images)]
+        if reference is None:
+            reference = outputs
+        result = compare_to_reference(latencies, outputs, reference)
+        result['detections_per_frame'] = float(np.mean([len(output) for output in outputs]))
+        result['crops_per_frame'] = float(np.mean([len(region.windows(image.shape)) if region else 1
+                                                   for image in images]))
+        results[name] = result
+    return results
+
+
+# ---------------------------------------------------------------- 数据库
+
+def synthetic_boxes(totals, rng):
+    """为每条记录生成 total 个检测框和若干低置信度候选框，返回每条记录打包后的字节串"""
+    counts = np.asarray(totals) + rng.integers(0, 5, len(totals))
+    boxes = np.zeros(int(counts.sum()), dtype=BOX_DTYPE)
+    boxes['x2'] = rng.integers(20, 1920, len(boxes))
+    boxes['y2'] = rng.integers(20, 1080, len(boxes))
+    boxes['score'] = rng.uniform(DETECTION_STORE_CONF, 1.0, len(boxes))
+    boxes['class_id'] = rng.integers(0, 2, len(boxes))
+    data = boxes.tobytes()
+    ends = np.cumsum(counts) * BOX_DTYPE.itemsize
+    return [data[end - count * BOX_DTYPE.itemsize:end] for end, count in zip(ends, counts)]
+
+
+def populate_database(db, rows, sites=50, days=180, seed=0, boxes=False):
+    """批量生成合成的工地和检测记录，检测时间均匀分布在最近 days 天内
+
+    boxes 为True时同时为每条记录保存合成的检测框。
+    """
+    rng = random.Random(seed)
+    box_rng = np.random.default_rng(seed)
+    for i in range(sites):
+        db.add_site(f'测试工地{i:03d}', f'经理{i}', f'1380000{i:04d}')
+    site_ids = [site[0] for site in db.get_sites()]
+
+    now = datetime.now()
+    chunk = 50000
+    for start in range(0, rows, chunk):
+        batch = []
+        for _ in range(min(chunk, rows - start)):
+            total = rng.randint(1, 30)
+            with_helmet = rng.randint(0, total)
+            detection_time = now - timedelta(seconds=rng.uniform(0, days * 86400))
+            batch.append((rng.choice(site_ids), str(detection_time), total, with_helmet,
+                          total - with_helmet, ''))
+        if boxes:
+            blobs = synthetic_boxes([record[2] for record in batch], box_rng)
+            batch = [record + (blob,) for record, blob in zip(batch, blobs)]
+        db.add_detection_records(batch)
+
+
+def bench_db_insert(records=2000):
+    """add_detection_record 逐条写入与 RecordWriter 批量写入的速率"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        site_id = db.add_site('测试工地', '经理', '13800000000')
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(records):
+            latency, _ = timed(db.add_detection_record, site_id, 10, 8, 2, '')
+            latencies.append(latency)
+        elapsed = time.perf_counter() - start
+        result = latency_summary(latencies)
+        result['records_per_sec'] = records / elapsed
+
+        # 批量写入：记录数放大10倍，计时到全部落盘为止
+        writer = RecordWriter(db)
+        writer.start()
+        start = time.perf_counter()
+        for _ in range(records * 10):
+            writer.add(site_id, 10, 8, 2, '')
+        writer.close()
+        elapsed = time.perf_counter() - start
+        result['record_writer'] = {'records_per_sec': writer.written / elapsed, 'flushes': writer.flushes}
+        db.close()
+    return result
+
+
+def bench_db_query(row_counts, repeats=5):
+    """get_records_with_site_name 等查询在不同数据量下的耗时"""
+    today = datetime.now().date()
+    queries = {
+        # 界面默认的查询条件：当天、不限工地
+        'today': lambda db: db.get_records_with_site_name('', today, today),
+        'site_name_7_days': lambda db: db.get_records_with_site_name('工地00', today - timedelta(days=7), today),
+        'site_id_30_days': lambda db: db.get_records(1, today - timedelta(days=30), today),
+        'low_compliance_sites': lambda db: db.get_low_compliance_sites(0.8),
+        'site_statistics_30_days': lambda db: db.get_site_statistics(1, 30),
+    }
+    results = {}
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            populate_start = time.perf_counter()
+            populate_database(db, rows)
+            result = {'populate_sec': time.perf_counter() - populate_start}
+            for name, query in queries.items():
+                query(db)  # 预热页缓存
+                latencies = []
+                returned = 0
+                for _ in range(repeats):
+                    latency, records = timed(query, db)
+                    latencies.append(latency)
+                    returned = len(records)
+                result[name] = {**latency_summary(latencies), 'rows_returned': returned}
+            db.close()
+        results[f'{rows}_rows'] = result
+    return results
+
+
+def bench_db_concurrency(readers=4, writers=2, duration=5.0, rows=100000):
+    """多个线程同时查询和写入时的吞吐量与错误数
+
+    写线程中有一个使用独立的 Database 实例，模拟界面和检测服务两个进程同时写入。
+    """
+    today = datetime.now().date()
+    queries = [
+        lambda db: db.get_records_with_site_name('', today, today),
+        lambda db: db.get_records_with_site_name('工地00', today - timedelta(days=7), today),
+        lambda db: db.get_site_statistics(1, 30),
+        lambda db: db.get_low_compliance_sites(0.8),
+    ]
+    counts = {'reads': 0, 'writes': 0, 'locked_errors': 0, 'other_errors': 0}
+    counts_lock = threading.Lock()
+    stop = threading.Event()
+
+    def run(operation):
+        done = 0
+        while not stop.is_set():
+            try:
+                operation(done)
+                done += 1
+            except sqlite3.OperationalError as e:
+                key = 'locked_errors' if 'locked' in str(e) else 'other_errors'
+                with counts_lock:
+                    counts[key] += 1
+            except sqlite3.Error:
+                with counts_lock:
+                    counts['other_errors'] += 1
+        return done
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        populate_database(db, rows)
+        other_db = Database(db.db_path)
+        site_ids = [site[0] for site in db.get_sites()]
+
+        def reader(index):
+            def operation(done):
+                queries[(index + done) % len(queries)](db)
+            done = run(operation)
+            with counts_lock:
+                counts['reads'] += done
+
+        def writer(index):
+            target = other_db if index == 0 else db
+            def operation(done):
+                target.add_detection_record(site_ids[done % len(site_ids)], 10, 8, 2, '')
+            done = run(operation)
+            with counts_lock:
+                counts['writes'] += done
+
+        threads = ([threading.Thread(target=reader, args=(i,)) for i in range(readers)] +
+                   [threading.Thread(target=writer, args=(i,)) for i in range(writers)])
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        other_db.close()
+        db.close()
+
+    return {'reads_per_sec': counts['reads'] / elapsed, 'writes_per_sec': counts['writes'] / elapsed,
+            'locked_errors': counts['locked_errors'], 'other_errors': counts['other_errors']}
+
+
+def bench_export(rows=1000000, formats=('csv', 'parquet')):
+    """流式导出全部检测记录和按天汇总的速率"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        populate_database(db, rows)
+        for fmt in formats:
+            if fmt == 'parquet':
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    print('未安装 pyarrow，跳过 Parquet 导出测试')
+                    continue
+            path = os.path.join(tmp, f'export.{fmt}')
+            elapsed, exported = timed(export_records, db, path)
+            results[fmt] = {'ms': elapsed, 'rows_per_sec': exported / elapsed * 1000,
+                            'file_mb': os.path.getsize(path) / 1024 / 1024}
+            elapsed, exported = timed(export_records, db, path, rollup='daily')
+            results[f'{fmt}_daily_rollup'] = {'ms': elapsed, 'rows': exported}
+        db.close()
+    return results
+
+
+def bench_rescore(rows=1000000, thresholds=(0.1, 0.25, 0.5)):
+    """读取全部检测框并按不同阈值重新统计的耗时"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        populate_database(db, rows, boxes=True)
+        elapsed, archive = timed(BoxArchive.load, db)
+        results['load'] = {'ms': elapsed, 'records': len(archive), 'boxes': len(archive.boxes),
+                           'mb': archive.boxes.nbytes / 1024 / 1024}
+        for threshold in thresholds:
+            elapsed, _ = timed(archive.rescore, threshold)
+            results[f'rescore_{threshold}'] = {'ms': elapsed}
+        elapsed, _ = timed(archive.summarize, thresholds[0], [0, 1])
+        results['summarize_ms'] = elapsed
+        db.close()
+    return results
+
+
+# ---------------------------------------------------------------- 启动
+
+# 在子进程中创建主窗口并等待模型加载完成，输出 startup 记录的各阶段耗时
+STARTUP_SCRIPT = """
+import json, os, sys, time
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+import main
+from monitor import startup
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+QTimer.singleShot(0, lambda: startup.mark('window'))
+deadline = time.monotonic() + 300
+while window.detector is None and time.monotonic() < deadline:
+    app.processEvents()
+    time.sleep(0.01)
+startup.mark('model')
+if window.detector is not None:
+    import numpy as np
+    window.detector.detect_frame(np.zeros((480, 640, 3), dtype=np.uint8))
+    startup.mark('first_detection')
+window.images.close()
+print(json.dumps(startup.marks))
+"""
+
+
+def import_times(module):
+    """用 python -X importtime 统计导入 module 的总耗时及其各个直接依赖的耗时（毫秒，含间接依赖）"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            # 子模块先于上层模块输出，遇到顶层模块时之前收集的就是它的直接依赖
+            if name.strip() == module:
+                times[module] = int(cumulative_us) / 1000
+                break
+            times = {}
+        elif depth == 1:
+            times[name.strip()] = int(cumulative_us) / 1000
+    return times
+
+
+def bench_startup(runs=3):
+    """导入耗时、窗口显示、模型加载和首次检测距启动的耗时（秒）"""
+    results = {'import_ms': import_times('main')}
+    marks = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True,
+                                check=True).stdout
+        marks.append(json.loads(output.strip().splitlines()[-1]))
+    for name in ('window', 'model', 'first_detection'):
+        values = [m[name] for m in marks if name in m]
+        if values:
+            results[f'{name}_s'] = float(np.median(values))
+    return results
+
+
+# ---------------------------------------------------------------- 结果输出
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(data, prefix=''):
+    """把嵌套的结果展开为 {'a.b.c': 数值}，便于对比"""
+    items = {}
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            items.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)):
+            items[name] = value
+    return items
+
+
+def print_results(results):
+    for name, value in flatten(results).items():
+        print(f'{name:<60} {value:>14.3f}')
+
+
+def print_comparison(results, baseline):
+    """与基线结果对比，显示变化百分比"""
+    current = flatten(results)
+    previous = flatten(baseline['results'])
+    print(f"对比基线提交 {baseline.get('commit')} ({baseline.get('timestamp')})")
+    print(f"{'指标':<60} {'基线':>14} {'当前':>14} {'变化':>9}")
+    for name, value in current.items():
+        if name in previous:
+            old = previous[name]
+            change = f'{(value - old) / old * 100:+.1f}%' if old else ''
+            print(f'{name:<60} {old:>14.3f} {value:>14.3f} {change:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测与数据库性能基准测试')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    parser.add_argument('--compare', default=None, help='与之前保存的JSON结果对比')
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+    def add_image_args(sub):
+        sub.add_argument('--images', default=CAPTURE_DIR, help='测试图片目录')
+        sub.add_argument('--repeats', type=int, default=3, help='每张图片重复次数')
+
+    all_parser = subparsers.add_parser('all', help='运行检测耗时、吞吐量、写入和查询四项测试')
+    add_image_args(all_parser)
+    all_parser.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000], help='查询测试的数据量')
+
+    latency_parser = subparsers.add_parser('latency', help='detect_frame 单帧耗时')
+    add_image_args(latency_parser)
+
+    throughput_parser = subparsers.add_parser('throughput', help='不同批大小和分辨率下的吞吐量')
+    add_image_args(throughput_parser)
+    throughput_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8], help='批大小')
+    throughput_parser.add_argument('--sizes', type=int, nargs='+', default=[256, 416, 640], help='推理分辨率')
+
+    insert_parser = subparsers.add_parser('db-insert', help='检测记录写入速率')
+    insert_parser.add_argument('--records', type=int, default=2000, help='写入记录数')
+
+    query_parser = subparsers.add_parser('db-query', help='检测记录查询耗时')
+    query_parser.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000], help='数据量')
+
+    export_parser = subparsers.add_parser('export', help='流式导出检测记录的速率')
+    export_parser.add_argument('--rows', type=int, default=1000000, help='数据量')
+    export_parser.add_argument('--formats', nargs='+', default=['csv', 'parquet'], help='导出格式')
+
+    concurrency_parser = subparsers.add_parser('db-concurrency', help='多线程同时读写数据库')
+    concurrency_parser.add_argument('--readers', type=int, default=4, help='查询线程数')
+    concurrency_parser.add_argument('--writers', type=int, default=2, help='写入线程数')
+    concurrency_parser.add_argument('--duration', type=float, default=5.0, help='运行时长（秒）')
+    concurrency_parser.add_argument('--rows', type=int, default=100000, help='预先生成的记录数')
+
+    rescore_parser = subparsers.add_parser('rescore', help='读取已保存的检测框并按新阈值重新统计')
+    rescore_parser.add_argument('--rows', type=int, default=1000000, help='记录数')
+
+    startup_parser = subparsers.add_parser('startup', help='模块导入、窗口显示、模型加载和首次检测的耗时')
+    startup_parser.add_argument('--runs', type=int, default=3, help='启动次数，结果取中位数')
+
+    imgsz_parser = subparsers.add_parser('imgsz', help='比较不同推理分辨率的速度和准确度')
+    add_image_args(imgsz_parser)
+    imgsz_parser.add_argument('--sizes', type=int, nargs='+', default=[256, 416, 640], help='推理分辨率')
+    imgsz_parser.add_argument('--data', default=None, help='数据集配置文件，提供时额外计算mAP50')
+
+    roi_parser = subparsers.add_parser('roi', help='比较整幅画面、检测区域和分块推理的速度和召回率')
+    add_image_args(roi_parser)
+    roi_parser.add_argument('--polygon', type=int, nargs='+', action='append', default=None,
+                            help='检测区域的顶点像素坐标 x1 y1 x2 y2 ...，可重复指定多个区域')
+    roi_parser.add_argument('--tile-sizes', type=int, nargs='*', default=[640, 1280], help='分块边长（像素）')
+    roi_parser.add_argument('--labels', default=None, help='YOLO格式标注目录，提供时按标注计算召回率')
+
+    backend_parser = subparsers.add_parser('backends', help='比较不同推理后端的速度和准确度')
+    add_image_args(backend_parser)
+    backend_parser.add_argument('--backends', nargs='+', default=['ultralytics', 'onnxruntime'],
+                                help='后端名称或 名称:模型路径，第一个作为参考')
+
+    args = parser.parse_args()
+    results = {}
+    if args.scenario in ('all', 'latency'):
+        results['latency'] = bench_latency(load_images(args.images), args.repeats)
+    if args.scenario in ('all', 'throughput'):
+        batch_sizes = getattr(args, 'batch_sizes', [1, 4, 8])
+        sizes = getattr(args, 'sizes', [256, 416, 640])
+        results['throughput'] = bench_throughput(load_images(args.images), batch_sizes, sizes, args.repeats)
+    if args.scenario in ('all', 'db-insert'):
+        results['db_insert'] = bench_db_insert(getattr(args, 'records', 2000))
+    if args.scenario in ('all', 'db-query'):
+        results['db_query'] = bench_db_query(args.rows)
+    if args.scenario == 'export':
+        results['export'] = bench_export(args.rows, args.formats)
+    if args.scenario == 'db-concurrency':
+        results['db_concurrency'] = bench_db_concurrency(args.readers, args.writers, args.duration, args.rows)
+    if args.scenario == 'rescore':
+        results['rescore'] = bench_rescore(args.rows)
+    if args.scenario == 'startup':
+        results['startup'] = bench_startup(args.runs)
+    if args.scenario == 'imgsz':
+        results['imgsz'] = bench_imgsz(load_images(args.images), args.sizes, args.repeats, args.data)
+    if args.scenario == 'roi':
+        paths, images = load_images(args.images, with_paths=True)
+        polygons = [list(zip(p[::2], p[1::2])) for p in args.polygon] if args.polygon else None
+        labels = load_labels(args.labels, paths, images) if args.labels else None
+        results['roi'] = bench_roi(images, polygons, args.tile_sizes, args.repeats, labels)
+    if args.scenario == 'backends':
+        results['backends'] = bench_backends(load_images(args.images), args.backends, args.repeats)
+
+    print_results(results)
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'scenario': args.scenario,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
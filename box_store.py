@@ -0,0 +1,155 @@
+# box_store.py
+"""检测框的紧凑存储与按新阈值重新统计
+
+检测服务为每条检测记录保存全部候选检测框（数据库 detection_boxes 表），每个框打包为
+11 字节：int16 坐标、float16 置信度、uint8 类别。调整置信度阈值或类别映射后，
+用 BoxArchive 一次读入全部检测框，以 NumPy 向量化运算重新统计各记录的人数和佩戴率，
+不需要重新推理。
+置信度按 float16 保存（0.25附近精度约0.0002），实时检测和重新统计都用 above_threshold 把置信度和阈值
+取整到 float16 后再比较，按原阈值重新统计与实时检测筛选出的框相同。
+开启目标跟踪的视频源记录的是记录间隔内的唯一人数，保存的是每个计入的目标一个框
+（见 IoUTracker.window_detections），按原阈值重新统计得到相同的人数；这类记录没有保存
+低于 CONF_THRESHOLD 的候选框，调低阈值不会增加人数。
+
+用法:
+    python box_store.py --threshold 0.4 [--site 工地名称] [--start 2024-01-01] [--end 2024-03-31]
+    python box_store.py --threshold 0.3 --class-map 0 1 1
+"""
+import argparse
+
+import numpy as np
+from config import CONF_THRESHOLD, DB_PATH
+
+# 单个检测框的存储格式，坐标取整到像素
+BOX_DTYPE = np.dtype([('x1', '<i2'), ('y1', '<i2'), ('x2', '<i2'), ('y2', '<i2'),
+                      ('score', '<f2'), ('class_id', 'u1')])
+# 类别映射中的取值：戴安全帽、未戴安全帽、不计入人数
+WITH_HELMET = 0
+WITHOUT_HELMET = 1
+IGNORED = -1
+
+
+def above_threshold(scores, threshold):
+    """置信度是否高于阈值，两者都先取整到保存的精度，实时检测与重新统计的结果一致"""
+    score_type = BOX_DTYPE['score'].type
+    return np.asarray(scores).astype(score_type) > score_type(threshold)
+
+
+def pack_boxes(detections):
+    """(N, 6) 检测框数组 [x1, y1, x2, y2, score, class_id] 打包为字节串"""
+    boxes = np.empty(len(detections), dtype=BOX_DTYPE)
+    if len(detections):
+        coords = np.clip(np.rint(detections[:, :4]), -32768, 32767).astype(np.int16)
+        for i, name in enumerate(('x1', 'y1', 'x2', 'y2')):
+            boxes[name] = coords[:, i]
+        boxes['score'] = detections[:, 4]
+        boxes['class_id'] = detections[:, 5]
+    return boxes.tobytes()
+
+
+def unpack_boxes(blob):
+    """字节串还原为 (N, 6) float32 检测框数组"""
+    boxes = np.frombuffer(blob, dtype=BOX_DTYPE)
+    return np.stack([boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2'],
+                     boxes['score'], boxes['class_id']], axis=1).astype(np.float32)
+
+
+class BoxArchive:
+    """从数据库读入的检测框，所有记录的框连续存放在一个结构化数组中
+
+    record_ids/site_ids 每条记录一项；box_record 为每个框所属记录在 record_ids 中的下标。
+    """
+
+    def __init__(self, record_ids, site_ids, counts, boxes):
+        self.record_ids = record_ids
+        self.site_ids = site_ids
+        self.boxes = boxes
+        self.box_record = np.repeat(np.arange(len(record_ids)), counts)
+
+    @classmethod
+    def load(cls, db, site_name=None, start_date=None, end_date=None, chunk_size=20000):
+        """读取符合条件的记录的检测框，没有保存检测框的记录不包含在内"""
+        record_ids, site_ids, counts, blobs = [], [], [], []
+        for rows in db.iter_detection_boxes(site_name, start_date, end_date, chunk_size):
+            for record_id, site_id, blob in rows:
+                record_ids.append(record_id)
+                site_ids.append(site_id)
+                counts.append(len(blob) // BOX_DTYPE.itemsize)
+                blobs.append(blob)
+        # 拼接后一次转换，避免逐条记录创建数组
+        boxes = np.frombuffer(b''.join(blobs), dtype=BOX_DTYPE)
+        return cls(np.array(record_ids, dtype=np.int64), np.array(site_ids, dtype=np.int64),
+                   np.array(counts, dtype=np.int64), boxes)
+
+    def __len__(self):
+        return len(self.record_ids)
+
+    def rescore(self, threshold=CONF_THRESHOLD, class_map=None):
+        """按新的置信度阈值和类别映射重新统计每条记录的人数
+
+        class_map 为按类别ID索引的序列，取值 WITH_HELMET / WITHOUT_HELMET / IGNORED；
+        默认与 HelmetDetector 相同：类别0为戴安全帽，其余类别为未戴安全帽。
+        返回 (total, with_helmet, without_helmet) 三个数组，与 record_ids 一一对应。
+        """
+        keep = above_threshold(self.boxes['score'], threshold)
+        class_ids = self.boxes['class_id']
+        if class_map is None:
+            status = np.where(class_ids == 0, WITH_HELMET, WITHOUT_HELMET)
+        else:
+            # 映射表之外的类别不计入人数
+            lookup = np.full(256, IGNORED, dtype=np.int8)
+            lookup[:len(class_map)] = class_map
+            status = lookup[class_ids]
+        records = self.box_record
+        n = len(self.record_ids)
+        with_helmet = np.bincount(records[keep & (status == WITH_HELMET)], minlength=n)
+        without_helmet = np.bincount(records[keep & (status == WITHOUT_HELMET)], minlength=n)
+        return with_helmet + without_helmet, with_helmet, without_helmet
+
+    def summarize(self, threshold=CONF_THRESHOLD, class_map=None):
+        """按工地汇总重新统计的结果
+
+        返回 {工地ID: (记录数, 总人数, 戴帽人数, 未戴帽人数, 平均佩戴率)}，
+        平均佩戴率与统计表相同，为有人的记录各自佩戴率的平均值。
+        """
+        total, with_helmet, without_helmet = self.rescore(threshold, class_map)
+        sites, site_index = np.unique(self.site_ids, return_inverse=True)
+        n = len(sites)
+        has_people = total > 0
+        ratio = np.divide(with_helmet, total, out=np.zeros(len(total)), where=has_people)
+        record_count = np.bincount(site_index, minlength=n)
+        sums = [np.bincount(site_index, weights=values, minlength=n)
+                for values in (total, with_helmet, without_helmet, ratio)]
+        ratio_count = np.bincount(site_index[has_people], minlength=n)
+        avg_ratio = np.divide(sums[3], ratio_count, out=np.zeros(n), where=ratio_count > 0)
+        return {int(site): (int(record_count[i]), int(sums[0][i]), int(sums[1][i]), int(sums[2][i]),
+                            float(avg_ratio[i]))
+                for i, site in enumerate(sites)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按新的阈值和类别映射重新统计已保存的检测框')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    parser.add_argument('--threshold', type=float, default=CONF_THRESHOLD, help='置信度阈值')
+    parser.add_argument('--class-map', type=int, nargs='+', default=None,
+                        help='按类别ID依次给出 0=戴安全帽 1=未戴安全帽 -1=不计入')
+    parser.add_argument('--site', default=None, help='工地名称（模糊匹配）')
+    parser.add_argument('--start', default=None, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='结束日期 YYYY-MM-DD（包含当天）')
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database(args.db)
+    archive = BoxArchive.load(db, args.site, args.start, args.end)
+    site_names = {site[0]: site[1] for site in db.get_sites()}
+    db.close()
+
+    print(f"共 {len(archive)} 条记录、{len(archive.boxes)} 个检测框，阈值 {args.threshold}")
+    for site_id, (records, total, with_helmet, without_helmet, avg_ratio) in \
+            archive.summarize(args.threshold, args.class_map).items():
+        print(f"{site_names.get(site_id, site_id)}: 记录 {records}，总人数 {total}，"
+              f"戴帽 {with_helmet}，未戴帽 {without_helmet}，平均佩戴率 {avg_ratio:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,109 @@
 # config.py
-import os
 
 # 使用SQLite数据库
 DB_PATH = 'helmet_detection.db'
+# WAL模式下 synchronous=NORMAL 只在检查点时同步磁盘，断电最多丢失最近提交的事务
+DB_SYNCHRONOUS = 'NORMAL'
+# 数据库被其他连接锁定时的最长等待时间（秒）
+DB_BUSY_TIMEOUT = 30
+# 查询使用的只读连接池大小
+DB_READ_POOL_SIZE = 4
+# 后台批量写入检测记录：缓冲达到条数或距上次写入达到间隔（秒）时提交一次
+RECORD_BATCH_SIZE = 500
+RECORD_FLUSH_INTERVAL = 1.0
+# 界面记录表格每次从数据库加载的行数
+RECORD_PAGE_SIZE = 200
 
 # 使用训练好的自定义模型
 YOLO_MODEL = 'exp12/weights/best.pt'
 
+# 推理后端：'ultralytics'（PyTorch加载.pt模型）、'onnxruntime' 或 'openvino'
+# （后两者运行 export_model.py 导出的ONNX模型，不需要PyTorch）
+DETECTOR_BACKEND = 'ultralytics'
+ONNX_MODEL = 'exp12/weights/best.onnx'
+
+# 检测框置信度阈值
+CONF_THRESHOLD = 0.25
+# 非极大值抑制的IoU阈值和每张图最多保留的检测框数
+NMS_IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+# 检测服务为每条检测记录保存全部检测框（见 box_store.py），之后调整阈值或类别映射时
+# 不必重新推理；保存置信度不低于 DETECTION_STORE_CONF 的候选框，阈值最低可以调到该值
+STORE_DETECTIONS = True
+DETECTION_STORE_CONF = 0.1
+
+# 检测结果缓存（见 result_cache.py）：内容相同的图像直接复用上一次的推理结果，
+# 更换模型文件或修改阈值后缓存自动失效。实时视频几乎没有完全相同的帧，每帧计算哈希
+# （1080p约5ms）只会增加耗时，因此界面的视频检测和检测服务默认不开启；界面打开单张图片
+# 和批量检测图片目录（batch.py）总是开启
+RESULT_CACHE = False
+RESULT_CACHE_MB = 32
+# 感知哈希（256位）的汉明距离不超过该值时视为近似重复的画面并复用结果，None表示只匹配完全相同的图像
+RESULT_CACHE_NEAR_DISTANCE = None
+# 磁盘缓存文件（SQLite）及最多保存的条数，None表示只缓存在内存中
+RESULT_CACHE_PATH = None
+RESULT_CACHE_DISK_ENTRIES = 100000
+
+# 模型推理分辨率（模型训练时为256，见训练.py），图像由模型内部缩放，不改变显示和保存的图像
+INFER_IMGSZ = 640
+
+# 检测区域与分块推理（见 roi.py，在检测服务的视频源配置中按摄像头设置）：相邻分块重叠的比例，
+# 以及合并各分块结果时交集占较小框面积超过该比例的同类框视为同一目标
+ROI_TILE_OVERLAP = 0.2
+ROI_MERGE_THRESHOLD = 0.6
+
+# 批量检测时单次送入模型的最大帧数
+DETECT_BATCH_SIZE = 8
+
+# 视频流水线各级队列长度，队列满时丢弃最旧的帧
+PIPELINE_QUEUE_SIZE = 2
+
+# 运动门控推理：画面静止时跳过推理并复用上一次的检测结果
+MOTION_GATING = False
+# 每N帧才考虑推理一次（1表示每帧）
+INFERENCE_STRIDE = 1
+# 缩略图中灰度变化超过 MOTION_PIXEL_THRESHOLD 的像素比例达到该值才推理
+MOTION_THRESHOLD = 0.01
+MOTION_PIXEL_THRESHOLD = 25
+# 连续跳过的帧数超过该值时强制推理一次，0表示不强制
+MOTION_MAX_SKIP = 150
+
+# 目标跟踪：为检测框分配跨帧ID，按时间窗口统计唯一人数
+TRACKING = False
+# 检测框与跟踪目标匹配的最小IoU
+TRACK_IOU_THRESHOLD = 0.3
+# 连续多少次检测未匹配到后删除跟踪目标
+TRACK_MAX_AGE = 5
+# 目标至少被检测到多少次才计入唯一人数
+TRACK_MIN_HITS = 2
+
+# 日志级别与日志文件（None表示只输出到控制台）
+LOG_LEVEL = 'INFO'
+LOG_FILE = None
+# 是否输出每帧每个检测框的详细信息（DEBUG级别）
+LOG_VERBOSE_DETECTIONS = False
+# 同一条日志每个时间窗口（秒）内最多输出的次数，0表示不限制
+LOG_RATE_LIMIT = 10
+LOG_RATE_WINDOW = 60
+# 检测指标汇总的输出间隔（秒），0表示不输出
+LOG_METRICS_INTERVAL = 60
+
+# 无界面检测服务：推理工作线程数，以及每路视频源写入检测记录的最小间隔（秒）
+SERVICE_WORKERS = 2
+SERVICE_RECORD_INTERVAL = 60
+
 # 图片保存路径
 CAPTURE_DIR = 'captured_images'
-if not os.path.exists(CAPTURE_DIR):
-    os.makedirs(CAPTURE_DIR)
\ No newline at end of file
+# 截图的JPEG质量和最大边长（像素，0表示保持原尺寸）
+IMAGE_JPEG_QUALITY = 90
+IMAGE_MAX_DIMENSION = 1920
+# 缩略图最大边长（像素），以及界面中缓存已解码图片的内存上限（MB）
+THUMBNAIL_SIZE = 160
+THUMBNAIL_CACHE_MB = 64
+# 后台写入队列长度，队列满时保存截图会等待
+IMAGE_QUEUE_SIZE = 32
+# 截图保存天数和磁盘配额（MB），0表示不限（默认不自动删除任何截图，请按磁盘大小设置）；
+# 设置后界面和检测服务启动 IMAGE_CLEANUP_INTERVAL 秒后第一次清理，之后每隔该间隔清理一次
+IMAGE_RETENTION_DAYS = 0
+IMAGE_QUOTA_MB = 0
+IMAGE_CLEANUP_INTERVAL = 3600
\ No newline at end of file
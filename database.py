@@ -1,20 +1,198 @@
 # database.py
+import argparse
+import atexit
+import queue
 import sqlite3
-from datetime import datetime
-from config import DB_PATH
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from config import (DB_PATH, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT, DB_READ_POOL_SIZE, RECORD_BATCH_SIZE,
+                    RECORD_FLUSH_INTERVAL)
+from monitor import get_logger
+
+logger = get_logger('database')
+
+# 当前数据库结构版本，保存在 PRAGMA user_version 中
+SCHEMA_VERSION = 3
+
+# 工地名称子串搜索使用的trigram全文索引至少需要3个字符
+FTS_MIN_QUERY_LENGTH = 3
+
+
+# 按工地汇总的佩戴率统计表：表名 -> (时间粒度列, 由检测时间计算该列的SQL表达式)
+ROLLUP_TABLES = {
+    'compliance_hourly': ('hour', "strftime('%Y-%m-%d %H:00:00', {time})"),
+    'compliance_daily': ('day', "date({time})"),
+}
+
+# 单条记录的佩戴率，人数为0时为NULL；汇总表保存其总和与非NULL个数，以保持与AVG相同的结果
+RATIO_SQL = "CAST({row}with_helmet AS FLOAT) / CAST({row}total_people AS FLOAT)"
+
+
+def _rollup_trigger_sql(table, column, bucket):
+    """生成随检测记录增删改同步更新汇总表的触发器"""
+    def add(row):
+        ratio = RATIO_SQL.format(row=f'{row}.')
+        return f"""
+            INSERT INTO {table} (site_id, {column}, record_count, sum_total, sum_with, sum_without,
+                                 sum_ratio, ratio_count)
+            VALUES ({row}.site_id, {bucket.format(time=f'{row}.detection_time')}, 1,
+                    coalesce({row}.total_people, 0), coalesce({row}.with_helmet, 0),
+                    coalesce({row}.without_helmet, 0), coalesce({ratio}, 0), ({ratio}) IS NOT NULL)
+            ON CONFLICT (site_id, {column}) DO UPDATE SET
+                record_count = record_count + 1,
+                sum_total = sum_total + excluded.sum_total,
+                sum_with = sum_with + excluded.sum_with,
+                sum_without = sum_without + excluded.sum_without,
+                sum_ratio = sum_ratio + excluded.sum_ratio,
+                ratio_count = ratio_count + excluded.ratio_count;
+        """
+
+    def subtract(row):
+        ratio = RATIO_SQL.format(row=f'{row}.')
+        key = f"site_id = {row}.site_id AND {column} = {bucket.format(time=f'{row}.detection_time')}"
+        return f"""
+            UPDATE {table} SET
+                record_count = record_count - 1,
+                sum_total = sum_total - coalesce({row}.total_people, 0),
+                sum_with = sum_with - coalesce({row}.with_helmet, 0),
+                sum_without = sum_without - coalesce({row}.without_helmet, 0),
+                sum_ratio = sum_ratio - coalesce({ratio}, 0),
+                ratio_count = ratio_count - (({ratio}) IS NOT NULL)
+            WHERE {key};
+            DELETE FROM {table} WHERE {key} AND record_count <= 0;
+        """
+
+    # 没有工地或检测时间的记录不参与统计
+    valid_new = "new.site_id IS NOT NULL AND new.detection_time IS NOT NULL"
+    valid_old = "old.site_id IS NOT NULL AND old.detection_time IS NOT NULL"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON detection_records
+            WHEN {valid_new} BEGIN {add('new')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON detection_records
+            WHEN {valid_old} BEGIN {subtract('old')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_update_old
+            AFTER UPDATE OF site_id, detection_time, total_people, with_helmet, without_helmet
+            ON detection_records WHEN {valid_old} BEGIN {subtract('old')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_update_new
+            AFTER UPDATE OF site_id, detection_time, total_people, with_helmet, without_helmet
+            ON detection_records WHEN {valid_new} BEGIN {add('new')} END""",
+    ]
+
+
+def _rollup_select_sql(column, bucket):
+    """由原始记录直接计算汇总表内容的查询"""
+    ratio = RATIO_SQL.format(row='')
+    return f"""
+        SELECT site_id, {bucket.format(time='detection_time')} AS {column}, COUNT(*),
+               coalesce(SUM(total_people), 0), coalesce(SUM(with_helmet), 0),
+               coalesce(SUM(without_helmet), 0), TOTAL({ratio}), COUNT({ratio})
+        FROM detection_records
+        WHERE site_id IS NOT NULL AND detection_time IS NOT NULL
+        GROUP BY site_id, {column}
+    """
+
+
+def _day_start(value):
+    """日期（date对象或'YYYY-MM-DD'字符串）转为当天零点的时间字符串，用于范围比较"""
+    return date.fromisoformat(str(value)[:10]).isoformat()
+
+
+def _next_day_start(value):
+    return (date.fromisoformat(str(value)[:10]) + timedelta(days=1)).isoformat()
 
 
 class Database:
-    def __init__(self):
+    """检测系统数据库
+
+    所有写操作通过唯一的写连接串行执行（transaction()），查询从只读连接池中
+    借用连接（reader()），每次调用使用独立的游标，可以在多个线程间共享同一个实例。
+    """
+
+    def __init__(self, db_path=DB_PATH, readers=DB_READ_POOL_SIZE):
         """初始化数据库连接"""
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        # WAL模式下读操作不会阻塞写入，写入也不会阻塞读操作
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        self._write_lock = threading.RLock()
+
+        # 内存数据库无法被其他连接打开，读操作也走写连接
+        self._shared_reads = db_path == ':memory:' or db_path.startswith('file::memory:')
+        self._read_pool = queue.LifoQueue()
+        self._read_conns = []
+        self._max_readers = max(1, readers)
+        self._pool_lock = threading.Lock()
         self.create_tables()
 
+    def _open_reader(self):
+        uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        self._read_conns.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """在写连接上开启事务，正常退出时提交，出现异常时回滚
+
+        同一线程内嵌套调用时并入最外层的事务。
+        """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            if self.conn.in_transaction:
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+            try:
+                # 立即获取写锁，避免事务中途因锁升级失败
+                cursor.execute("BEGIN IMMEDIATE")
+                yield cursor
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def reader(self):
+        """从只读连接池借用一个连接，返回其游标；连接池用完时等待其他线程归还"""
+        if self._shared_reads:
+            with self._write_lock:
+                cursor = self.conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            return
+
+        conn = None
+        with self._pool_lock:
+            if self._read_pool.empty() and len(self._read_conns) < self._max_readers:
+                conn = self._open_reader()
+        if conn is None:
+            conn = self._read_pool.get()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            self._read_pool.put(conn)
+
     def create_tables(self):
         """创建数据库表"""
+        with self.transaction() as cursor:
+            self._create_tables(cursor)
+            self.migrate(cursor)
+        self.has_site_fts = self._fetchone("SELECT 1 FROM sqlite_master WHERE name = 'site_name_fts'") is not None
+
+    def _create_tables(self, cursor):
         # 创建工地信息表
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS construction_sites (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 site_name TEXT NOT NULL,
@@ -24,7 +202,7 @@ class Database:
         ''')
 
         # 创建检测记录表
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS detection_records (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 site_id INTEGER,
@@ -36,14 +214,153 @@ class Database:
                 FOREIGN KEY (site_id) REFERENCES construction_sites(id)
             )
         ''')
-        self.conn.commit()
+
+    def migrate(self, cursor):
+        """按 user_version 升级已有数据库的索引等结构"""
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # 按工地+时间、按时间查询记录的索引
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_records_site_time
+                ON detection_records (site_id, detection_time)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_records_time
+                ON detection_records (detection_time)
+            ''')
+            # 工地名称子串搜索的trigram全文索引（需要SQLite 3.34以上），由触发器与工地表保持同步
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS site_name_fts USING fts5(
+                        site_name, content='construction_sites', content_rowid='id', tokenize='trigram'
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS construction_sites_fts_insert
+                    AFTER INSERT ON construction_sites BEGIN
+                        INSERT INTO site_name_fts (rowid, site_name) VALUES (new.id, new.site_name);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS construction_sites_fts_delete
+                    AFTER DELETE ON construction_sites BEGIN
+                        INSERT INTO site_name_fts (site_name_fts, rowid, site_name)
+                        VALUES ('delete', old.id, old.site_name);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS construction_sites_fts_update
+                    AFTER UPDATE OF site_name ON construction_sites BEGIN
+                        INSERT INTO site_name_fts (site_name_fts, rowid, site_name)
+                        VALUES ('delete', old.id, old.site_name);
+                        INSERT INTO site_name_fts (rowid, site_name) VALUES (new.id, new.site_name);
+                    END
+                ''')
+                cursor.execute("INSERT INTO site_name_fts (site_name_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError:
+                # SQLite版本过低时退回到LIKE查询
+                pass
+
+        if version < 2:
+            # 按工地、按小时/天的佩戴率汇总表，由触发器随检测记录增量更新
+            for table, (column, bucket) in ROLLUP_TABLES.items():
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        site_id INTEGER NOT NULL,
+                        {column} TEXT NOT NULL,
+                        record_count INTEGER NOT NULL,
+                        sum_total INTEGER NOT NULL,
+                        sum_with INTEGER NOT NULL,
+                        sum_without INTEGER NOT NULL,
+                        sum_ratio REAL NOT NULL,
+                        ratio_count INTEGER NOT NULL,
+                        PRIMARY KEY (site_id, {column})
+                    ) WITHOUT ROWID
+                ''')
+                for trigger in _rollup_trigger_sql(table, column, bucket):
+                    cursor.execute(trigger)
+            self._rebuild_rollups(cursor)
+
+        if version < 3:
+            # 每条检测记录的全部检测框，按 box_store.BOX_DTYPE 紧凑打包为一个BLOB
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS detection_boxes (
+                    record_id INTEGER PRIMARY KEY,
+                    boxes BLOB NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS detection_records_boxes_delete
+                AFTER DELETE ON detection_records BEGIN
+                    DELETE FROM detection_boxes WHERE record_id = old.id;
+                END
+            ''')
+
+        if version < SCHEMA_VERSION:
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _rebuild_rollups(self, cursor):
+        for table, (column, bucket) in ROLLUP_TABLES.items():
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"""
+                INSERT INTO {table} (site_id, {column}, record_count, sum_total, sum_with, sum_without,
+                                     sum_ratio, ratio_count)
+                {_rollup_select_sql(column, bucket)}
+            """)
+
+    def rebuild_rollups(self):
+        """由原始检测记录重新生成汇总表"""
+        with self.transaction() as cursor:
+            self._rebuild_rollups(cursor)
+
+    def verify_rollups(self, tolerance=1e-6):
+        """比较汇总表与由原始记录直接计算的结果，返回不一致的 (表名, 工地ID, 时间, 汇总值, 原始值) 列表"""
+        mismatches = []
+        with self.reader() as cursor:
+            for table, (column, bucket) in ROLLUP_TABLES.items():
+                cursor.execute(f"""
+                    SELECT site_id, {column}, record_count, sum_total, sum_with, sum_without,
+                           sum_ratio, ratio_count
+                    FROM {table}
+                """)
+                stored = {row[:2]: row[2:] for row in cursor.fetchall()}
+                cursor.execute(_rollup_select_sql(column, bucket))
+                expected = {row[:2]: row[2:] for row in cursor.fetchall()}
+                for key in stored.keys() | expected.keys():
+                    got, want = stored.get(key), expected.get(key)
+                    if got is None or want is None or got[:4] != want[:4] or got[5] != want[5] \
+                            or abs(got[4] - want[4]) > tolerance:
+                        mismatches.append((table, *key, got, want))
+        return mismatches
+
+    def schema_version(self):
+        return self._fetchone("PRAGMA user_version")[0]
+
+    def _fetchall(self, sql, params=()):
+        with self.reader() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _fetchone(self, sql, params=()):
+        with self.reader() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def _site_name_filter(self, site_name):
+        """工地名称模糊查询条件，优先使用trigram全文索引"""
+        if self.has_site_fts and len(site_name) >= FTS_MIN_QUERY_LENGTH:
+            escaped = site_name.replace('"', '""')
+            return (" AND cs.id IN (SELECT rowid FROM site_name_fts WHERE site_name_fts MATCH ?)",
+                    f'"{escaped}"')
+        return " AND cs.site_name LIKE ?", f'%{site_name}%'
 
     def add_site(self, site_name, manager_name, manager_phone):
         """添加新工地"""
         sql = "INSERT INTO construction_sites (site_name, manager_name, manager_phone) VALUES (?, ?, ?)"
-        self.cursor.execute(sql, (site_name, manager_name, manager_phone))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        with self.transaction() as cursor:
+            cursor.execute(sql, (site_name, manager_name, manager_phone))
+            return cursor.lastrowid
 
     def update_site(self, site_id, site_name, manager_name, manager_phone):
         """更新工地信息"""
@@ -52,49 +369,71 @@ class Database:
             SET site_name = ?, manager_name = ?, manager_phone = ?
             WHERE id = ?
         """
-        self.cursor.execute(sql, (site_name, manager_name, manager_phone, site_id))
-        self.conn.commit()
+        with self.transaction() as cursor:
+            cursor.execute(sql, (site_name, manager_name, manager_phone, site_id))
 
     def delete_site(self, site_id):
         """删除工地信息"""
-        # 首先删除相关的检测记录
-        self.cursor.execute("DELETE FROM detection_records WHERE site_id = ?", (site_id,))
-        # 然后删除工地信息
-        self.cursor.execute("DELETE FROM construction_sites WHERE id = ?", (site_id,))
-        self.conn.commit()
+        with self.transaction() as cursor:
+            # 首先删除相关的检测记录
+            cursor.execute("DELETE FROM detection_records WHERE site_id = ?", (site_id,))
+            # 然后删除工地信息
+            cursor.execute("DELETE FROM construction_sites WHERE id = ?", (site_id,))
 
     def get_sites(self):
         """获取所有工地信息"""
-        self.cursor.execute("SELECT * FROM construction_sites ORDER BY site_name")
-        return self.cursor.fetchall()
+        return self._fetchall("SELECT * FROM construction_sites ORDER BY site_name")
 
     def get_site_by_id(self, site_id):
         """根据ID获取工地信息"""
-        self.cursor.execute("SELECT * FROM construction_sites WHERE id = ?", (site_id,))
-        return self.cursor.fetchone()
+        return self._fetchone("SELECT * FROM construction_sites WHERE id = ?", (site_id,))
 
     def get_site_by_name(self, site_name):
         """根据名称获取工地信息"""
-        self.cursor.execute("SELECT * FROM construction_sites WHERE site_name = ?", (site_name,))
-        return self.cursor.fetchone()
+        return self._fetchone("SELECT * FROM construction_sites WHERE site_name = ?", (site_name,))
 
-    def add_detection_record(self, site_id, total_people, with_helmet, without_helmet, image_path):
-        """添加检测记录"""
+    def add_detection_record(self, site_id, total_people, with_helmet, without_helmet, image_path,
+                             detection_time=None, boxes=None):
+        """添加检测记录，detection_time为None时使用当前时间，boxes 为 box_store.pack_boxes 打包的检测框"""
         sql = """
             INSERT INTO detection_records 
             (site_id, detection_time, total_people, with_helmet, without_helmet, image_path)
             VALUES (?, ?, ?, ?, ?, ?)
         """
-        self.cursor.execute(sql, (
-            site_id,
-            datetime.now(),
-            total_people,
-            with_helmet,
-            without_helmet,
-            image_path
-        ))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        with self.transaction() as cursor:
+            cursor.execute(sql, (
+                site_id,
+                detection_time or datetime.now(),
+                total_people,
+                with_helmet,
+                without_helmet,
+                image_path
+            ))
+            record_id = cursor.lastrowid
+            if boxes is not None:
+                cursor.execute("INSERT INTO detection_boxes (record_id, boxes) VALUES (?, ?)", (record_id, boxes))
+            return record_id
+
+    def add_detection_records(self, records):
+        """在一个事务中批量添加检测记录
+
+        records 为 (site_id, detection_time, total_people, with_helmet, without_helmet, image_path) 元组列表，
+        元组末尾可以再加上 box_store.pack_boxes 打包的检测框（None表示不保存）
+        """
+        sql = """
+            INSERT INTO detection_records
+            (site_id, detection_time, total_people, with_helmet, without_helmet, image_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        boxes = [(i, record[6]) for i, record in enumerate(records) if len(record) > 6 and record[6] is not None]
+        with self.transaction() as cursor:
+            cursor.executemany(sql, (record[:6] for record in records))
+            if boxes:
+                # 写事务中自增ID连续分配，由最后插入的ID推算每条记录的ID
+                first_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0] - len(records) + 1
+                cursor.executemany("INSERT INTO detection_boxes (record_id, boxes) VALUES (?, ?)",
+                                   ((first_id + i, blob) for i, blob in boxes))
+        return len(records)
 
     def update_record(self, record_id, site_id, total_people, with_helmet, without_helmet):
         """更新检测记录"""
@@ -103,22 +442,32 @@ class Database:
             SET site_id = ?, total_people = ?, with_helmet = ?, without_helmet = ?
             WHERE id = ?
         """
-        self.cursor.execute(sql, (site_id, total_people, with_helmet, without_helmet, record_id))
-        self.conn.commit()
+        with self.transaction() as cursor:
+            cursor.execute(sql, (site_id, total_people, with_helmet, without_helmet, record_id))
 
     def delete_record(self, record_id):
         """删除检测记录"""
-        # 获取图片路径用于删除文件
-        self.cursor.execute("SELECT image_path FROM detection_records WHERE id = ?", (record_id,))
-        result = self.cursor.fetchone()
-        image_path = result[0] if result else None
+        with self.transaction() as cursor:
+            # 获取图片路径用于删除文件
+            cursor.execute("SELECT image_path FROM detection_records WHERE id = ?", (record_id,))
+            result = cursor.fetchone()
+            image_path = result[0] if result else None
 
-        # 删除记录
-        self.cursor.execute("DELETE FROM detection_records WHERE id = ?", (record_id,))
-        self.conn.commit()
+            # 删除记录
+            cursor.execute("DELETE FROM detection_records WHERE id = ?", (record_id,))
 
         return image_path
 
+    def clear_image_paths(self, paths, chunk_size=500):
+        """截图文件被删除后清空引用它们的记录的 image_path"""
+        paths = list(paths)
+        with self.transaction() as cursor:
+            for start in range(0, len(paths), chunk_size):
+                chunk = paths[start:start + chunk_size]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f"UPDATE detection_records SET image_path = '' WHERE image_path IN ({placeholders})",
+                               chunk)
+
     def get_records(self, site_id=None, start_date=None, end_date=None):
         """获取检测记录"""
         sql = "SELECT * FROM detection_records WHERE 1=1"
@@ -127,92 +476,355 @@ class Database:
         if site_id:
             sql += " AND site_id = ?"
             params.append(site_id)
+        # 日期条件改写为对原始时间的范围比较，以便使用索引
         if start_date:
-            sql += " AND date(detection_time) >= ?"
-            params.append(str(start_date))
+            sql += " AND detection_time >= ?"
+            params.append(_day_start(start_date))
         if end_date:
-            sql += " AND date(detection_time) <= ?"
-            params.append(str(end_date))
+            sql += " AND detection_time < ?"
+            params.append(_next_day_start(end_date))
 
         sql += " ORDER BY detection_time DESC"
 
-        self.cursor.execute(sql, params)
-        return self.cursor.fetchall()
+        return self._fetchall(sql, params)
 
-    def get_records_with_site_name(self, site_name=None, start_date=None, end_date=None):
-        """支持按工地名称模糊查询的记录获取方法"""
-        sql = """
-            SELECT 
-                dr.id,
-                dr.site_id,
-                dr.detection_time,
-                dr.total_people,
-                dr.with_helmet,
-                dr.without_helmet,
-                dr.image_path,
-                cs.site_name,
-                cs.manager_name,
-                cs.manager_phone
+    # 记录列表查询的列，与 get_records_with_site_name 的返回值一致
+    RECORD_COLUMNS = """
+        dr.id,
+        dr.site_id,
+        dr.detection_time,
+        dr.total_people,
+        dr.with_helmet,
+        dr.without_helmet,
+        dr.image_path,
+        cs.site_name,
+        cs.manager_name,
+        cs.manager_phone
+    """
+
+    def _records_filter(self, site_name=None, start_date=None, end_date=None, join=''):
+        """按工地名称和日期筛选记录的 WHERE 条件及参数，join 为额外连接的表"""
+        sql = f"""
             FROM detection_records dr
             JOIN construction_sites cs ON dr.site_id = cs.id
+            {join}
             WHERE 1=1
         """
         params = []
 
         if site_name:
-            sql += " AND cs.site_name LIKE ?"
-            params.append(f'%{site_name}%')
+            clause, param = self._site_name_filter(site_name)
+            sql += clause
+            params.append(param)
+        # 日期条件改写为对原始时间的范围比较，以便使用索引
         if start_date:
-            sql += " AND date(dr.detection_time) >= ?"
-            params.append(str(start_date))
+            sql += " AND dr.detection_time >= ?"
+            params.append(_day_start(start_date))
         if end_date:
-            sql += " AND date(dr.detection_time) <= ?"
-            params.append(str(end_date))
+            sql += " AND dr.detection_time < ?"
+            params.append(_next_day_start(end_date))
+        return sql, params
+
+    def get_records_with_site_name(self, site_name=None, start_date=None, end_date=None):
+        """支持按工地名称模糊查询的记录获取方法"""
+        where, params = self._records_filter(site_name, start_date, end_date)
+        sql = f"SELECT {self.RECORD_COLUMNS} {where} ORDER BY dr.detection_time DESC"
+        return self._fetchall(sql, params)
+
+    def get_records_page(self, site_name=None, start_date=None, end_date=None, after=None, limit=200):
+        """按检测时间倒序分页获取记录
+
+        after 为上一页最后一条记录的 (detection_time, id)，按它定位下一页（键集分页），
+        翻到任意深度的耗时都与第一页相同。
+        """
+        where, params = self._records_filter(site_name, start_date, end_date)
+        if after is not None:
+            where += " AND (dr.detection_time, dr.id) < (?, ?)"
+            params.extend(after)
+        sql = (f"SELECT {self.RECORD_COLUMNS} {where} "
+               f"ORDER BY dr.detection_time DESC, dr.id DESC LIMIT ?")
+        params.append(limit)
+        return self._fetchall(sql, params)
+
+    def count_records(self, site_name=None, start_date=None, end_date=None):
+        """符合筛选条件的记录数"""
+        where, params = self._records_filter(site_name, start_date, end_date)
+        return self._fetchone(f"SELECT COUNT(*) {where}", params)[0]
 
-        sql += " ORDER BY dr.detection_time DESC"
+    def iter_records(self, site_name=None, start_date=None, end_date=None, chunk_size=5000):
+        """按检测时间顺序逐块读取符合条件的记录，每次产出不超过 chunk_size 条的列表"""
+        where, params = self._records_filter(site_name, start_date, end_date)
+        sql = f"SELECT {self.RECORD_COLUMNS} {where} ORDER BY dr.detection_time, dr.id"
+        with self.reader() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
 
-        self.cursor.execute(sql, params)
-        return self.cursor.fetchall()
+    def iter_detection_boxes(self, site_name=None, start_date=None, end_date=None, chunk_size=5000):
+        """逐块读取符合条件且保存了检测框的记录，每行为 (记录ID, 工地ID, 打包的检测框)"""
+        where, params = self._records_filter(site_name, start_date, end_date,
+                                             join='JOIN detection_boxes b ON b.record_id = dr.id')
+        sql = f"SELECT dr.id, dr.site_id, b.boxes {where} ORDER BY dr.id"
+        with self.reader() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    def iter_rollups(self, granularity='daily', site_name=None, start_date=None, end_date=None,
+                     chunk_size=5000):
+        """逐块读取按小时或按天的佩戴率汇总
+
+        每行为 (工地名称, 时间, 记录数, 总人数, 戴帽人数, 未戴帽人数, 平均佩戴率)
+        """
+        table = f'compliance_{granularity}'
+        if table not in ROLLUP_TABLES:
+            raise ValueError(f"未知的汇总粒度: {granularity}，可选: hourly, daily")
+        column = ROLLUP_TABLES[table][0]
+        sql = f"""
+            SELECT cs.site_name, r.{column}, r.record_count, r.sum_total, r.sum_with, r.sum_without,
+                   r.sum_ratio / r.ratio_count
+            FROM {table} r
+            JOIN construction_sites cs ON r.site_id = cs.id
+            WHERE 1=1
+        """
+        params = []
+        if site_name:
+            clause, param = self._site_name_filter(site_name)
+            sql += clause
+            params.append(param)
+        if start_date:
+            sql += f" AND r.{column} >= ?"
+            params.append(_day_start(start_date))
+        if end_date:
+            sql += f" AND r.{column} < ?"
+            params.append(_next_day_start(end_date))
+        sql += f" ORDER BY r.{column}, cs.site_name"
+        with self.reader() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
 
     def get_low_compliance_sites(self, threshold=0.8):
         """获取安全帽佩戴率低于阈值的工地"""
+        # 从按天汇总表计算，佩戴率为各条记录佩戴率的平均值
         sql = """
-            SELECT 
+            SELECT
                 cs.site_name,
                 cs.manager_name,
                 cs.manager_phone,
-                COUNT(*) as total_records,
-                AVG(CAST(dr.with_helmet AS FLOAT) / CAST(dr.total_people AS FLOAT)) as compliance_rate
-            FROM detection_records dr
-            JOIN construction_sites cs ON dr.site_id = cs.id
-            GROUP BY cs.id
-            HAVING compliance_rate < ?
-            ORDER BY compliance_rate ASC
+                s.total_records,
+                s.compliance_rate
+            FROM (
+                SELECT
+                    site_id,
+                    SUM(record_count) as total_records,
+                    SUM(sum_ratio) / SUM(ratio_count) as compliance_rate
+                FROM compliance_daily
+                GROUP BY site_id
+            ) s
+            JOIN construction_sites cs ON s.site_id = cs.id
+            WHERE s.compliance_rate < ?
+            ORDER BY s.compliance_rate ASC
         """
-        self.cursor.execute(sql, (threshold,))
-        return self.cursor.fetchall()
+        return self._fetchall(sql, (threshold,))
 
     def get_site_statistics(self, site_id, days=30):
         """获取指定工地的统计数据"""
         sql = """
             SELECT 
-                date(detection_time) as date,
-                COUNT(*) as detection_count,
-                AVG(CAST(with_helmet AS FLOAT) / CAST(total_people AS FLOAT)) as avg_compliance_rate,
-                SUM(total_people) as total_people,
-                SUM(with_helmet) as total_with_helmet,
-                SUM(without_helmet) as total_without_helmet
-            FROM detection_records
-            WHERE site_id = ? AND detection_time >= date('now', ?)
-            GROUP BY date(detection_time)
-            ORDER BY date ASC
-        """
-        self.cursor.execute(sql, (site_id, f'-{days} days'))
-        return self.cursor.fetchall()
+                day as date,
+                record_count as detection_count,
+                sum_ratio / ratio_count as avg_compliance_rate,
+                sum_total as total_people,
+                sum_with as total_with_helmet,
+                sum_without as total_without_helmet
+            FROM compliance_daily
+            WHERE site_id = ? AND day >= date('now', ?)
+            ORDER BY day ASC
+        """
+        return self._fetchall(sql, (site_id, f'-{days} days'))
+
+    def get_site_hourly_statistics(self, site_id, hours=24):
+        """获取指定工地最近若干小时的逐小时统计数据"""
+        sql = """
+            SELECT
+                hour,
+                record_count as detection_count,
+                sum_ratio / ratio_count as avg_compliance_rate,
+                sum_total as total_people,
+                sum_with as total_with_helmet,
+                sum_without as total_without_helmet
+            FROM compliance_hourly
+            WHERE site_id = ? AND hour >= strftime('%Y-%m-%d %H:00:00', 'now', 'localtime', ?)
+            ORDER BY hour ASC
+        """
+        return self._fetchall(sql, (site_id, f'-{hours} hours'))
+
+    def close(self):
+        """关闭写连接和连接池中的所有只读连接"""
+        for conn in getattr(self, '_read_conns', ()):
+            conn.close()
+        self._read_conns = []
+        if getattr(self, 'conn', None):
+            self.conn.close()
+            self.conn = None
 
     def __del__(self):
         """析构函数，确保关闭数据库连接"""
-        if hasattr(self, 'cursor') and self.cursor:
-            self.cursor.close()
-        if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
\ No newline at end of file
+        self.close()
+
+
+class RecordWriter(threading.Thread):
+    """后台批量写入检测记录
+
+    add() 只把记录放入内存缓冲区，写入线程在缓冲达到 batch_size 条或距上次写入
+    超过 flush_interval 秒时用一个事务批量提交，避免每条记录都同步一次磁盘。
+    close() 会写完缓冲区中剩余的记录后再返回。
+    """
+
+    def __init__(self, db, batch_size=RECORD_BATCH_SIZE, flush_interval=RECORD_FLUSH_INTERVAL):
+        super().__init__(daemon=True)
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self._pending = []
+        self._queued = 0
+        self._flush_requested = False
+        self._closing = False
+        self._cond = threading.Condition()
+
+    def add(self, site_id, total_people, with_helmet, without_helmet, image_path='', detection_time=None,
+            boxes=None):
+        """缓冲一条检测记录，detection_time为None时使用当前时间，boxes 为打包的检测框"""
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("RecordWriter 已关闭")
+            self._pending.append((site_id, detection_time or datetime.now(), total_people,
+                                  with_helmet, without_helmet, image_path, boxes))
+            self._queued += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """立即写入缓冲区中的记录，等待写入完成，超时返回False"""
+        if self.ident is None:
+            self._write_now()
+            return True
+        with self._cond:
+            target = self._queued
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(
+                lambda: self.written + self.dropped >= target or not self.is_alive(), timeout)
+
+    def _retry_wait(self, timeout):
+        """写入失败后等待一段时间再重试，关闭时立即返回"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._closing, timeout)
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def run(self):
+        while True:
+            with self._cond:
+                if not (self._closing or self._flush_requested or len(self._pending) >= self.batch_size):
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                self._flush_requested = False
+                closing = self._closing
+            if batch:
+                try:
+                    self.db.add_detection_records(batch)
+                    written, dropped = len(batch), 0
+                except sqlite3.Error:
+                    logger.exception("批量写入 %d 条检测记录失败", len(batch))
+                    if not closing:
+                        # 放回缓冲区，下一轮重试
+                        with self._cond:
+                            self._pending[:0] = batch
+                        self._retry_wait(self.flush_interval)
+                        continue
+                    written, dropped = 0, len(batch)
+                with self._cond:
+                    self.written += written
+                    self.dropped += dropped
+                    self.flushes += 1
+                    self._cond.notify_all()
+            if closing:
+                break
+        with self._cond:
+            self._cond.notify_all()
+
+    def start(self):
+        super().start()
+        # 进程退出前确保缓冲区中的记录写入数据库
+        atexit.register(self.close)
+
+    def _write_now(self):
+        """写入线程未启动时，在调用方线程中直接写入缓冲区中的记录"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if batch:
+            self.db.add_detection_records(batch)
+            with self._cond:
+                self.written += len(batch)
+                self.flushes += 1
+
+    def close(self, timeout=None):
+        """停止接收新记录，写完缓冲区后结束写入线程
+
+        写入线程从未启动时在当前线程中同步写入，写入失败时抛出异常。
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self.ident is None:
+            self._write_now()
+            return
+        if self.is_alive():
+            self.join(timeout)
+        atexit.unregister(self.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库维护')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help='将已有数据库升级到当前结构（添加索引等）')
+    subparsers.add_parser('rebuild-rollups', help='由原始检测记录重新生成佩戴率汇总表')
+    subparsers.add_parser('verify-rollups', help='检查佩戴率汇总表与原始检测记录是否一致')
+    args = parser.parse_args()
+
+    # 打开数据库时会自动执行迁移
+    db = Database(args.db)
+    if args.command == 'migrate':
+        print(f"数据库 {args.db} 已升级到版本 {db.schema_version()}")
+    elif args.command == 'rebuild-rollups':
+        db.rebuild_rollups()
+        print("佩戴率汇总表已重新生成")
+    elif args.command == 'verify-rollups':
+        mismatches = db.verify_rollups()
+        for table, site_id, bucket, stored, expected in mismatches[:20]:
+            print(f"{table} 工地{site_id} {bucket}: 汇总表 {stored}，原始记录 {expected}")
+        print(f"共 {len(mismatches)} 处不一致" if mismatches else "汇总表与原始记录一致")
+    db.close()
+    if args.command == 'verify-rollups' and mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,189 @@
 # detector.py
-from ultralytics import YOLO
+import copy
+import logging
+import threading
+import time
 import cv2
 import numpy as np
-from config import YOLO_MODEL
+from backends import create_backend
+from box_store import above_threshold
+from config import DETECTOR_BACKEND, DETECT_BATCH_SIZE, CONF_THRESHOLD, INFER_IMGSZ, LOG_VERBOSE_DETECTIONS
+from monitor import get_logger, metrics
+
+logger = get_logger('detector')
+
+# 没有检测结果时使用的空数组
+EMPTY_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
 
 class HelmetDetector:
-    def __init__(self):
-        self.model = YOLO(YOLO_MODEL)
-    def detect_frame(self, frame):
+    def __init__(self, batch_size=DETECT_BATCH_SIZE, imgsz=INFER_IMGSZ, backend=DETECTOR_BACKEND, model_path=None,
+                 candidate_conf=None, result_cache=False):
+        # 推理后端在config.py中选择，model_path为None时使用后端对应的默认模型
+        self.backend = create_backend(backend, model_path)
+        if result_cache:
+            # 内容相同的图像复用上一次的推理结果，见 result_cache.py
+            from result_cache import CachingBackend
+            self.backend = CachingBackend(self.backend)
+        # 需要保存候选框时按更低的置信度推理，统计数量时仍按 CONF_THRESHOLD 筛选
+        self.predict_conf = min(CONF_THRESHOLD, candidate_conf) if candidate_conf is not None else CONF_THRESHOLD
+        # 模型推理分辨率，由模型内部缩放，检测框坐标对应原始图像
+        self.imgsz = imgsz
+        # 批量检测时每次送入模型的帧数
+        self.batch_size = batch_size
+        # 模型推理不是线程安全的，多个线程共享同一检测器时串行调用
+        self._lock = threading.Lock()
+
+    def with_result_cache(self):
+        """返回推理结果经过缓存（见 result_cache.py）的检测器，与本检测器共用模型和推理锁"""
+        from result_cache import CachingBackend
+        detector = copy.copy(self)
+        detector.backend = CachingBackend(self.backend)
+        return detector
+
+    def warmup(self, size=(480, 640)):
+        """用空白图像推理一次，提前完成模型的延迟初始化，避免首次检测明显变慢"""
+        frame = np.zeros((*size, 3), dtype=np.uint8)
+        with self._lock:
+            self.backend.predict([frame], self.imgsz, self.predict_conf)
+
+    def _process_result(self, detections):
+        """从后端输出中筛选有效检测框，返回 (N, 6) 数组 [x1, y1, x2, y2, score, class_id]"""
+        # 降低置信度阈值以捕获更多可能的目标
+        # 与 box_store 保存的置信度精度相同，保证按原阈值重新统计得到相同的人数
+        return detections[above_threshold(detections[:, 4], CONF_THRESHOLD)]
+
+    def _summarize(self, detections):
+        """统计检测结果，返回 (total, with_helmet, without_helmet)"""
+        with_helmet = int(np.count_nonzero(detections[:, 5] == 0))  # Hardhat
+        without_helmet = len(detections) - with_helmet  # NO-Hardhat
+        total_people = with_helmet + without_helmet
+
+        # 详细的检测信息只在显式开启时输出
+        if LOG_VERBOSE_DETECTIONS and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Valid detections count: %d", len(detections))
+            logger.debug("Detection scores: %s", [f'{score:.2f}' for score in detections[:, 4]])
+            logger.debug("Final detection results - Total: %d, With Helmet: %d, Without Helmet: %d",
+                         total_people, with_helmet, without_helmet)
+        return total_people, with_helmet, without_helmet
+
+    def _predict_regions(self, frames, regions, batch_size):
+        """只推理各帧检测区域内的裁剪窗口，返回每帧合并后的后端输出，regions中为None的帧推理整幅图像"""
+        crops, owners = [], []
+        for frame, region in zip(frames, regions):
+            frame_crops = [frame] if region is None else region.crops(frame)
+            crops.extend(frame_crops)
+            owners.append(len(frame_crops))
+        # 所有帧的裁剪窗口一起按批大小送入模型
+        outputs = []
+        for start in range(0, len(crops), batch_size):
+            outputs.extend(self.backend.predict(crops[start:start + batch_size], self.imgsz, self.predict_conf))
+        results = []
+        for frame, region, count in zip(frames, regions, owners):
+            frame_outputs, outputs = outputs[:count], outputs[count:]
+            results.append(frame_outputs[0] if region is None else region.merge(frame_outputs, frame.shape))
+        return results
+
+    def detect_frame(self, frame, annotate=True, region=None):
+        """检测单帧图像，annotate为False时不在图像上绘制结果
+
+        region 为 roi.RegionOfInterest 时只检测其中的检测区域（可分块推理）。
+        """
         if frame is None or frame.size == 0:
-            print("Warning: Invalid input frame")
+            logger.warning("Invalid input frame")
+            metrics.record_invalid()
             return frame, 0, 0, 0
-        # 保持原始图像尺寸较大，提高检测质量
-        original_size = frame.shape[:2]
-        min_size = 640  # 设置最小尺寸为640x640
-        # 如果图像太小，进行放大
-        if original_size[0] < min_size or original_size[1] < min_size:
-            scale = min_size / min(original_size)
-            new_size = (int(original_size[1] * scale), int(original_size[0] * scale))
-            frame = cv2.resize(frame, new_size)
-            print(f"Resized image from {original_size} to {new_size}")
-
+        if region is not None:
+            return self.detect_batch([frame], annotate=annotate, regions=[region])[0][:4]
         # 运行检测，使用conf参数降低置信度阈值
-        results = self.model(frame, conf=0.25)[0]
-
-        total_people = 0
-        with_helmet = 0
-        without_helmet = 0
-        valid_detections = []
-
-        # 收集所有有效的检测结果
-        for r in results.boxes.data.tolist():
-            x1, y1, x2, y2, score, class_id = r
-            # 降低置信度阈值以捕获更多可能的目标
-            if score > 0.25:  # 降低置信度阈值
-                valid_detections.append((x1, y1, x2, y2, score, int(class_id)))
-                if int(class_id) == 0:  # Hardhat
-                    with_helmet += 1
-                else:  # NO-Hardhat
-                    without_helmet += 1
+        with self._lock:
+            start = time.perf_counter()
+            results = self.backend.predict([frame], self.imgsz, self.predict_conf)[0]
+        latency_ms = (time.perf_counter() - start) * 1000
 
-        total_people = with_helmet + without_helmet
+        detections = self._process_result(results)
+        metrics.record_frame(len(detections), latency_ms)
+        metrics.maybe_log(logger)
+        total_people, with_helmet, without_helmet = self._summarize(detections)
+        if annotate:
+            draw_detections(frame, detections, total_people, with_helmet, without_helmet)
+        return frame, total_people, with_helmet, without_helmet
+
+    def detect_batch(self, frames, batch_size=None, annotate=True, with_candidates=False, regions=None):
+        """批量检测多帧图像
+
+        每批最多 batch_size 帧通过一次模型调用完成推理，尺寸不同的图像
+        由模型各自做 letterbox 缩放到 imgsz，检测框坐标对应原始图像。返回与输入顺序一致的列表，每项为
+        (frame, total, with_helmet, without_helmet, detections)，
+        其中 detections 为 (N, 6) 数组 [x1, y1, x2, y2, score, class_id]。
+        只需要统计数量的调用方可传入 annotate=False 跳过绘制。
+        with_candidates=True 时每项末尾再加上后端输出的全部候选框（置信度不低于 predict_conf），
+        用于保存检测框。
+        regions 为与 frames 一一对应的 roi.RegionOfInterest 列表（None表示整幅图像），
+        设置后只检测各帧的检测区域，检测框坐标仍对应原始图像。
+        """
+        batch_size = batch_size or self.batch_size
+        if regions is not None and all(region is None for region in regions):
+            regions = None
+        outputs = [None] * len(frames)
+
+        # 无效帧不送入模型，直接返回空结果
+        empty = (EMPTY_DETECTIONS,) * (2 if with_candidates else 1)
+        valid_indices = []
+        for i, frame in enumerate(frames):
+            if frame is None or frame.size == 0:
+                logger.warning("Invalid input frame")
+                metrics.record_invalid()
+                outputs[i] = (frame, 0, 0, 0, *empty)
+            else:
+                valid_indices.append(i)
+
+        for start in range(0, len(valid_indices), batch_size):
+            chunk = valid_indices[start:start + batch_size]
+            prepared = [frames[i] for i in chunk]
+            # 一次前向推理处理整批图像
+            with self._lock:
+                start_time = time.perf_counter()
+                if regions is None:
+                    results = self.backend.predict(prepared, self.imgsz, self.predict_conf)
+                else:
+                    results = self._predict_regions(prepared, [regions[i] for i in chunk], batch_size)
+            # 批量推理的耗时按帧平均计入指标
+            latency_ms = (time.perf_counter() - start_time) * 1000 / len(chunk)
+            for i, frame, result in zip(chunk, prepared, results):
+                detections = self._process_result(result)
+                metrics.record_frame(len(detections), latency_ms)
+                counts = self._summarize(detections)
+                if annotate:
+                    draw_detections(frame, detections, *counts)
+                outputs[i] = (frame, *counts, detections) + ((result,) if with_candidates else ())
+            metrics.maybe_log(logger)
+
+        return outputs
+
+
+def draw_detections(frame, detections, total_people, with_helmet, without_helmet):
+    """在图像上绘制检测框和统计信息（原地修改并返回frame）"""
+    boxes = detections[:, :4].astype(np.int32)
+    is_hardhat = detections[:, 5] == 0
+    for (x1, y1, x2, y2), score, hardhat in zip(boxes.tolist(), detections[:, 4].tolist(), is_hardhat.tolist()):
+        if hardhat:  # Hardhat
+            color = (0, 255, 0)  # 绿色
+            label = "Hardhat"
+        else:  # NO-Hardhat
+            color = (0, 0, 255)  # 红色
+            label = "NO-Hardhat"
+
+        # 绘制边界框
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, f'{label} {score:.2f}',
+                    (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, color, 2)
 
-        # 打印详细的检测信息
-        print(f"Valid detections count: {len(valid_detections)}")
-        print(f"Detection scores: {[f'{score:.2f}' for *_, score, _ in valid_detections]}")
-
-        # 在图像上绘制检测结果
-        for x1, y1, x2, y2, score, class_id in valid_detections:
-            if class_id == 0:  # Hardhat
-                color = (0, 255, 0)  # 绿色
-                label = "Hardhat"
-            else:  # NO-Hardhat
-                color = (0, 0, 255)  # 红色
-                label = "NO-Hardhat"
-
-            # 绘制边界框
-            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
-            cv2.putText(frame, f'{label} {score:.2f}',
-                        (int(x1), int(y1 - 5)), cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5, color, 2)
-
-        # 添加统计信息到图像
-        cv2.putText(frame, f'Total: {total_people}', (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(frame, f'With Helmet: {with_helmet}', (10, 60),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(frame, f'Without Helmet: {without_helmet}', (10, 90),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-        print(
-            f"Final detection results - Total: {total_people}, With Helmet: {with_helmet}, Without Helmet: {without_helmet}")
-        return frame, total_people, with_helmet, without_helmet
\ No newline at end of file
+    # 添加统计信息到图像
+    cv2.putText(frame, f'Total: {total_people}', (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    cv2.putText(frame, f'With Helmet: {with_helmet}', (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.putText(frame, f'Without Helmet: {without_helmet}', (10, 90),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return frame
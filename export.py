@@ -0,0 +1,128 @@
+# export.py
+"""导出检测记录或佩戴率汇总为 CSV / Parquet 文件
+
+用法:
+    python export.py records.csv [--site 工地名称] [--start 2024-01-01] [--end 2024-03-31]
+    python export.py report.parquet --rollup daily --start 2024-01-01
+
+数据按块从数据库流式读取并写出，内存占用与导出的行数无关。
+Parquet 格式需要安装 pyarrow。
+"""
+import argparse
+import csv
+import os
+
+from config import DB_PATH
+from database import Database
+
+EXPORT_CHUNK_SIZE = 5000
+
+RECORD_HEADERS = ['id', 'site_id', 'detection_time', 'total_people', 'with_helmet', 'without_helmet',
+                  'image_path', 'site_name', 'manager_name', 'manager_phone']
+ROLLUP_HEADERS = {
+    'hourly': ['site_name', 'hour', 'detection_count', 'total_people', 'total_with_helmet',
+               'total_without_helmet', 'avg_compliance_rate'],
+    'daily': ['site_name', 'date', 'detection_count', 'total_people', 'total_with_helmet',
+              'total_without_helmet', 'avg_compliance_rate'],
+}
+FORMATS = ('csv', 'parquet')
+
+
+def write_csv(path, headers, chunks):
+    """逐块写入CSV，使用带BOM的UTF-8以便Excel正确显示中文"""
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def parquet_schema(headers):
+    """导出列对应的Parquet类型：时间为时间戳，人数为整数，佩戴率为浮点数"""
+    import pyarrow as pa
+    types = {'detection_time': pa.timestamp('us'), 'avg_compliance_rate': pa.float64(),
+             'image_path': pa.string(), 'hour': pa.string(), 'date': pa.string()}
+    fields = []
+    for name in headers:
+        if name in types:
+            fields.append((name, types[name]))
+        elif name.endswith('_name') or name.endswith('_phone'):
+            fields.append((name, pa.string()))
+        else:
+            fields.append((name, pa.int64()))
+    return pa.schema(fields)
+
+
+def write_parquet(path, headers, chunks):
+    """逐块写入Parquet，每个数据块成为一个行组"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow: pip install pyarrow") from e
+
+    schema = parquet_schema(headers)
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            arrays = []
+            for field, values in zip(schema, zip(*chunk)):
+                if pa.types.is_timestamp(field.type):
+                    # 检测时间在数据库中以文本保存
+                    arrays.append(pa.array(values, pa.string()).cast(field.type))
+                else:
+                    arrays.append(pa.array(values, field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def export_records(db, path, fmt=None, site_name=None, start_date=None, end_date=None, rollup=None,
+                   chunk_size=EXPORT_CHUNK_SIZE):
+    """导出检测记录（rollup为None）或按 'hourly'/'daily' 汇总的佩戴率，返回导出的行数
+
+    fmt 为None时按文件扩展名判断格式。
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {', '.join(FORMATS)}")
+
+    if rollup:
+        if rollup not in ROLLUP_HEADERS:
+            raise ValueError(f"未知的汇总粒度: {rollup}，可选: {', '.join(ROLLUP_HEADERS)}")
+        headers = ROLLUP_HEADERS[rollup]
+        chunks = db.iter_rollups(rollup, site_name, start_date, end_date, chunk_size)
+    else:
+        headers = RECORD_HEADERS
+        chunks = db.iter_records(site_name, start_date, end_date, chunk_size)
+
+    if fmt == 'csv':
+        return write_csv(path, headers, chunks)
+    return write_parquet(path, headers, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出检测记录')
+    parser.add_argument('output', help='输出文件路径（.csv 或 .parquet）')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    parser.add_argument('--format', choices=FORMATS, default=None, help='输出格式，默认按扩展名判断')
+    parser.add_argument('--site', default=None, help='工地名称（模糊匹配）')
+    parser.add_argument('--start', default=None, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='结束日期 YYYY-MM-DD（包含当天）')
+    parser.add_argument('--rollup', choices=list(ROLLUP_HEADERS), default=None,
+                        help='导出按小时或按天的佩戴率汇总，而不是原始记录')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='每次从数据库读取的行数')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    rows = export_records(db, args.output, args.format, args.site, args.start, args.end,
+                          args.rollup, args.chunk_size)
+    db.close()
+    print(f"已导出 {rows} 行到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
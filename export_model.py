@@ -0,0 +1,72 @@
+# export_model.py
+"""将训练好的 .pt 模型导出为 ONNX，可选 INT8 量化
+
+用法:
+    python export_model.py [--weights exp12/weights/best.pt] [--imgsz 640] [--int8]
+
+导出后在 config.py 中设置 DETECTOR_BACKEND = 'onnxruntime'（或 'openvino'），
+并将 ONNX_MODEL 指向导出的文件。
+"""
+import argparse
+import os
+
+from backends import preprocess
+from benchmark import load_images
+from config import YOLO_MODEL, INFER_IMGSZ, CAPTURE_DIR
+
+
+def export_onnx(weights, imgsz):
+    """导出支持动态批大小和分辨率的ONNX模型，返回导出文件路径"""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+
+
+class ImageCalibrationReader:
+    """用样例图片为静态量化提供校准数据"""
+
+    def __init__(self, input_name, images, imgsz):
+        self.input_name = input_name
+        self._batches = iter([preprocess([image], imgsz)[0] for image in images])
+
+    def get_next(self):
+        batch = next(self._batches, None)
+        return None if batch is None else {self.input_name: batch}
+
+
+def quantize_int8(onnx_path, calibration_dir, imgsz, limit=100):
+    """用校准图片对ONNX模型做INT8静态量化，返回量化模型路径"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    root, ext = os.path.splitext(onnx_path)
+    prepared_path = f'{root}_prep{ext}'
+    output_path = f'{root}_int8{ext}'
+
+    # 动态尺寸的模型无法做符号形状推断，只做常规的形状推断和图优化
+    quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=True)
+    input_name = ort.InferenceSession(prepared_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = ImageCalibrationReader(input_name, load_images(calibration_dir, limit), imgsz)
+    quantize_static(prepared_path, output_path, reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    os.remove(prepared_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出ONNX模型')
+    parser.add_argument('--weights', default=YOLO_MODEL, help='.pt模型路径')
+    parser.add_argument('--imgsz', type=int, default=INFER_IMGSZ, help='导出和校准使用的分辨率')
+    parser.add_argument('--int8', action='store_true', help='额外导出INT8量化模型')
+    parser.add_argument('--calibration', default=CAPTURE_DIR, help='INT8量化校准图片目录')
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.weights, args.imgsz)
+    print(f"ONNX模型已导出: {onnx_path}")
+    if args.int8:
+        int8_path = quantize_int8(onnx_path, args.calibration, args.imgsz)
+        print(f"INT8量化模型已导出: {int8_path}")
+
+
+if __name__ == '__main__':
+    main()
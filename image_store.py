@@ -0,0 +1,262 @@
+# image_store.py
+"""检测截图的保存与清理
+
+截图在后台线程中编码并写入按日期分目录的 CAPTURE_DIR/YYYY/MM/DD/，文件名包含
+微秒时间戳和随机后缀，同一秒内多次保存也不会互相覆盖；同时在同目录的 thumbs/ 下
+生成缩略图。清理策略删除保存超过指定天数或超出磁盘配额的截图，并清空对应检测记录的 image_path。
+
+用法:
+    python image_store.py cleanup [--days 90] [--quota-mb 10240]
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import cv2
+from config import (CAPTURE_DIR, DB_PATH, IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, IMAGE_QUEUE_SIZE,
+                    IMAGE_RETENTION_DAYS, IMAGE_QUOTA_MB, IMAGE_CLEANUP_INTERVAL, THUMBNAIL_SIZE)
+from monitor import get_logger
+
+logger = get_logger('image_store')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.jfif')
+# 缩略图保存在截图所在目录的子目录中
+THUMBNAIL_DIR = 'thumbs'
+THUMBNAIL_QUALITY = 80
+
+
+def resize_to_fit(image, max_dimension):
+    """等比缩小到长边不超过 max_dimension，不放大"""
+    h, w = image.shape[:2]
+    if not max_dimension or max(h, w) <= max_dimension:
+        return image
+    scale = max_dimension / max(h, w)
+    return cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def thumbnail_path(image_path):
+    return os.path.join(os.path.dirname(image_path), THUMBNAIL_DIR, os.path.basename(image_path))
+
+
+def write_jpeg(path, image, quality):
+    """编码为JPEG并写入，先写临时文件再改名，读取方不会看到写了一半的图片"""
+    ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG编码失败")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data.tobytes())
+    os.replace(temp_path, path)
+
+
+def load_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """读取截图的缩略图（BGR数组），缩略图不存在时由原图生成并保存，原图不存在时返回None"""
+    thumb_path = thumbnail_path(image_path)
+    if os.path.exists(thumb_path):
+        thumbnail = cv2.imread(thumb_path)
+        if thumbnail is not None:
+            return thumbnail
+    if not os.path.exists(image_path):
+        return None
+    # 在JPEG解码时直接缩小为1/4，比完整解码后再缩小快得多
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        return None
+    thumbnail = resize_to_fit(image, size)
+    try:
+        write_jpeg(thumb_path, thumbnail, THUMBNAIL_QUALITY)
+    except (OSError, ValueError, cv2.error):
+        logger.warning("保存缩略图失败: %s", thumb_path)
+    return thumbnail
+
+
+def remove_image(path):
+    """删除截图及其缩略图，返回截图大小；截图不存在时返回None"""
+    try:
+        os.remove(thumbnail_path(path))
+    except FileNotFoundError:
+        pass
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return None
+
+
+def iter_image_files(root):
+    """递归列出目录中的截图文件 (路径, 大小, 修改时间)，缩略图随截图一起删除，不单独列出"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != THUMBNAIL_DIR:
+                    stack.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+
+class ImageStore:
+    """异步保存检测截图，并按保存天数和磁盘配额清理
+
+    提供 db 时，写入线程空闲时每隔 cleanup_interval 秒执行一次清理（创建后先等待一个间隔）；
+    retention_days 和 quota_mb 都为0时清理不删除任何截图。
+    """
+
+    def __init__(self, root=CAPTURE_DIR, quality=IMAGE_JPEG_QUALITY, max_dimension=IMAGE_MAX_DIMENSION,
+                 db=None, retention_days=IMAGE_RETENTION_DAYS, quota_mb=IMAGE_QUOTA_MB,
+                 cleanup_interval=IMAGE_CLEANUP_INTERVAL, queue_size=IMAGE_QUEUE_SIZE):
+        self.root = root
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self.db = db
+        self.retention_days = retention_days
+        self.quota_mb = quota_mb
+        self.cleanup_interval = cleanup_interval
+        self.saved = 0
+        self.failed = 0
+        self._queue = queue.Queue(queue_size)
+        self._closed = False
+        # 第一次清理推迟一个间隔，不在启动时立即删除截图
+        self._next_cleanup = time.monotonic() + cleanup_interval if db is not None else None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def new_path(self, prefix='capture', when=None):
+        """生成按日期分目录、不会重名的截图路径"""
+        when = when or datetime.now()
+        directory = os.path.join(self.root, when.strftime('%Y'), when.strftime('%m'), when.strftime('%d'))
+        name = f"{prefix}_{when.strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:6]}.jpg"
+        return os.path.join(directory, name)
+
+    def save(self, image, prefix='capture', copy=True):
+        """提交一张截图，立即返回它将被写入的路径
+
+        copy=False 时调用方保证之后不再修改 image。队列已满时阻塞等待写入线程。
+        """
+        if self._closed:
+            raise RuntimeError("ImageStore 已关闭")
+        path = self.new_path(prefix)
+        self._queue.put((path, image.copy() if copy else image))
+        return path
+
+    def _write(self, path, image):
+        write_jpeg(path, resize_to_fit(image, self.max_dimension), self.quality)
+        write_jpeg(thumbnail_path(path), resize_to_fit(image, THUMBNAIL_SIZE), THUMBNAIL_QUALITY)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._maybe_cleanup()
+                continue
+            if item is None:
+                # close() 放入的结束标记，之前提交的截图都已写完
+                self._queue.task_done()
+                break
+            path, image = item
+            try:
+                self._write(path, image)
+                self.saved += 1
+            except (OSError, ValueError, cv2.error):
+                self.failed += 1
+                logger.exception("保存截图失败: %s", path)
+            finally:
+                self._queue.task_done()
+
+    def _maybe_cleanup(self):
+        if self._next_cleanup is None or time.monotonic() < self._next_cleanup:
+            return
+        self._next_cleanup = time.monotonic() + self.cleanup_interval
+        try:
+            self.cleanup(self.db)
+        except Exception:
+            logger.exception("清理截图失败")
+
+    def flush(self):
+        """等待已提交的截图全部写入"""
+        self._queue.join()
+
+    def close(self):
+        """写完队列中剩余的截图后结束写入线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def cleanup(self, db, retention_days=None, quota_mb=None):
+        """删除保存时间超过保存天数或超出磁盘配额（从最旧的开始）的截图，并清空对应记录的 image_path
+
+        按截图文件的保存时间而不是记录的检测时间判断：批量导入的旧图片记录的是原图片的时间，
+        但截图是导入时才保存的。返回 (删除的文件数, 释放的字节数)
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        quota_mb = self.quota_mb if quota_mb is None else quota_mb
+        removed = []
+        freed = 0
+        if not retention_days and not quota_mb:
+            return 0, 0
+
+        files = sorted(iter_image_files(self.root), key=lambda item: item[2])
+        if retention_days:
+            cutoff = (datetime.now() - timedelta(days=retention_days)).timestamp()
+            kept = []
+            for path, size, mtime in files:
+                if mtime >= cutoff:
+                    kept.append((path, size, mtime))
+                elif remove_image(path) is not None:
+                    freed += size
+                    removed.append(path)
+            files = kept
+
+        if quota_mb:
+            total = sum(size for _, size, _ in files)
+            quota = quota_mb * 1024 * 1024
+            for path, size, _ in files:
+                if total <= quota:
+                    break
+                if remove_image(path) is not None:
+                    total -= size
+                    freed += size
+                    removed.append(path)
+
+        if removed:
+            db.clear_image_paths(removed)
+            logger.info("已清理 %d 张截图，释放 %.1f MB", len(removed), freed / 1024 / 1024)
+        return len(removed), freed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测截图维护')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    parser.add_argument('--root', default=CAPTURE_DIR, help='截图目录')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    cleanup_parser = subparsers.add_parser('cleanup', help='按保存天数和磁盘配额清理截图')
+    cleanup_parser.add_argument('--days', type=int, default=IMAGE_RETENTION_DAYS, help='保存天数，0表示不限')
+    cleanup_parser.add_argument('--quota-mb', type=int, default=IMAGE_QUOTA_MB, help='磁盘配额(MB)，0表示不限')
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database(args.db)
+    store = ImageStore(args.root)
+    count, freed = store.cleanup(db, args.days, args.quota_mb)
+    store.close()
+    db.close()
+    print(f"已删除 {count} 张截图，释放 {freed / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
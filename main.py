@@ -1,33 +1,54 @@
 # main.py
 import sys
 import os
-from datetime import datetime
+import threading
+# 最先导入 monitor，启动耗时从这里开始计时
+from monitor import get_logger, setup_logging, metrics, startup
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QLabel, QPushButton, QGroupBox, QFormLayout, QLineEdit,
                             QComboBox, QMessageBox, QFileDialog, QApplication,
-                            QTableWidget, QTableWidgetItem, QDateEdit, QDialog,
-                            QSpinBox, QScrollArea, QHeaderView)
-from PyQt5.QtCore import QTimer, QDate, Qt
-from PyQt5.QtGui import QImage, QPixmap
+                            QTableView, QDateEdit, QDialog,
+                            QSpinBox, QScrollArea, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import QTimer, QDate, Qt, pyqtSignal
+from PyQt5.QtGui import QImageReader, QPixmap
 import cv2
 from database import Database
-from detector import HelmetDetector
-from config import CAPTURE_DIR, DB_PATH
+from record_view import (RecordTableModel, ActionDelegate, ThumbnailLoader, bgr_to_qimage, ACTION_COLUMN,
+                         THUMBNAIL_COLUMN)
+from image_store import ImageStore, remove_image
+from config import DB_PATH, MOTION_GATING, RESULT_CACHE, TRACKING
 import warnings
 warnings.filterwarnings("ignore")
 
+logger = get_logger('main')
+
 class MainWindow(QMainWindow):
+    # 后台线程加载模型完成或失败时发出，在界面线程中处理
+    model_loaded = pyqtSignal(object)
+    model_failed = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.detector = HelmetDetector()
-        self.video_capture = None
+        # 截图在后台线程中编码保存，并定期按保存天数和磁盘配额清理
+        self.images = ImageStore(db=self.db)
+        # 模型在后台线程中加载，加载完成前可以浏览记录，检测按钮不可用
+        self.detector = None
+        # 打开图片和保存记录时重新检测使用的检测器，结果缓存，重复打开同一张图片不再推理
+        self.image_detector = None
+        self.model_loaded.connect(self.on_model_loaded)
+        self.model_failed.connect(self.on_model_failed)
+        # 视频/摄像头检测流水线，界面线程只负责显示最新结果
+        self.pipeline = None
+        # 跟踪模式下统计唯一人数的跟踪器
+        self.tracker = None
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         self.current_frame = None
         # 存储最后一次的检测结果
         self.last_detection_results = None
         self.setupUI()
+        self.load_model()
 
     def setupUI(self):
         """初始化UI"""
@@ -145,15 +166,27 @@ class MainWindow(QMainWindow):
 
         query_layout.addLayout(search_layout)
 
-        # 记录表格
-        self.record_table = QTableWidget()
-        self.record_table.setColumnCount(8)
-        self.record_table.setHorizontalHeaderLabels([
-            '工地名称', '检测时间', '总人数', '戴帽人数',
-            '未戴帽人数', '佩戴率', '负责人', '操作'
-        ])
-        self.record_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        # 记录表格：滚动到底部时才从数据库加载下一页
+        # 缩略图和查看过的图片共用一个按内存大小限制的缓存
+        self.thumbnail_loader = ThumbnailLoader(parent=self)
+        self.image_cache = self.thumbnail_loader.cache
+        self.record_model = RecordTableModel(self.db, thumbnails=self.thumbnail_loader, parent=self)
+        self.record_table = QTableView()
+        self.record_table.setModel(self.record_model)
+        self.record_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.record_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # 固定行高，滚动时不需要逐行计算高度
+        self.record_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.record_table.verticalHeader().setDefaultSectionSize(50)
+        self.record_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.record_table.setColumnWidth(THUMBNAIL_COLUMN, 90)
+        self.action_delegate = ActionDelegate(self.record_table)
+        # 排队执行，避免在委托处理鼠标事件的过程中重置模型
+        self.action_delegate.clicked.connect(self.handle_record_action, Qt.QueuedConnection)
+        self.record_table.setItemDelegateForColumn(ACTION_COLUMN, self.action_delegate)
         query_layout.addWidget(self.record_table)
+        self.record_count_label = QLabel()
+        query_layout.addWidget(self.record_count_label)
 
         query_group.setLayout(query_layout)
         right_panel.addWidget(query_group)
@@ -226,6 +259,41 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, '错误', f'添加工地失败: {str(e)}')
 
+    def load_model(self):
+        """在后台线程中导入推理库并加载模型"""
+        self.set_detection_enabled(False)
+        self.statusBar().showMessage('正在加载检测模型...')
+        threading.Thread(target=self._load_model, daemon=True).start()
+
+    def _load_model(self):
+        try:
+            # ultralytics/PyTorch 导入和权重加载耗时较长，只在后台线程中进行
+            from detector import HelmetDetector
+            detector = HelmetDetector(result_cache=RESULT_CACHE)
+            detector.warmup()
+            # 视频流水线几乎没有完全相同的帧，只有单张图片的检测总是使用缓存
+            image_detector = detector if RESULT_CACHE else detector.with_result_cache()
+        except Exception as e:
+            logger.exception("加载检测模型失败")
+            self.model_failed.emit(str(e))
+            return
+        self.model_loaded.emit((detector, image_detector))
+
+    def on_model_loaded(self, detectors):
+        self.detector, self.image_detector = detectors
+        self.set_detection_enabled(True)
+        elapsed = startup.mark('模型加载完成', logger)
+        self.statusBar().showMessage(f'检测模型已加载（启动后 {elapsed:.1f} 秒）', 5000)
+
+    def on_model_failed(self, message):
+        self.statusBar().showMessage('检测模型加载失败')
+        QMessageBox.critical(self, '错误', f'加载检测模型失败: {message}')
+
+    def set_detection_enabled(self, enabled):
+        """模型加载完成前禁用需要检测的按钮"""
+        for button in (self.image_btn, self.video_btn, self.camera_btn):
+            button.setEnabled(enabled)
+
     def open_image(self):
         """打开图片文件"""
         file_name, _ = QFileDialog.getOpenFileName(
@@ -234,17 +302,15 @@ class MainWindow(QMainWindow):
 
         if file_name:
             # 关闭之前的视频捕获
-            if self.video_capture is not None:
-                self.video_capture.release()
-                self.video_capture = None
-                self.timer.stop()
+            self.stop_pipeline()
+            self.tracker = None
 
             self.current_media_type = 'image'
             frame = cv2.imread(file_name)
             if frame is not None:
                 # 进行检测并保存结果
-                processed_frame, total, with_helmet, without_helmet = self.detector.detect_frame(frame)
-                self.current_frame = processed_frame.copy()
+                processed_frame, total, with_helmet, without_helmet = self.image_detector.detect_frame(frame)
+                self.current_frame = processed_frame
                 # 更新检测结果
                 self.last_detection_results = (total, with_helmet, without_helmet)
                 self.display_frame(processed_frame)
@@ -260,39 +326,37 @@ class MainWindow(QMainWindow):
         )
 
         if file_name:
-            if self.video_capture is not None:
-                self.video_capture.release()
+            self.stop_pipeline()
 
-            self.video_capture = cv2.VideoCapture(file_name)
-            if self.video_capture.isOpened():
+            video_capture = cv2.VideoCapture(file_name)
+            if video_capture.isOpened():
                 self.current_media_type = 'video'
                 self.pause_btn.setEnabled(True)
                 self.capture_btn.setEnabled(True)
                 self.is_paused = False
                 self.pause_btn.setText('暂停')
-                self.timer.start(30)
+                # 视频文件按原始帧率读取
+                self.start_pipeline(video_capture, realtime=True)
             else:
                 QMessageBox.warning(self, '警告', '无法打开视频文件')
 
     def toggle_camera(self):
         """切换摄像头状态"""
-        if self.video_capture is None:
-            self.video_capture = cv2.VideoCapture(0)
-            if self.video_capture.isOpened():
+        if self.pipeline is None:
+            video_capture = cv2.VideoCapture(0)
+            if video_capture.isOpened():
                 self.camera_btn.setText('关闭摄像头')
                 self.current_media_type = 'camera'
                 self.pause_btn.setEnabled(True)
                 self.capture_btn.setEnabled(True)
                 self.is_paused = False
                 self.pause_btn.setText('暂停')
-                self.timer.start(30)
+                self.start_pipeline(video_capture)
             else:
                 QMessageBox.warning(self, '警告', '无法打开摄像头')
-                self.video_capture = None
+                video_capture.release()
         else:
-            self.timer.stop()
-            self.video_capture.release()
-            self.video_capture = None
+            self.stop_pipeline()
             self.camera_btn.setText('打开摄像头')
             self.pause_btn.setEnabled(False)
             self.capture_btn.setEnabled(False)
@@ -303,30 +367,60 @@ class MainWindow(QMainWindow):
         if self.current_media_type in ['video', 'camera']:
             self.is_paused = not self.is_paused
             self.pause_btn.setText('继续' if self.is_paused else '暂停')
+            if self.pipeline is not None:
+                self.pipeline.paused = self.is_paused
+
+    def start_pipeline(self, video_capture, realtime=False):
+        """启动采集和推理线程，界面定时器只负责显示"""
+        from motion import MotionGate, MotionGatedDetector
+        from pipeline import DetectionPipeline
+        from tracker import IoUTracker, TrackingDetector
+        if TRACKING:
+            # 跟踪模式下检测器按步长运行（开启运动门控时画面静止也跳过），其余帧插值
+            gate = MotionGate() if MOTION_GATING else MotionGate(threshold=0)
+            self.tracker = IoUTracker()
+            detector = TrackingDetector(self.detector, self.tracker, gate)
+        elif MOTION_GATING:
+            # 运动门控模式下画面静止时跳过推理
+            self.tracker = None
+            detector = MotionGatedDetector(self.detector)
+        else:
+            self.tracker = None
+            detector = self.detector
+        self.pipeline = DetectionPipeline(video_capture, detector, realtime=realtime)
+        self.pipeline.start()
+        self.timer.start(30)
+
+    def stop_pipeline(self):
+        """停止检测流水线并释放视频源"""
+        self.timer.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+            self.statusBar().clearMessage()
 
     def update_frame(self):
-        """更新视频帧"""
-        if self.video_capture is not None and not self.is_paused:
-            ret, frame = self.video_capture.read()
-            if ret:
-                # 存储检测结果
-                processed_frame, total, with_helmet, without_helmet = self.detector.detect_frame(frame)
-                self.current_frame = processed_frame.copy()
-                # 更新检测结果
-                self.last_detection_results = (total, with_helmet, without_helmet)
-                self.display_frame(processed_frame)
-            else:
-                self.timer.stop()
-                self.video_capture.release()
-                self.video_capture = None
-                self.pause_btn.setEnabled(False)
+        """显示流水线输出的最新检测结果"""
+        if self.pipeline is None:
+            return
+        result = self.pipeline.latest_result()
+        if result is not None:
+            # 存储检测结果，流水线每帧都是新数组，之后不会再被修改，直接保留引用
+            processed_frame, total, with_helmet, without_helmet = result
+            self.current_frame = processed_frame
+            # 更新检测结果
+            self.last_detection_results = (total, with_helmet, without_helmet)
+            self.display_frame(processed_frame)
+            self.statusBar().showMessage(self.pipeline.format_stats())
+        elif self.pipeline.is_finished():
+            self.stop_pipeline()
+            self.pause_btn.setEnabled(False)
 
     def display_frame(self, frame):
         """显示图像帧"""
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        startup.mark('首次显示检测结果', logger)
+        # QImage 直接引用BGR帧的内存，只在缩放到标签大小时复制一次
+        qt_image = bgr_to_qimage(frame, copy=False)
         scaled_image = qt_image.scaled(
             self.video_label.width(),
             self.video_label.height(),
@@ -353,28 +447,35 @@ class MainWindow(QMainWindow):
             # 检查是否有有效的检测结果
             if self.last_detection_results is None:
                 # 如果没有存储的结果，重新进行一次检测
-                processed_frame, total, with_helmet, without_helmet = self.detector.detect_frame(self.current_frame)
+                processed_frame, total, with_helmet, without_helmet = \
+                    self.image_detector.detect_frame(self.current_frame)
                 self.last_detection_results = (total, with_helmet, without_helmet)
-                self.current_frame = processed_frame.copy()
+                self.current_frame = processed_frame
 
             total, with_helmet, without_helmet = self.last_detection_results
 
+            # 跟踪模式下保存上次保存以来的唯一人数，而不是当前帧的人数；
+            # 取出人数的同时开始新的窗口，推理线程在此期间确认的目标计入下一条记录
+            if self.tracker is not None:
+                window_counts, _ = self.tracker.pop_window()
+                if window_counts[0] > 0:
+                    total, with_helmet, without_helmet = window_counts
+
             # 验证检测结果的有效性
             if total == 0 and with_helmet == 0 and without_helmet == 0:
                 QMessageBox.warning(self, '警告', '没有有效的检测结果')
                 return
 
-            # 保存图像
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            image_path = os.path.join(CAPTURE_DIR, f'capture_{timestamp}.jpg')
-            cv2.imwrite(image_path, self.current_frame)
+            # 保存图像（后台写入），current_frame 不会被原地修改，无需复制
+            image_path = self.images.save(self.current_frame, copy=False)
 
             # 保存记录到数据库
             record_id = self.db.add_detection_record(
                 site_id, total, with_helmet, without_helmet, image_path
             )
 
-            print(f"Saving detection results - Total: {total}, With: {with_helmet}, Without: {without_helmet}")
+            logger.info("Saving detection results - Total: %d, With: %d, Without: %d",
+                        total, with_helmet, without_helmet)
 
             QMessageBox.information(self, '提示',
                                     f'记录保存成功\n'
@@ -386,7 +487,7 @@ class MainWindow(QMainWindow):
 
             self.query_records()
         except Exception as e:
-            print(f"Error in save_record: {str(e)}")
+            logger.exception("Error in save_record")
             QMessageBox.warning(self, '错误', f'保存记录失败: {str(e)}')
 
     def query_records(self):
@@ -396,57 +497,34 @@ class MainWindow(QMainWindow):
         end_date = self.end_date.date().toPyDate()
 
         try:
-            records = self.db.get_records_with_site_name(site_name, start_date, end_date)
-
-            self.record_table.setRowCount(len(records))
-            for i, record in enumerate(records):
-                record_id, site_id, detection_time, total_people, with_helmet, without_helmet, \
-                    image_path, site_name, manager_name, manager_phone = record
-
-                # 计算佩戴率
-                wear_rate = (with_helmet / total_people * 100) if total_people > 0 else 0
-
-                # 添加记录到表格
-                self.record_table.setItem(i, 0, QTableWidgetItem(site_name))
-                self.record_table.setItem(i, 1, QTableWidgetItem(str(detection_time)))
-                self.record_table.setItem(i, 2, QTableWidgetItem(str(total_people)))
-                self.record_table.setItem(i, 3, QTableWidgetItem(str(with_helmet)))
-                self.record_table.setItem(i, 4, QTableWidgetItem(str(without_helmet)))
-                self.record_table.setItem(i, 5, QTableWidgetItem(f"{wear_rate:.1f}%"))
-                self.record_table.setItem(i, 6, QTableWidgetItem(f"{manager_name}\n{manager_phone}"))
-
-                # 操作按钮
-                btn_widget = QWidget()
-                btn_layout = QHBoxLayout(btn_widget)
-                btn_layout.setContentsMargins(0, 0, 0, 0)
-
-                # 查看按钮
-                view_btn = QPushButton('查看')
-                view_btn.setStyleSheet("padding: 3px;")
-                view_btn.clicked.connect(lambda _, path=image_path: self.view_image(path))
-
-                # 编辑按钮
-                edit_btn = QPushButton('编辑')
-                edit_btn.setStyleSheet("padding: 3px;")
-                edit_btn.clicked.connect(lambda _, r=record: self.edit_record(r))
-
-                # 删除按钮
-                delete_btn = QPushButton('删除')
-                delete_btn.setStyleSheet("padding: 3px;")
-                delete_btn.clicked.connect(lambda _, rid=record_id, row=i: self.delete_record(rid, row))
-
-                btn_layout.addWidget(view_btn)
-                btn_layout.addWidget(edit_btn)
-                btn_layout.addWidget(delete_btn)
-                btn_layout.setSpacing(5)
-
-                self.record_table.setCellWidget(i, 7, btn_widget)
-
-            self.record_table.resizeColumnsToContents()
-            self.record_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+            self.record_model.set_filter(site_name, start_date, end_date)
+            # 只按已加载的第一页计算列宽
+            for column in range(1, ACTION_COLUMN + 1):
+                if column != THUMBNAIL_COLUMN:
+                    self.record_table.resizeColumnToContents(column)
+            self.record_count_label.setText(f'共 {self.record_model.total} 条记录')
         except Exception as e:
             QMessageBox.warning(self, '错误', f'查询记录失败: {str(e)}')
 
+    def handle_record_action(self, action, row):
+        """处理记录表格操作列的按钮点击"""
+        if row >= self.record_model.rowCount():
+            return
+        record = self.record_model.record(row)
+        if action == 'view':
+            self.view_image(record[6])
+        elif action == 'edit':
+            self.edit_record(record)
+        elif action == 'delete':
+            self.delete_record(record[0], row)
+
+    def refresh_records(self):
+        """按当前查询条件刷新表格，保持已加载的行和滚动位置"""
+        scroll = self.record_table.verticalScrollBar().value()
+        self.record_model.refresh()
+        self.record_table.verticalScrollBar().setValue(scroll)
+        self.record_count_label.setText(f'共 {self.record_model.total} 条记录')
+
     def edit_record(self, record):
         """编辑记录对话框"""
         dialog = QDialog(self)
@@ -516,7 +594,7 @@ class MainWindow(QMainWindow):
             self.db.update_record(record_id, site_id, total, with_helmet, without_helmet)
             QMessageBox.information(self, '成功', '记录更新成功')
             dialog.accept()
-            self.query_records()  # 刷新表格
+            self.refresh_records()  # 刷新表格
         except Exception as e:
             QMessageBox.warning(self, '错误', f'更新记录失败: {str(e)}')
 
@@ -534,16 +612,16 @@ class MainWindow(QMainWindow):
                 # 获取图片路径并删除记录
                 image_path = self.db.delete_record(record_id)
 
-                # 如果有对应的图片文件，也删除它
-                if image_path and os.path.exists(image_path):
+                # 如果有对应的图片文件，连同缩略图一起删除
+                if image_path:
+                    self.thumbnail_loader.invalidate(image_path)
                     try:
-                        os.remove(image_path)
+                        remove_image(image_path)
                     except Exception as e:
-                        print(f"删除图片文件失败: {str(e)}")
+                        logger.warning("删除图片文件失败: %s", e)
 
-                # 从表格中删除该行并刷新记录
-                self.record_table.removeRow(row)
-                self.query_records()
+                # 刷新记录
+                self.refresh_records()
 
                 QMessageBox.information(self, '成功', '记录已删除')
             except Exception as e:
@@ -552,8 +630,10 @@ class MainWindow(QMainWindow):
     def view_image(self, image_path):
         """查看检测图片"""
         if os.path.exists(image_path):
-            image = QImage(image_path)
-            if not image.isNull():
+            screen_size = QApplication.primaryScreen().size()
+            max_size = int(min(screen_size.width() * 0.8, screen_size.height() * 0.8))
+            scaled_pixmap = self.load_scaled_image(image_path, max_size)
+            if scaled_pixmap is not None:
                 dialog = QDialog(self)
                 dialog.setWindowTitle('检测图片')
                 dialog.setModal(True)
@@ -562,15 +642,6 @@ class MainWindow(QMainWindow):
 
                 # 创建图片标签并设置图片
                 label = QLabel()
-                pixmap = QPixmap.fromImage(image)
-                # 缩放图片以适应屏幕
-                screen_size = QApplication.primaryScreen().size()
-                max_size = min(screen_size.width() * 0.8, screen_size.height() * 0.8)
-                scaled_pixmap = pixmap.scaled(
-                    max_size, max_size,
-                    Qt.KeepAspectRatio,
-                    Qt.SmoothTransformation
-                )
                 label.setPixmap(scaled_pixmap)
 
                 # 添加滚动区域
@@ -586,14 +657,32 @@ class MainWindow(QMainWindow):
 
                 dialog.setLayout(layout)
                 # 设置对话框大小
-                dialog.resize(min(pixmap.width() + 50, int(screen_size.width() * 0.9)),
-                              min(pixmap.height() + 100, int(screen_size.height() * 0.9)))
+                dialog.resize(min(scaled_pixmap.width() + 50, int(screen_size.width() * 0.9)),
+                              min(scaled_pixmap.height() + 100, int(screen_size.height() * 0.9)))
                 dialog.exec_()
             else:
                 QMessageBox.warning(self, '警告', '无法加载图片')
         else:
             QMessageBox.warning(self, '警告', '图片文件不存在')
 
+    def load_scaled_image(self, image_path, max_size):
+        """读取缩小到 max_size 以内的图片，结果放入缓存，读取失败返回None"""
+        key = (image_path, max_size)
+        pixmap = self.image_cache.get(key)
+        if pixmap is not None:
+            return pixmap
+        reader = QImageReader(image_path)
+        size = reader.size()
+        if size.isValid() and max(size.width(), size.height()) > max_size:
+            # JPEG在解码时直接缩小，不需要先解码完整图片
+            reader.setScaledSize(size.scaled(max_size, max_size, Qt.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            return None
+        pixmap = QPixmap.fromImage(image)
+        self.image_cache.put(key, pixmap)
+        return pixmap
+
     def check_warnings(self):
         """检查安全帽佩戴率预警"""
         try:
@@ -614,12 +703,16 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         """程序关闭事件"""
-        if self.video_capture is not None:
-            self.video_capture.release()
+        self.stop_pipeline()
+        self.images.close()
+        logger.info('检测指标: %s', metrics.summary())
         event.accept()
 
 if __name__ == '__main__':
+    setup_logging()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    # 事件循环开始处理后窗口才真正显示出来
+    QTimer.singleShot(0, lambda: startup.mark('窗口显示', logger))
     sys.exit(app.exec_())
\ No newline at end of file
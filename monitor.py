@@ -0,0 +1,199 @@
+# monitor.py
+"""运行日志与检测性能指标"""
+import bisect
+import logging
+import threading
+import time
+
+from config import (LOG_LEVEL, LOG_FILE, LOG_RATE_LIMIT, LOG_RATE_WINDOW,
+                    LOG_METRICS_INTERVAL)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# 推理耗时直方图的分桶上界（毫秒），最后一个桶收集所有更慢的结果
+LATENCY_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+# 日志限流计数的键超过该数量时清理已过期的计数
+RATE_LIMIT_MAX_KEYS = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    """限制同一条日志在时间窗口内的输出次数
+
+    以 (logger名称, 级别, 消息模板) 作为键，每个窗口内最多输出 rate 条，
+    超出的部分被丢弃，下一个窗口的第一条日志会附带被丢弃的条数（由 RateLimitFormatter 输出）。
+    同一条日志依次经过多个处理器时只在第一次判断，之后的处理器沿用结果，不修改日志内容。
+    """
+
+    def __init__(self, rate=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.rate = rate
+        self.window = window
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        """删除时间窗口已结束的计数，避免长时间运行时键越来越多"""
+        self._counters = {key: value for key, value in self._counters.items() if now - value[0] < self.window}
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        limited = getattr(record, 'rate_limited', None)
+        if limited is not None:
+            return not limited
+        # 按未代入参数的消息模板计数，路径、ID等参数不同的同类日志共用一个计数
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            if len(self._counters) >= RATE_LIMIT_MAX_KEYS:
+                self._prune(now)
+            window_start, count, suppressed = self._counters.get(key, (now, 0, 0))
+            if now - window_start >= self.window:
+                window_start, count = now, 0
+            if count >= self.rate:
+                self._counters[key] = (window_start, count, suppressed + 1)
+                record.rate_limited = True
+                return False
+            self._counters[key] = (window_start, count + 1, 0)
+        record.rate_limited = False
+        record.suppressed = suppressed
+        return True
+
+
+class RateLimitFormatter(logging.Formatter):
+    """在消息末尾附上 RateLimitFilter 记录的被丢弃条数"""
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message = f'{message} (已抑制 {suppressed} 条重复日志)'
+        return message
+
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """配置程序入口的日志输出，重复调用不会重复添加处理器"""
+    root = logging.getLogger('helmet')
+    if root.handlers:
+        return root
+    root.setLevel(level)
+    root.propagate = False
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    # 所有处理器共用一个限流过滤器，计数只按日志条数累计一次
+    rate_limit = RateLimitFilter()
+    for handler in handlers:
+        handler.setFormatter(RateLimitFormatter(LOG_FORMAT))
+        handler.addFilter(rate_limit)
+        root.addHandler(handler)
+    return root
+
+
+def get_logger(name):
+    """获取模块日志记录器，统一挂在 helmet 命名空间下"""
+    return logging.getLogger(f'helmet.{name}')
+
+
+class DetectionMetrics:
+    """检测热路径的计数器和推理耗时直方图（线程安全）"""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.frames = 0
+            self.detections = 0
+            self.invalid_frames = 0
+            self.latency_counts = [0] * (len(self.buckets_ms) + 1)
+            self.latency_total_ms = 0.0
+            self._last_log = time.monotonic()
+
+    def record_frame(self, detections, latency_ms):
+        """记录一帧的检测框数量和推理耗时"""
+        with self._lock:
+            self.frames += 1
+            self.detections += detections
+            self.latency_total_ms += latency_ms
+            self.latency_counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+
+    def record_invalid(self):
+        with self._lock:
+            self.invalid_frames += 1
+
+    def percentile(self, q):
+        """按直方图估算耗时分位数（返回所在桶的上界，毫秒）"""
+        with self._lock:
+            total = sum(self.latency_counts)
+            if total == 0:
+                return 0.0
+            target = q * total
+            seen = 0
+            for i, count in enumerate(self.latency_counts):
+                seen += count
+                if seen >= target:
+                    return float(self.buckets_ms[i]) if i < len(self.buckets_ms) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            frames = self.frames
+            data = {
+                'frames': frames,
+                'detections': self.detections,
+                'invalid_frames': self.invalid_frames,
+                'avg_latency_ms': self.latency_total_ms / frames if frames else 0.0,
+                'latency_histogram': dict(zip(
+                    [f'<={b}ms' for b in self.buckets_ms] + [f'>{self.buckets_ms[-1]}ms'],
+                    self.latency_counts)),
+            }
+        data['p50_ms'] = self.percentile(0.5)
+        data['p95_ms'] = self.percentile(0.95)
+        return data
+
+    def summary(self):
+        data = self.snapshot()
+        return (f"frames={data['frames']} detections={data['detections']} "
+                f"invalid={data['invalid_frames']} avg={data['avg_latency_ms']:.1f}ms "
+                f"p50<={data['p50_ms']:.0f}ms p95<={data['p95_ms']:.0f}ms")
+
+    def maybe_log(self, logger, interval=LOG_METRICS_INTERVAL):
+        """距上次输出超过 interval 秒时，以INFO级别输出一次指标汇总"""
+        if not interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_log < interval:
+                return
+            self._last_log = now
+        logger.info('检测指标: %s', self.summary())
+
+
+class StartupTimer:
+    """记录启动过程中各阶段（窗口显示、模型加载、首次检测）距启动的耗时"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name, logger=None):
+        """记录阶段 name 的耗时（秒），同一阶段只记录第一次"""
+        with self._lock:
+            if name in self.marks:
+                return self.marks[name]
+            elapsed = time.perf_counter() - self.start
+            self.marks[name] = elapsed
+        if logger is not None:
+            logger.info('启动耗时 %s: %.2fs', name, elapsed)
+        return elapsed
+
+
+# 全局检测指标
+metrics = DetectionMetrics()
+# 启动耗时，从导入本模块时开始计时
+startup = StartupTimer()
@@ -0,0 +1,155 @@
+# motion.py
+"""运动门控推理：画面静止时跳过模型推理，复用上一次的检测结果
+
+用法（在测试视频上评估与逐帧检测相比的准确度）:
+    python motion.py video.mp4 [--stride N] [--threshold 0.01]
+"""
+import argparse
+
+import cv2
+from config import (INFERENCE_STRIDE, MOTION_THRESHOLD, MOTION_PIXEL_THRESHOLD,
+                    MOTION_MAX_SKIP)
+from detector import HelmetDetector, draw_detections
+
+# 运动检测使用的缩略图尺寸
+MOTION_FRAME_SIZE = (160, 90)
+
+
+class MotionGate:
+    """根据跳帧步长和帧差判断当前帧是否需要推理
+
+    每 stride 帧检查一次，与上一次推理时的画面比较，变化像素比例超过
+    threshold 时才推理；连续跳过 max_skip 帧后强制推理一次（0 表示不强制）。
+    """
+
+    def __init__(self, stride=INFERENCE_STRIDE, threshold=MOTION_THRESHOLD,
+                 pixel_threshold=MOTION_PIXEL_THRESHOLD, max_skip=MOTION_MAX_SKIP):
+        self.stride = max(1, stride)
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_skip = max_skip
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.inferences = 0
+        self._reference = None
+        self._since_inference = 0
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, MOTION_FRAME_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def motion_ratio(self, thumbnail):
+        """与参考画面相比发生变化的像素比例"""
+        diff = cv2.absdiff(thumbnail, self._reference)
+        return cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]) / diff.size
+
+    def should_infer(self, frame):
+        self.frames += 1
+        self._since_inference += 1
+
+        if self._reference is None:
+            thumbnail = self._thumbnail(frame)
+        else:
+            # 只在每 stride 帧中的第一帧做运动检测
+            if (self.frames - 1) % self.stride:
+                return False
+            thumbnail = self._thumbnail(frame)
+            forced = self.max_skip and self._since_inference > self.max_skip
+            if not forced and self.motion_ratio(thumbnail) < self.threshold:
+                return False
+
+        self._reference = thumbnail
+        self.inferences += 1
+        self._since_inference = 0
+        return True
+
+    @property
+    def inference_rate(self):
+        """实际推理帧数占总帧数的比例"""
+        return self.inferences / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {'frames': self.frames, 'inferences': self.inferences,
+                'inference_rate': self.inference_rate}
+
+
+class MotionGatedDetector:
+    """在 HelmetDetector 前加运动门控，接口与 detect_frame 一致"""
+
+    def __init__(self, detector, gate=None):
+        self.detector = detector
+        self.gate = gate or MotionGate()
+        self._last_results = None
+
+    def detect_frame(self, frame, annotate=True):
+        if frame is None or frame.size == 0:
+            return self.detector.detect_frame(frame, annotate)
+
+        if self.gate.should_infer(frame) or self._last_results is None:
+            frame, total, with_helmet, without_helmet, detections = \
+                self.detector.detect_batch([frame], annotate=False)[0]
+            self._last_results = (detections, total, with_helmet, without_helmet)
+        else:
+            # 画面没有变化，复用上一次的检测结果
+            detections, total, with_helmet, without_helmet = self._last_results
+
+        if annotate:
+            draw_detections(frame, detections, total, with_helmet, without_helmet)
+        return frame, total, with_helmet, without_helmet
+
+
+def evaluate(video_path, detector, gate):
+    """在视频上比较门控推理与逐帧推理的统计结果"""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise RuntimeError(f"无法打开视频: {video_path}")
+
+    frames = 0
+    exact = 0
+    abs_error = 0
+    gated_counts = None
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            _, total, with_helmet, without_helmet, _ = detector.detect_batch([frame], annotate=False)[0]
+            full_counts = (total, with_helmet, without_helmet)
+            if gate.should_infer(frame) or gated_counts is None:
+                gated_counts = full_counts
+
+            frames += 1
+            exact += gated_counts == full_counts
+            abs_error += sum(abs(a - b) for a, b in zip(gated_counts, full_counts))
+    finally:
+        capture.release()
+
+    return {
+        'frames': frames,
+        'inference_rate': gate.inference_rate,
+        'exact_match_rate': exact / frames if frames else 0.0,
+        'mean_abs_count_error': abs_error / frames if frames else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='评估运动门控推理的准确度')
+    parser.add_argument('video', help='测试视频文件')
+    parser.add_argument('--stride', type=int, default=INFERENCE_STRIDE, help='每N帧检查一次')
+    parser.add_argument('--threshold', type=float, default=MOTION_THRESHOLD, help='变化像素比例阈值')
+    parser.add_argument('--max-skip', type=int, default=MOTION_MAX_SKIP, help='最多连续跳过的帧数')
+    args = parser.parse_args()
+
+    gate = MotionGate(stride=args.stride, threshold=args.threshold, max_skip=args.max_skip)
+    result = evaluate(args.video, HelmetDetector(), gate)
+    print(f"总帧数: {result['frames']}")
+    print(f"实际推理比例: {result['inference_rate'] * 100:.1f}%")
+    print(f"统计结果完全一致的帧: {result['exact_match_rate'] * 100:.1f}%")
+    print(f"平均计数误差: {result['mean_abs_count_error']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# pipeline.py
+import threading
+import time
+from collections import deque
+
+import cv2
+from config import PIPELINE_QUEUE_SIZE
+
+
+class LatestQueue:
+    """有界队列，队列已满时丢弃最旧的元素"""
+
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """放入元素，队列满时丢弃最旧的一个"""
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """取出最旧的元素，超时返回None"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def get_latest(self):
+        """取出最新的元素并清空队列，队列为空时返回None"""
+        with self._cond:
+            if not self._items:
+                return None
+            item = self._items.pop()
+            self.dropped += len(self._items)
+            self._items.clear()
+            return item
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StageStats:
+    """按滑动窗口统计流水线单个阶段的帧率"""
+
+    def __init__(self, window=30):
+        self._timestamps = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def tick(self):
+        with self._lock:
+            self._timestamps.append(time.perf_counter())
+            self.count += 1
+
+    @property
+    def fps(self):
+        with self._lock:
+            if len(self._timestamps) < 2:
+                return 0.0
+            elapsed = self._timestamps[-1] - self._timestamps[0]
+            return (len(self._timestamps) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class CaptureThread(threading.Thread):
+    """采集线程：从视频源读取帧放入队列"""
+
+    def __init__(self, capture, out_queue, realtime=False, max_fps=None):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.out_queue = out_queue
+        self.stats = StageStats()
+        self.paused = False
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+
+        # 视频文件按原始帧率播放，摄像头由设备自身限速
+        interval = 0.0
+        if realtime:
+            source_fps = capture.get(cv2.CAP_PROP_FPS)
+            if source_fps and source_fps > 0:
+                interval = 1.0 / source_fps
+        if max_fps:
+            interval = max(interval, 1.0 / max_fps)
+        self.interval = interval
+
+    def run(self):
+        next_time = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                if self.paused:
+                    time.sleep(0.05)
+                    next_time = time.perf_counter()
+                    continue
+
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+                self.out_queue.put(frame)
+                self.stats.tick()
+
+                if self.interval:
+                    next_time += self.interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        next_time = time.perf_counter()
+        finally:
+            self.finished.set()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class InferenceThread(threading.Thread):
+    """推理线程：从帧队列取帧检测，结果放入结果队列"""
+
+    def __init__(self, detector, in_queue, out_queue, source_finished):
+        super().__init__(daemon=True)
+        self.detector = detector
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.source_finished = source_finished
+        self.stats = StageStats()
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                frame = self.in_queue.get(timeout=0.1)
+                if frame is None:
+                    # 视频源已结束且队列已取空
+                    if self.source_finished.is_set() and len(self.in_queue) == 0:
+                        break
+                    continue
+                self.out_queue.put(self.detector.detect_frame(frame))
+                self.stats.tick()
+        finally:
+            self.finished.set()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class DetectionPipeline:
+    """采集、推理、显示三级流水线
+
+    采集线程和推理线程之间、推理线程和界面之间均为有界队列，
+    队列满时丢弃最旧的帧，界面线程只取最新的检测结果显示。
+    """
+
+    def __init__(self, capture, detector, realtime=False, max_fps=None,
+                 queue_size=PIPELINE_QUEUE_SIZE):
+        self.capture = capture
+        self.frame_queue = LatestQueue(queue_size)
+        self.result_queue = LatestQueue(queue_size)
+        self.capture_thread = CaptureThread(capture, self.frame_queue, realtime, max_fps)
+        self.inference_thread = InferenceThread(
+            detector, self.frame_queue, self.result_queue, self.capture_thread.finished
+        )
+        self.display_stats = StageStats()
+
+    def start(self):
+        self.capture_thread.start()
+        self.inference_thread.start()
+
+    def stop(self):
+        """停止所有线程并释放视频源"""
+        self.capture_thread.stop()
+        self.inference_thread.stop()
+        if self.capture_thread.is_alive():
+            self.capture_thread.join()
+        if self.inference_thread.is_alive():
+            self.inference_thread.join()
+        self.capture.release()
+
+    @property
+    def paused(self):
+        return self.capture_thread.paused
+
+    @paused.setter
+    def paused(self, value):
+        self.capture_thread.paused = value
+
+    def latest_result(self):
+        """获取最新的检测结果 (frame, total, with_helmet, without_helmet)，没有新结果时返回None"""
+        result = self.result_queue.get_latest()
+        if result is not None:
+            self.display_stats.tick()
+        return result
+
+    def is_finished(self):
+        """视频源读取完毕且所有结果已被取走"""
+        return self.inference_thread.finished.is_set() and len(self.result_queue) == 0
+
+    def stats(self):
+        """各阶段的帧率和队列深度"""
+        stats = {
+            'capture': {'fps': self.capture_thread.stats.fps,
+                        'queue': len(self.frame_queue),
+                        'dropped': self.frame_queue.dropped},
+            'inference': {'fps': self.inference_thread.stats.fps,
+                          'queue': len(self.result_queue),
+                          'dropped': self.result_queue.dropped},
+            'display': {'fps': self.display_stats.fps},
+        }
+        # 运动门控模式下记录实际推理比例
+        gate = getattr(self.inference_thread.detector, 'gate', None)
+        if gate is not None:
+            stats['inference']['inference_rate'] = gate.inference_rate
+        # 跟踪模式下记录当前时间窗口的唯一人数
+        tracker = getattr(self.inference_thread.detector, 'tracker', None)
+        if tracker is not None:
+            stats['tracking'] = dict(zip(('total', 'with_helmet', 'without_helmet'), tracker.window_counts()))
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        text = (f"采集 {stats['capture']['fps']:.1f} FPS (队列 {stats['capture']['queue']}) | "
+                f"推理 {stats['inference']['fps']:.1f} FPS (队列 {stats['inference']['queue']}) | "
+                f"显示 {stats['display']['fps']:.1f} FPS")
+        if 'inference_rate' in stats['inference']:
+            text += f" | 实际推理 {stats['inference']['inference_rate'] * 100:.0f}%"
+        if 'tracking' in stats:
+            text += f" | 唯一人数 {stats['tracking']['total']} (未戴帽 {stats['tracking']['without_helmet']})"
+        return text
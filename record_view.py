@@ -0,0 +1,329 @@
+# record_view.py
+"""检测记录表格的数据模型和操作列委托
+
+RecordTableModel 按需从数据库分页读取记录（键集分页），表格滚动到底部时才加载下一页；
+截图列的缩略图只在行进入可见区域时由 ThumbnailLoader 在后台线程读取，解码后的图片
+保存在按字节数限制大小的 PixmapCache 中；操作列由 ActionDelegate 直接绘制按钮，
+不为每一行创建控件。
+"""
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+from PyQt5.QtCore import (QAbstractTableModel, QEvent, QModelIndex, QObject, QRect, QRunnable, QSize, Qt,
+                          QThreadPool, pyqtSignal)
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+from config import RECORD_PAGE_SIZE, THUMBNAIL_CACHE_MB
+from image_store import load_thumbnail
+
+HEADERS = ['工地名称', '检测时间', '总人数', '戴帽人数', '未戴帽人数', '佩戴率', '负责人', '截图', '操作']
+THUMBNAIL_COLUMN = 7
+ACTION_COLUMN = 8
+# 表格中缩略图的显示尺寸
+THUMBNAIL_DISPLAY_SIZE = QSize(80, 45)
+
+
+class PixmapCache:
+    """最近最少使用的 QPixmap 缓存，总字节数超过上限时淘汰最久未使用的图片
+
+    只能在界面线程中使用。
+    """
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    @staticmethod
+    def _size(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key):
+        pixmap = self._items.get(key)
+        if pixmap is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self._items:
+            self.bytes -= self._size(self._items.pop(key))
+        size = self._size(pixmap)
+        if size > self.max_bytes:
+            return
+        self._items[key] = pixmap
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= self._size(evicted)
+
+    def discard(self, key):
+        pixmap = self._items.pop(key, None)
+        if pixmap is not None:
+            self.bytes -= self._size(pixmap)
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+def bgr_to_qimage(image, copy=True):
+    """BGR数组转为 QImage，直接使用 Format_BGR888，不做颜色转换
+
+    copy=False 时 QImage 直接引用数组内存，调用方需保证数组在 QImage 使用期间不被修改或释放；
+    copy=True 时返回独立持有数据的 QImage（可跨线程传递）。
+    """
+    image = np.ascontiguousarray(image)
+    h, w = image.shape[:2]
+    qt_image = QImage(image.data, w, h, image.strides[0], QImage.Format_BGR888)
+    return qt_image.copy() if copy else qt_image
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        self.loader._load_next()
+
+
+class ThumbnailLoader(QObject):
+    """在后台线程中读取缩略图，读取完成后放入缓存并发出 ready(图片路径)
+
+    等待读取的请求按后进先出处理并限制数量，快速滚动时优先读取当前可见的行。
+    """
+
+    ready = pyqtSignal(str)
+    _loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, cache=None, display_size=THUMBNAIL_DISPLAY_SIZE, max_pending=64, threads=2,
+                 parent=None):
+        super().__init__(parent)
+        self.cache = cache or PixmapCache()
+        self.display_size = display_size
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._requested = set()
+        self._missing = set()
+        self._lock = threading.Lock()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(threads)
+        self._loaded.connect(self._on_loaded)
+
+    def thumbnail(self, path):
+        """返回已缓存的缩略图，未缓存时提交后台读取并返回None"""
+        pixmap = self.cache.get(path)
+        if pixmap is not None or not path or path in self._missing:
+            return pixmap
+        with self._lock:
+            if path in self._requested:
+                return None
+            self._requested.add(path)
+            self._pending.append(path)
+            # 丢弃最早的请求，这些行多半已经滚出可见区域
+            while len(self._pending) > self.max_pending:
+                self._requested.discard(self._pending.popleft())
+        self._pool.start(_ThumbnailTask(self))
+        return None
+
+    def _load_next(self):
+        with self._lock:
+            if not self._pending:
+                return
+            path = self._pending.pop()
+        thumbnail = load_thumbnail(path)
+        self._loaded.emit(path, QImage() if thumbnail is None else bgr_to_qimage(thumbnail))
+
+    def _on_loaded(self, path, image):
+        with self._lock:
+            self._requested.discard(path)
+        if image.isNull():
+            self._missing.add(path)
+            return
+        pixmap = QPixmap.fromImage(image).scaled(self.display_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.cache.put(path, pixmap)
+        self.ready.emit(path)
+
+    def invalidate(self, path):
+        """图片被删除或替换后清除缓存"""
+        self.cache.discard(path)
+        self._missing.discard(path)
+
+
+class RecordTableModel(QAbstractTableModel):
+    """检测记录表格模型，每行对应 Database.get_records_page 返回的一条记录"""
+
+    def __init__(self, db, page_size=RECORD_PAGE_SIZE, thumbnails=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.page_size = page_size
+        self.records = []
+        self.total = 0
+        self._filters = (None, None, None)
+        self._has_more = False
+        # 图片路径 -> 行号，缩略图读取完成后刷新对应的单元格
+        self._rows_by_path = {}
+        self.thumbnails = thumbnails
+        if thumbnails is not None:
+            thumbnails.ready.connect(self._thumbnail_ready)
+
+    def set_filter(self, site_name=None, start_date=None, end_date=None):
+        """设置筛选条件，清空已加载的记录并读取第一页"""
+        self.beginResetModel()
+        self._filters = (site_name, start_date, end_date)
+        self.records = []
+        self._rows_by_path = {}
+        self.total = self.db.count_records(*self._filters)
+        self._has_more = self.total > 0
+        self.endResetModel()
+        if self._has_more:
+            self.fetchMore(QModelIndex())
+
+    def refresh(self):
+        """按当前筛选条件重新查询，保持已加载的行数，用于编辑或删除记录之后"""
+        loaded = len(self.records)
+        self.set_filter(*self._filters)
+        while self._has_more and len(self.records) < loaded:
+            self.fetchMore(QModelIndex())
+
+    def record(self, row):
+        return self.records[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent):
+        if parent.isValid() or not self._has_more:
+            return
+        after = None
+        if self.records:
+            last = self.records[-1]
+            after = (last[2], last[0])
+        page = self.db.get_records_page(*self._filters, after=after, limit=self.page_size)
+        self._has_more = len(page) == self.page_size
+        if not page:
+            return
+        start = len(self.records)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self.records.extend(page)
+        for row, record in enumerate(page, start):
+            if record[6]:
+                self._rows_by_path.setdefault(record[6], []).append(row)
+        self.endInsertRows()
+
+    def _thumbnail_ready(self, path):
+        for row in self._rows_by_path.get(path, ()):
+            index = self.index(row, THUMBNAIL_COLUMN)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if index.column() == THUMBNAIL_COLUMN:
+            # 只有可见的单元格会被请求，缩略图随滚动按需加载
+            if role == Qt.DecorationRole and self.thumbnails is not None:
+                return self.thumbnails.thumbnail(self.records[index.row()][6])
+            if role == Qt.SizeHintRole:
+                return THUMBNAIL_DISPLAY_SIZE
+            return None
+        if role != Qt.DisplayRole:
+            return None
+        _, _, detection_time, total_people, with_helmet, without_helmet, \
+            _, site_name, manager_name, manager_phone = self.records[index.row()]
+        column = index.column()
+        if column == 0:
+            return site_name
+        if column == 1:
+            return str(detection_time)
+        if column == 2:
+            return str(total_people)
+        if column == 3:
+            return str(with_helmet)
+        if column == 4:
+            return str(without_helmet)
+        if column == 5:
+            # 计算佩戴率
+            wear_rate = (with_helmet / total_people * 100) if total_people > 0 else 0
+            return f"{wear_rate:.1f}%"
+        if column == 6:
+            return f"{manager_name} {manager_phone}"
+        return None
+
+
+class ActionDelegate(QStyledItemDelegate):
+    """操作列：绘制查看/编辑/删除按钮，点击时发出 clicked(动作, 行号)"""
+
+    ACTIONS = (('view', '查看'), ('edit', '编辑'), ('delete', '删除'))
+    SPACING = 5
+
+    clicked = pyqtSignal(str, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None
+
+    def _button_rects(self, rect):
+        width = (rect.width() - self.SPACING * (len(self.ACTIONS) + 1)) // len(self.ACTIONS)
+        return [QRect(rect.left() + self.SPACING + i * (width + self.SPACING), rect.top() + 2,
+                      width, rect.height() - 4)
+                for i in range(len(self.ACTIONS))]
+
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget else QApplication.style()
+        for i, ((action, text), rect) in enumerate(zip(self.ACTIONS, self._button_rects(option.rect))):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = text
+            button.state = QStyle.State_Enabled
+            if self._pressed == (index.row(), i):
+                button.state |= QStyle.State_Sunken
+            else:
+                button.state |= QStyle.State_Raised
+            style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        metrics = option.fontMetrics
+        text_width = sum(metrics.horizontalAdvance(text) + 16 for _, text in self.ACTIONS)
+        size.setWidth(text_width + self.SPACING * (len(self.ACTIONS) + 1))
+        return size
+
+    def _hit(self, option, pos):
+        for i, rect in enumerate(self._button_rects(option.rect)):
+            if rect.contains(pos):
+                return i
+        return None
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+            button = self._hit(option, event.pos())
+            self._pressed = None if button is None else (index.row(), button)
+            return button is not None
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pressed, self._pressed = self._pressed, None
+            button = self._hit(option, event.pos())
+            if pressed is not None and pressed == (index.row(), button):
+                self.clicked.emit(self.ACTIONS[button][0], index.row())
+                return True
+            return pressed is not None
+        return False
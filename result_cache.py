@@ -0,0 +1,296 @@
+# result_cache.py
+"""检测结果缓存
+
+以图像内容的哈希为键缓存推理后端的输出，重复打开同一张图片或重新检测同一帧时不再推理。
+可选按感知哈希匹配几乎相同的画面（固定摄像头长时间不变的场景），以及 SQLite 磁盘缓存，
+进程重启后仍可命中。缓存与模型文件（路径、大小、修改时间）和阈值配置绑定，
+任一项变化后原有的缓存条目全部失效。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from config import (CONF_THRESHOLD, NMS_IOU_THRESHOLD, MAX_DETECTIONS, LOG_METRICS_INTERVAL,
+                    RESULT_CACHE_MB, RESULT_CACHE_NEAR_DISTANCE, RESULT_CACHE_PATH, RESULT_CACHE_DISK_ENTRIES)
+from monitor import get_logger
+
+logger = get_logger('result_cache')
+
+# 感知哈希的缩略图尺寸，相邻像素比较得到 16×16=256 位
+PHASH_SIZE = (17, 16)
+# 每个缓存条目除检测框数组外的大致内存开销（字节）
+ENTRY_OVERHEAD = 200
+# 每个字节中1的个数，用于计算汉明距离
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+
+def model_fingerprint(backend):
+    """由后端、模型文件和阈值配置生成的指纹，任一项变化时缓存失效"""
+    parts = [backend.name, str(CONF_THRESHOLD), str(NMS_IOU_THRESHOLD), str(MAX_DETECTIONS)]
+    model_path = getattr(backend, 'model_path', None)
+    if model_path:
+        parts.append(os.path.abspath(model_path))
+        try:
+            stat = os.stat(model_path)
+            parts.extend([str(stat.st_size), str(stat.st_mtime_ns)])
+        except OSError:
+            pass
+    return hashlib.blake2b('|'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def content_key(frame, params):
+    """图像内容和推理参数的哈希"""
+    # SHA-256 在支持 SHA 指令的CPU上比 blake2b 快一倍以上，1080p 图像约 5ms
+    digest = hashlib.sha256(repr((frame.shape, frame.dtype.str, params)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.digest()[:16]
+
+
+def perceptual_hash(frame):
+    """差值哈希：灰度缩略图中每个像素是否比右侧像素亮，返回 256 位（32字节）数组"""
+    # 先隔行隔列抽取再缩小、转灰度，避免对整幅图像做面积插值和颜色转换
+    step = max(1, min(frame.shape[0], frame.shape[1]) // (PHASH_SIZE[1] * 8))
+    small = cv2.resize(frame[::step, ::step], PHASH_SIZE, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+class HashIndex:
+    """一组感知哈希，保存在预先分配的矩阵中，插入和淘汰时原地更新，查询时不重新组装矩阵"""
+
+    def __init__(self, capacity=64):
+        self.hashes = np.zeros((capacity, PHASH_SIZE[1] * (PHASH_SIZE[0] - 1) // 8), dtype=np.uint8)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.keys = [None] * capacity
+        self.rows = {}
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _grow(self):
+        capacity = len(self.keys)
+        self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+        self.valid = np.concatenate([self.valid, np.zeros(capacity, dtype=bool)])
+        self.keys.extend([None] * capacity)
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def add(self, key, phash):
+        if key in self.rows:
+            return
+        if not self.free:
+            self._grow()
+        row = self.free.pop()
+        self.hashes[row] = phash
+        self.valid[row] = True
+        self.keys[row] = key
+        self.rows[key] = row
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.valid[row] = False
+            self.keys[row] = None
+            self.free.append(row)
+
+    def nearest(self, phash):
+        """返回 (汉明距离最小的键, 距离)，没有条目时返回 (None, None)"""
+        if not self.rows:
+            return None, None
+        distances = POPCOUNT[self.hashes ^ phash].sum(axis=1)
+        # 空行不参与比较
+        distances[~self.valid] = np.iinfo(distances.dtype).max
+        best = int(distances.argmin())
+        return self.keys[best], int(distances[best])
+
+
+class ResultCache:
+    """内存中的LRU缓存（按检测框数组的字节数限制大小），可选磁盘缓存（线程安全）"""
+
+    def __init__(self, fingerprint, max_bytes=RESULT_CACHE_MB * 1024 * 1024, near_distance=RESULT_CACHE_NEAR_DISTANCE,
+                 disk_path=RESULT_CACHE_PATH, disk_entries=RESULT_CACHE_DISK_ENTRIES):
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.near_distance = near_distance
+        self.disk_entries = disk_entries
+        self.bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        # 按 (图像尺寸, 推理参数) 分组的感知哈希，只在同组内比较
+        self._near_index = {}
+        self._lock = threading.Lock()
+        self._last_log = time.monotonic()
+        self._disk = None
+        self._disk_writes = 0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path):
+        self._disk = sqlite3.connect(path, check_same_thread=False)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._disk.execute("CREATE TABLE IF NOT EXISTS results (key BLOB UNIQUE NOT NULL, detections BLOB NOT NULL)")
+        row = self._disk.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            if row is not None:
+                logger.info("模型或阈值已变化，清空磁盘上的检测结果缓存")
+            self._disk.execute("DELETE FROM results")
+            self._disk.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)",
+                               (self.fingerprint,))
+        self._disk.commit()
+
+    def _put(self, key, detections, group=None, phash=None):
+        size = detections.nbytes + ENTRY_OVERHEAD
+        if key in self._items:
+            return
+        self._items[key] = (detections, group)
+        self.bytes += size
+        if phash is not None:
+            self._near_index.setdefault(group, HashIndex()).add(key, phash)
+        while self.bytes > self.max_bytes and self._items:
+            old_key, (old, old_group) = self._items.popitem(last=False)
+            self.bytes -= old.nbytes + ENTRY_OVERHEAD
+            index = self._near_index.get(old_group)
+            if index is not None:
+                index.remove(old_key)
+                if not index:
+                    del self._near_index[old_group]
+
+    def _find_near(self, group, phash):
+        index = self._near_index.get(group)
+        if index is None:
+            return None
+        key, distance = index.nearest(phash)
+        if key is not None and distance <= self.near_distance:
+            return key
+        return None
+
+    def get(self, frame, params):
+        """返回缓存的检测结果（只读数组），未命中返回 (None, 查询信息)，查询信息用于随后的 put"""
+        key = content_key(frame, params)
+        phash = None
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[0], None
+        if self._disk is not None:
+            with self._lock:
+                row = self._disk.execute("SELECT detections FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                detections = np.frombuffer(row[0], dtype=np.float32).reshape(-1, 6)
+                with self._lock:
+                    self._put(key, detections)
+                    self.disk_hits += 1
+                return detections, None
+        group = (frame.shape, params)
+        if self.near_distance is not None:
+            phash = perceptual_hash(frame)
+            with self._lock:
+                near_key = self._find_near(group, phash)
+                if near_key is not None and near_key in self._items:
+                    self._items.move_to_end(near_key)
+                    self.near_hits += 1
+                    return self._items[near_key][0], None
+        with self._lock:
+            self.misses += 1
+        return None, (key, group, phash)
+
+    def put(self, lookup, detections):
+        """保存一次未命中查询的推理结果"""
+        key, group, phash = lookup
+        detections = np.ascontiguousarray(detections, dtype=np.float32)
+        # 缓存的数组会被多次返回，禁止写入以免调用方意外修改
+        detections.setflags(write=False)
+        with self._lock:
+            self._put(key, detections, group, phash)
+            if self._disk is not None:
+                self._disk.execute("INSERT OR IGNORE INTO results (key, detections) VALUES (?, ?)",
+                                   (key, detections.tobytes()))
+                self._disk.commit()
+                self._disk_writes += 1
+                if self.disk_entries and self._disk_writes % 1000 == 0:
+                    # 只保留最近写入的 disk_entries 条
+                    self._disk.execute("DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?",
+                                       (self.disk_entries,))
+                    self._disk.commit()
+        return detections
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._near_index.clear()
+            self.bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM results")
+                self._disk.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._items),
+                'mb': self.bytes / 1024 / 1024,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            }
+
+    def summary(self):
+        data = self.stats()
+        return (f"hit_rate={data['hit_rate']:.1%} hits={data['hits']} near={data['near_hits']} "
+                f"disk={data['disk_hits']} misses={data['misses']} entries={data['entries']} "
+                f"size={data['mb']:.1f}MB")
+
+    def maybe_log(self, interval=LOG_METRICS_INTERVAL):
+        """距上次输出超过 interval 秒时，以INFO级别输出一次命中率"""
+        if not interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_log < interval:
+                return
+            self._last_log = now
+        logger.info('检测结果缓存: %s', self.summary())
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+
+class CachingBackend:
+    """在推理后端前加结果缓存，predict 接口与后端相同，只把未命中的图像送入模型"""
+
+    def __init__(self, backend, cache=None):
+        self.backend = backend
+        self.name = backend.name
+        self.model_path = getattr(backend, 'model_path', None)
+        self.cache = cache or ResultCache(model_fingerprint(backend))
+
+    def predict(self, frames, imgsz, conf):
+        params = (imgsz, conf)
+        results = [None] * len(frames)
+        misses = []
+        for i, frame in enumerate(frames):
+            results[i], lookup = self.cache.get(frame, params)
+            if results[i] is None:
+                misses.append((i, lookup))
+        if misses:
+            outputs = self.backend.predict([frames[i] for i, _ in misses], imgsz, conf)
+            for (i, lookup), output in zip(misses, outputs):
+                results[i] = self.cache.put(lookup, output)
+        self.cache.maybe_log()
+        return results
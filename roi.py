@@ -0,0 +1,140 @@
+# roi.py
+"""检测区域与高分辨率画面的分块推理
+
+每路摄像头可以配置若干多边形检测区域（像素坐标），只把区域的外接矩形裁剪出来送入模型，
+天空、围挡等区域外的画面不参与推理，检测框中心不在区域内的结果也会被丢弃。
+设置 tile_size 后，外接矩形再切分为相互重叠的 tile_size×tile_size 分块，各分块作为一批推理，
+模型按 imgsz 缩放的是分块而不是整幅画面，4K画面中远处只有几十像素的工人也能检测到；
+各分块的检测框还原到整幅画面的坐标后做一次非极大值抑制，去掉重叠区域中重复检测的目标。
+
+视频源配置示例（service_sources.example.json）:
+    "roi": {"polygons": [[[0, 900], [3840, 700], [3840, 2160], [0, 2160]]], "tile_size": 1280}
+"""
+import math
+
+import cv2
+import numpy as np
+from backends import nms
+from config import MAX_DETECTIONS, ROI_MERGE_THRESHOLD, ROI_TILE_OVERLAP
+
+EMPTY_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+# 检测框距分块内侧边缘不超过该像素数时视为被分块截断
+EDGE_MARGIN = 2
+
+
+def tile_starts(start, end, size, overlap):
+    """把 [start, end) 切分为长度 size、重叠不少于 overlap 比例的若干段，返回各段起点"""
+    length = end - start
+    if length <= size:
+        return [start]
+    count = math.ceil((length - size) / (size * (1 - overlap))) + 1
+    # 起点均匀分布，首尾两段分别对齐区域的两端
+    return [start + round(i * (length - size) / (count - 1)) for i in range(count)]
+
+
+class RegionOfInterest:
+    """单路摄像头的检测区域，polygons为空时使用整幅画面
+
+    windows/merge 按图像尺寸缓存区域掩码和裁剪窗口，同一路摄像头的画面尺寸不变时只计算一次。
+    """
+
+    def __init__(self, polygons=None, tile_size=None, overlap=ROI_TILE_OVERLAP, merge_threshold=ROI_MERGE_THRESHOLD):
+        self.polygons = [np.asarray(polygon, dtype=np.int32).reshape(-1, 2) for polygon in polygons or []]
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.merge_threshold = merge_threshold
+        self._masks = {}
+        self._windows = {}
+
+    @classmethod
+    def from_config(cls, item):
+        """由视频源配置中的 roi 项创建：{"polygons": [[[x, y], ...], ...], "tile_size": 1280, "overlap": 0.2}"""
+        return cls(item.get('polygons'), item.get('tile_size'), item.get('overlap', ROI_TILE_OVERLAP))
+
+    def mask(self, shape):
+        """区域内为255的掩码，没有多边形时返回None"""
+        if not self.polygons:
+            return None
+        key = shape[:2]
+        if key not in self._masks:
+            mask = np.zeros(key, dtype=np.uint8)
+            cv2.fillPoly(mask, self.polygons, 255)
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def bounds(self, shape):
+        """检测区域在画面内的外接矩形 (x1, y1, x2, y2)"""
+        h, w = shape[:2]
+        if not self.polygons:
+            return 0, 0, w, h
+        points = np.concatenate(self.polygons)
+        x1, y1 = np.clip(points.min(axis=0), 0, (w, h))
+        x2, y2 = np.clip(points.max(axis=0) + 1, 0, (w, h))
+        return int(x1), int(y1), int(x2), int(y2)
+
+    def windows(self, shape):
+        """需要推理的裁剪窗口列表 [(x1, y1, x2, y2)]，与检测区域不相交的分块不推理"""
+        key = shape[:2]
+        if key in self._windows:
+            return self._windows[key]
+        x1, y1, x2, y2 = self.bounds(shape)
+        windows = []
+        if x2 > x1 and y2 > y1:
+            if self.tile_size:
+                windows = [(x, y, min(x + self.tile_size, x2), min(y + self.tile_size, y2))
+                           for y in tile_starts(y1, y2, self.tile_size, self.overlap)
+                           for x in tile_starts(x1, x2, self.tile_size, self.overlap)]
+            else:
+                windows = [(x1, y1, x2, y2)]
+            mask = self.mask(shape)
+            if mask is not None:
+                windows = [(a, b, c, d) for a, b, c, d in windows if mask[b:d, a:c].any()]
+        self._windows[key] = windows
+        return windows
+
+    def crops(self, frame):
+        """按裁剪窗口切出的图像（原图的视图，不复制）"""
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.windows(frame.shape)]
+
+    def contains(self, detections, shape):
+        """检测框中心是否在检测区域内，返回布尔数组"""
+        mask = self.mask(shape)
+        if mask is None or len(detections) == 0:
+            return np.ones(len(detections), dtype=bool)
+        h, w = shape[:2]
+        cx = ((detections[:, 0] + detections[:, 2]) / 2).astype(np.int32).clip(0, w - 1)
+        cy = ((detections[:, 1] + detections[:, 3]) / 2).astype(np.int32).clip(0, h - 1)
+        return mask[cy, cx] > 0
+
+    def merge(self, outputs, shape):
+        """把各裁剪窗口的后端输出合并为整幅画面坐标的 (N, 6) 数组"""
+        bx1, by1, bx2, by2 = self.bounds(shape)
+        parts, truncated = [], []
+        for (x1, y1, x2, y2), detections in zip(self.windows(shape), outputs):
+            if len(detections):
+                # 碰到分块内侧边缘（不是检测区域外接矩形的边缘）的框只包含目标的一部分
+                truncated.append(((x1 > bx1) & (detections[:, 0] <= EDGE_MARGIN))
+                                 | ((y1 > by1) & (detections[:, 1] <= EDGE_MARGIN))
+                                 | ((x2 < bx2) & (detections[:, 2] >= x2 - x1 - EDGE_MARGIN))
+                                 | ((y2 < by2) & (detections[:, 3] >= y2 - y1 - EDGE_MARGIN)))
+                # 后端输出可能是缓存中的只读数组，平移坐标前先复制
+                detections = detections.copy()
+                detections[:, [0, 2]] += x1
+                detections[:, [1, 3]] += y1
+                parts.append(detections)
+        if not parts:
+            return EMPTY_DETECTIONS
+        detections = np.concatenate(parts)
+        if len(parts) > 1:
+            # 重叠区域中的目标会在相邻分块中各检测一次，其中一次可能被分块边缘截断。
+            # 按交集占较小框的比例抑制，截断的框排在完整的框之后，同一目标保留完整的框
+            offsets = detections[:, 5:6] * (detections[:, :4].max() + 1)
+            ranks = detections[:, 4] - np.concatenate(truncated)
+            detections = detections[nms(detections[:, :4] + offsets, ranks, self.merge_threshold, over_smaller=True)]
+        return detections[self.contains(detections, shape)][:MAX_DETECTIONS]
+
+    def draw(self, frame, color=(255, 255, 0)):
+        """在图像上绘制检测区域的边界（原地修改并返回frame）"""
+        if self.polygons:
+            cv2.polylines(frame, self.polygons, True, color, 2)
+        return frame
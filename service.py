@@ -0,0 +1,353 @@
+# service.py
+"""无界面多路摄像头检测服务
+
+用法:
+    python service.py sources.json [--duration 秒] [--workers N]
+
+配置文件格式见 service_sources.example.json，每路视频源可以是摄像头编号、
+RTSP 地址或本地视频文件（本地文件可用来模拟摄像头进行测试）。高分辨率摄像头可以用 roi
+项设置检测区域和分块推理，见 roi.py。
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import cv2
+from config import (SERVICE_WORKERS, SERVICE_RECORD_INTERVAL, MOTION_GATING,
+                    INFERENCE_STRIDE, TRACKING, STORE_DETECTIONS, DETECTION_STORE_CONF, RESULT_CACHE)
+from box_store import pack_boxes
+from database import Database, RecordWriter
+from image_store import ImageStore
+from detector import HelmetDetector, draw_detections
+from monitor import get_logger, setup_logging, metrics
+from motion import MotionGate
+from pipeline import CaptureThread, LatestQueue, StageStats
+from roi import RegionOfInterest
+from tracker import IoUTracker
+
+logger = get_logger('service')
+
+
+class LoopingCapture:
+    """读到文件末尾后从头播放的视频源，用于以本地文件模拟摄像头"""
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def read(self):
+        ret, frame = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+
+class CameraSource:
+    """单路视频源：采集线程、待检测帧队列以及记录状态"""
+
+    def __init__(self, name, source, site_id, max_fps=None, record_interval=SERVICE_RECORD_INTERVAL,
+                 loop=False, save_images=True, gate=None, tracker=None, region=None):
+        self.name = name
+        self.source = source
+        self.site_id = site_id
+        self.max_fps = max_fps
+        self.record_interval = record_interval
+        self.loop = loop
+        self.save_images = save_images
+        # 运动门控，None表示每帧都推理
+        self.gate = gate
+        # 目标跟踪器，设置后记录的是记录间隔内的唯一人数
+        self.tracker = tracker
+        # 检测区域（roi.RegionOfInterest），None表示检测整幅画面
+        self.region = region
+        self.frame_index = 0
+        # 正在由某个工作线程处理，见 DetectionService._collect_batch
+        self.busy = False
+
+        self.queue = LatestQueue(1)
+        self.capture_thread = None
+        self.stats = StageStats()
+        self.last_record_time = None
+        self.last_results = None
+        self.last_detections = None
+        self.last_candidates = None
+        self.records_written = 0
+
+    def open(self):
+        """打开视频源并启动采集线程"""
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise RuntimeError(f"无法打开视频源 {self.name}: {self.source}")
+        # 本地文件按原始帧率读取，以模拟实时摄像头
+        is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        if is_file and self.loop:
+            capture = LoopingCapture(capture)
+        self.capture_thread = CaptureThread(capture, self.queue, realtime=is_file, max_fps=self.max_fps)
+        self.capture_thread.start()
+        # 跟踪模式下第一条记录也统计完整的记录间隔
+        if self.tracker is not None:
+            self.last_record_time = time.monotonic()
+
+    def close(self):
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
+            self.capture_thread.join()
+            self.capture_thread.capture.release()
+
+    @property
+    def finished(self):
+        return self.capture_thread.finished.is_set() and len(self.queue) == 0
+
+    def record_due(self, now):
+        return self.last_record_time is None or now - self.last_record_time >= self.record_interval
+
+
+class DetectionService:
+    """多路视频源由工作线程池批量推理并写入数据库，每个工作线程使用独立的检测器"""
+
+    def __init__(self, sources, detector=None, db=None, workers=SERVICE_WORKERS, store_detections=STORE_DETECTIONS):
+        if not sources:
+            raise ValueError("至少需要配置一路视频源")
+        self.sources = sources
+        # 保存检测框时推理结果中保留置信度较低的候选框，之后可以按更低的阈值重新统计
+        self.store_detections = store_detections
+        self.workers = workers
+        # 每个工作线程使用独立的检测器（各自加载模型），推理可以在多个CPU核上并行；
+        # 传入 detector 时所有工作线程共用它，推理由检测器的锁串行执行
+        if detector is not None:
+            self.detectors = [detector] * workers
+        else:
+            self._limit_torch_threads(workers)
+            self.detectors = [HelmetDetector(candidate_conf=DETECTION_STORE_CONF if store_detections else None,
+                                             result_cache=RESULT_CACHE)
+                              for _ in range(workers)]
+        self.detector = self.detectors[0]
+        self.db = db or Database()
+        # 检测记录由后台线程批量写入，工作线程不等待磁盘
+        self.writer = RecordWriter(self.db)
+        # 截图由后台线程编码写入，并定期清理
+        self.images = ImageStore(db=self.db)
+
+        self._worker_threads = []
+        self._stop_event = threading.Event()
+        self._schedule_lock = threading.Lock()
+        self._next_source = 0
+
+    @staticmethod
+    def _limit_torch_threads(workers):
+        """多个模型实例并行推理时，每个实例只用一部分CPU核，避免线程数远超核数"""
+        if workers <= 1:
+            return
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+    def _collect_batch(self):
+        """轮询各路视频源，取出最多一个批次的待检测帧
+
+        取到帧的视频源标记为 busy，处理完成前不会被其他工作线程选中，同一路视频源的
+        运动门控、跟踪器和记录状态始终只由一个线程按帧的顺序更新。
+        """
+        batch = []
+        with self._schedule_lock:
+            count = len(self.sources)
+            for offset in range(count):
+                source = self.sources[(self._next_source + offset) % count]
+                if source.busy:
+                    continue
+                frame = source.queue.get_latest()
+                if frame is not None:
+                    source.busy = True
+                    batch.append((source, frame))
+                if len(batch) >= self.detector.batch_size:
+                    break
+            self._next_source = (self._next_source + 1) % count
+        return batch
+
+    def _worker(self, detector):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                if all(source.finished for source in self.sources):
+                    break
+                self._stop_event.wait(0.01)
+                continue
+            try:
+                self._process_batch(detector, batch)
+            finally:
+                with self._schedule_lock:
+                    for source, _ in batch:
+                        source.busy = False
+
+    def _process_batch(self, detector, batch):
+        """检测一批 (视频源, 帧) 并处理结果，调用方保证批次中的视频源不会同时被其他线程处理"""
+        # 画面没有变化的视频源直接复用上一次的检测结果
+        to_infer = []
+        for source, frame in batch:
+            infer = source.gate is None or source.gate.should_infer(frame)
+            if infer or source.last_detections is None:
+                to_infer.append((source, frame))
+            else:
+                self._handle_result(source, (frame, *source.last_results, source.last_detections,
+                                             source.last_candidates))
+        if not to_infer:
+            return
+
+        # 只需要统计数量，图像在写入记录时才绘制
+        results = detector.detect_batch([frame for _, frame in to_infer], annotate=False,
+                                        with_candidates=True,
+                                        regions=[source.region for source, _ in to_infer])
+        for (source, _), result in zip(to_infer, results):
+            self._handle_result(source, result)
+
+    def _handle_result(self, source, result):
+        """更新视频源状态，到达记录间隔时写入检测记录"""
+        frame, total, with_helmet, without_helmet, detections, candidates = result
+        source.stats.tick()
+        source.last_results = (total, with_helmet, without_helmet)
+        source.last_detections = detections
+        source.last_candidates = candidates
+        if source.tracker is not None:
+            source.frame_index += 1
+            source.tracker.update(detections, source.frame_index)
+
+        now = time.monotonic()
+        if not source.record_due(now):
+            return
+        if source.tracker is not None:
+            # 记录间隔内出现过的唯一人数，保存的检测框为每个计入的目标一个，与人数对应；
+            # 窗口为空时取出也不会丢失目标
+            (total, with_helmet, without_helmet), candidates = source.tracker.pop_window()
+        if total == 0:
+            return
+        source.last_record_time = now
+
+        image_path = ''
+        if source.save_images:
+            draw_detections(frame, detections, total, with_helmet, without_helmet)
+            if source.region is not None:
+                source.region.draw(frame)
+            # 帧只在这里使用一次，不需要复制
+            image_path = self.images.save(frame, prefix=f'capture_{source.name}', copy=False)
+
+        boxes = pack_boxes(candidates) if self.store_detections else None
+        self.writer.add(source.site_id, total, with_helmet, without_helmet, image_path, boxes=boxes)
+        source.records_written += 1
+
+    def start(self):
+        for source in self.sources:
+            source.open()
+        self.writer.start()
+        for detector in self.detectors:
+            thread = threading.Thread(target=self._worker, args=(detector,), daemon=True)
+            thread.start()
+            self._worker_threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._worker_threads:
+            thread.join()
+        for source in self.sources:
+            source.close()
+        # 写完缓冲区中剩余的截图和记录
+        self.images.close()
+        self.writer.close()
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._worker_threads)
+
+    def format_stats(self):
+        lines = []
+        for source in self.sources:
+            total, with_helmet, without_helmet = source.last_results or (0, 0, 0)
+            line = (f"[{source.name}] 采集 {source.capture_thread.stats.fps:.1f} FPS, "
+                    f"处理 {source.stats.fps:.1f} FPS, 丢帧 {source.queue.dropped}, "
+                    f"当前 {total}/{with_helmet}/{without_helmet}, 已写入 {source.records_written} 条记录")
+            if source.gate is not None:
+                line += f", 实际推理 {source.gate.inference_rate * 100:.0f}%"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def run(self, duration=None, report_interval=5.0):
+        """运行服务，直到所有视频源结束、到达指定时长或被中断"""
+        self.start()
+        start_time = time.monotonic()
+        last_report = start_time
+        try:
+            while self.is_running():
+                time.sleep(0.2)
+                now = time.monotonic()
+                if duration is not None and now - start_time >= duration:
+                    break
+                if now - last_report >= report_interval:
+                    logger.info('运行状态:\n%s', self.format_stats())
+                    last_report = now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        logger.info('运行结束:\n%s', self.format_stats())
+        logger.info('检测指标: %s', metrics.summary())
+
+
+def load_sources(config_path, db):
+    """读取视频源配置文件"""
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    sources = []
+    for i, item in enumerate(config['sources']):
+        source = item['source']
+        # 数字表示摄像头编号
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+
+        site_id = item.get('site_id')
+        if site_id is None:
+            site = db.get_site_by_name(item['site_name'])
+            if site is None:
+                raise ValueError(f"工地不存在: {item['site_name']}")
+            site_id = site[0]
+
+        sources.append(CameraSource(
+            name=item.get('name', f'source{i}'),
+            source=source,
+            site_id=site_id,
+            max_fps=item.get('max_fps'),
+            record_interval=item.get('record_interval', SERVICE_RECORD_INTERVAL),
+            loop=item.get('loop', False),
+            save_images=item.get('save_images', True),
+            gate=MotionGate(stride=item.get('stride', INFERENCE_STRIDE))
+            if item.get('motion_gate', MOTION_GATING) else None,
+            tracker=IoUTracker() if item.get('tracking', TRACKING) else None,
+            region=RegionOfInterest.from_config(item['roi']) if item.get('roi') else None,
+        ))
+    return sources, config.get('workers', SERVICE_WORKERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='无界面多路摄像头安全帽检测服务')
+    parser.add_argument('config', help='视频源配置文件 (JSON)')
+    parser.add_argument('--duration', type=float, default=None, help='运行时长（秒），默认一直运行')
+    parser.add_argument('--workers', type=int, default=None, help='推理工作线程数')
+    args = parser.parse_args()
+
+    setup_logging()
+    db = Database()
+    sources, workers = load_sources(args.config, db)
+    service = DetectionService(sources, db=db, workers=args.workers or workers)
+    service.run(duration=args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+from batch import BatchProcessor, Checkpoint, find_images
+from database import Database
+from image_store import ImageStore
+
+
+class FlakyDetector:
+    """每张图片检测到一个人，第 fail_on 次调用时抛出异常"""
+
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def detect_batch(self, frames, annotate=True, with_candidates=False):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError('模拟推理失败')
+        detections = np.array([[0, 0, 4, 4, 0.9, 0]], dtype=np.float32)
+        return [(frame, 1, 1, 0, detections, detections) for frame in frames]
+
+
+@pytest.mark.parametrize('fail_on', [2, 4])
+def test_resume_after_crash_does_not_skip_images(tmp_path, fail_on):
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    for i in range(20):
+        cv2.imwrite(str(image_dir / f'{i:02d}.png'), np.full((8, 8, 3), i, dtype=np.uint8))
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    paths = find_images(str(image_dir))
+    checkpoint_path = str(tmp_path / 'checkpoint')
+
+    processor = BatchProcessor(db, FlakyDetector(fail_on=fail_on), site_id, batch_size=4, decode_workers=2,
+                               commit_size=6, store_detections=False)
+    with pytest.raises(RuntimeError):
+        processor.run(paths, Checkpoint(checkpoint_path))
+    checkpoint = Checkpoint(checkpoint_path)
+    # 检查点中的图片都已写入记录
+    assert db.count_records() == len(checkpoint.done)
+
+    processor = BatchProcessor(db, FlakyDetector(), site_id, batch_size=4, decode_workers=2,
+                               commit_size=6, store_detections=False)
+    processor.run(paths, checkpoint)
+    assert db.count_records() == 20
+    assert Checkpoint(checkpoint_path).done == set(paths)
+    db.close()
+
+
+def test_cleanup_keeps_captures_of_back_dated_imports(tmp_path):
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    image_path = str(image_dir / 'old.png')
+    cv2.imwrite(image_path, np.zeros((8, 8, 3), dtype=np.uint8))
+    # 导入一年前拍摄的图片，记录的检测时间是图片的修改时间
+    taken_at = time.time() - 365 * 86400
+    os.utime(image_path, (taken_at, taken_at))
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    images = ImageStore(str(tmp_path / 'captures'), db=db, retention_days=90)
+
+    processor = BatchProcessor(db, FlakyDetector(), site_id, images, store_detections=False)
+    processor.run(find_images(str(image_dir)), Checkpoint(str(tmp_path / 'checkpoint')))
+    images.flush()
+    assert images.cleanup(db) == (0, 0)
+    images.close()
+
+    capture_path = db.get_records_page()[0][6]
+    assert capture_path and os.path.exists(capture_path)
+    db.close()
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from box_store import BOX_DTYPE, BoxArchive, pack_boxes
+from config import CONF_THRESHOLD
+from detector import HelmetDetector
+
+
+@pytest.mark.parametrize('offset', [-1e-4, -1e-5, 0.0, 1e-5, 1e-4, 2e-4, 3e-4])
+def test_rescore_at_original_threshold_matches_live_filter(offset):
+    # 置信度紧挨着阈值，保存为float16后可能与阈值相等
+    scores = [CONF_THRESHOLD + offset, CONF_THRESHOLD + offset / 2, 0.9]
+    raw = np.array([[10 * i, 10, 10 * i + 8, 30, score, i % 2] for i, score in enumerate(scores)],
+                   dtype=np.float32)
+    live = HelmetDetector.__new__(HelmetDetector)._process_result(raw)
+
+    boxes = np.frombuffer(pack_boxes(raw), dtype=BOX_DTYPE)
+    archive = BoxArchive(np.array([1]), np.array([1]), np.array([len(boxes)]), boxes)
+    total, with_helmet, without_helmet = archive.rescore(CONF_THRESHOLD)
+    assert int(total[0]) == len(live)
+    assert int(with_helmet[0]) == int(np.count_nonzero(live[:, 5] == 0))
+    assert int(without_helmet[0]) == int(np.count_nonzero(live[:, 5] != 0))
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from database import Database, RecordWriter
+
+
+def test_record_writer_close_without_start_writes_pending_records(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    writer = RecordWriter(db)
+    for _ in range(3):
+        writer.add(site_id, 2, 1, 1)
+    writer.close()
+    assert db.count_records() == 3
+    assert writer.written == 3
+    db.close()
+
+
+def test_record_writer_flush_without_start(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    writer = RecordWriter(db)
+    writer.add(site_id, 1, 1, 0)
+    assert writer.flush()
+    assert db.count_records() == 1
+    writer.close()
+    db.close()
+
+
+def test_rollups_follow_inserts_updates_and_deletes(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    site_a = db.add_site('工地A', '', '')
+    site_b = db.add_site('工地B', '', '')
+    ids = [db.add_detection_record(site_a, 4, 3, 1, '', datetime(2024, 3, 1, 8, 15)),
+           db.add_detection_record(site_a, 0, 0, 0, '', datetime(2024, 3, 1, 8, 45)),
+           db.add_detection_record(site_b, 2, 2, 0, '', datetime(2024, 3, 1, 23, 50))]
+    db.add_detection_records([(site_a, datetime(2024, 3, 2, 9, i), 5, 4, 1, '') for i in range(10)])
+    assert db.verify_rollups() == []
+
+    # 修改人数，所在的小时和天不变
+    db.update_record(ids[0], site_a, 6, 3, 3)
+    # 改到另一个工地
+    db.update_record(ids[1], site_b, 1, 1, 0)
+    with db.transaction() as cursor:
+        # 跨小时、跨天移动
+        cursor.execute("UPDATE detection_records SET detection_time = ? WHERE id = ?",
+                       (datetime(2024, 3, 2, 0, 10), ids[2]))
+        cursor.execute("UPDATE detection_records SET detection_time = ?, site_id = ? WHERE id = ?",
+                       (datetime(2024, 2, 28, 12, 0), site_b, ids[0]))
+    assert db.verify_rollups() == []
+
+    db.delete_record(ids[1])
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM detection_records WHERE detection_time >= ?", (datetime(2024, 3, 2, 9, 5),))
+    assert db.verify_rollups() == []
+
+    # 删除一个小时内的全部记录后汇总表中不再保留该小时
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM detection_records")
+        assert cursor.execute("SELECT COUNT(*) FROM compliance_hourly").fetchone()[0] == 0
+        assert cursor.execute("SELECT COUNT(*) FROM compliance_daily").fetchone()[0] == 0
+    assert db.verify_rollups() == []
+    db.close()
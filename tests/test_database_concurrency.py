@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from database import Database
+
+INITIAL_ROWS = 2000
+WRITERS = 4
+WRITES_PER_WRITER = 200
+BATCH_WRITES = 20
+
+
+def populate(db, site_id, rows):
+    start = datetime(2024, 1, 1)
+    db.add_detection_records([(site_id, start + timedelta(minutes=i), 3, 2, 1, '') for i in range(rows)])
+
+
+def run_threads(targets):
+    errors = []
+
+    def wrap(target):
+        def run():
+            try:
+                target()
+            except Exception as e:  # 收集后在主线程中断言
+                errors.append(e)
+        return run
+
+    threads = [threading.Thread(target=wrap(target)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    return errors
+
+
+def test_concurrent_writers_and_readers(tmp_path):
+    path = str(tmp_path / 'test.db')
+    db = Database(path)
+    # 另一个连接（如另一个进程中的检测服务）同时写入同一个数据库文件
+    other = Database(path)
+    site_id = db.add_site('测试工地', '', '')
+    populate(db, site_id, INITIAL_ROWS)
+    stop = threading.Event()
+    read_counts = [[] for _ in range(3)]
+
+    def single_writer(database):
+        def run():
+            for i in range(WRITES_PER_WRITER):
+                database.add_detection_record(site_id, 2, 1, 1, '', datetime(2025, 1, 1) + timedelta(seconds=i))
+        return run
+
+    def batch_writer():
+        for i in range(BATCH_WRITES):
+            db.add_detection_records([(site_id, datetime(2025, 2, 1, 0, i), 1, 1, 0, '')] * 10)
+
+    def reader(counts):
+        while not stop.is_set():
+            counts.append(db.count_records())
+            db.get_records_page(limit=50)
+            db.get_site_statistics(site_id)
+
+    readers = [threading.Thread(target=reader, args=(counts,)) for counts in read_counts]
+    for thread in readers:
+        thread.start()
+    writers = [single_writer(db if i % 2 else other) for i in range(WRITERS)] + [batch_writer]
+    errors = run_threads(writers)
+    stop.set()
+    for thread in readers:
+        thread.join(60)
+
+    assert not [e for e in errors if isinstance(e, sqlite3.OperationalError)], errors
+    assert not errors
+    expected = INITIAL_ROWS + WRITERS * WRITES_PER_WRITER + BATCH_WRITES * 10
+    assert db.count_records() == expected
+    # 每个查询线程读到的记录数只会增加，不会读到未提交或回滚的中间状态
+    for counts in read_counts:
+        assert counts and counts == sorted(counts)
+        assert INITIAL_ROWS <= counts[0] and counts[-1] <= expected
+    assert db.verify_rollups() == []
+    other.close()
+    db.close()
+
+
+def test_keyset_pagination_is_consistent_during_writes(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    populate(db, site_id, INITIAL_ROWS)
+    existing = {row[0] for row in db.get_records_page(limit=INITIAL_ROWS)}
+    done = threading.Event()
+
+    def writer():
+        # 新记录的检测时间有的比所有已有记录新，有的落在已有记录之间
+        for i in range(300):
+            when = datetime(2025, 1, 1) + timedelta(seconds=i) if i % 2 else \
+                datetime(2024, 1, 1) + timedelta(minutes=i * 5, seconds=30)
+            db.add_detection_record(site_id, 1, 1, 0, '', when)
+        done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    seen = []
+    after = None
+    while True:
+        page = db.get_records_page(after=after, limit=37)
+        if not page:
+            break
+        seen.extend(row[0] for row in page)
+        after = (page[-1][2], page[-1][0])
+    thread.join(60)
+
+    assert done.is_set()
+    # 每条记录最多出现一次，翻页开始前已有的记录一条不少
+    assert len(seen) == len(set(seen))
+    assert existing <= set(seen)
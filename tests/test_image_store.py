@@ -0,0 +1,44 @@
+import os
+import time
+
+import numpy as np
+from image_store import ImageStore
+
+
+class RecordingDb:
+    def __init__(self):
+        self.cleared = []
+
+    def clear_image_paths(self, paths):
+        self.cleared.extend(paths)
+
+
+def save_image(store, age_days=0):
+    path = store.save(np.zeros((8, 8, 3), dtype=np.uint8))
+    store.flush()
+    saved_at = time.time() - age_days * 86400
+    os.utime(path, (saved_at, saved_at))
+    return path
+
+
+def test_first_cleanup_waits_one_interval(tmp_path):
+    db = RecordingDb()
+    store = ImageStore(str(tmp_path), db=db, retention_days=1, cleanup_interval=60)
+    path = save_image(store, age_days=2)
+    store._maybe_cleanup()
+    assert os.path.exists(path)
+
+    store._next_cleanup = 0
+    store._maybe_cleanup()
+    assert not os.path.exists(path)
+    assert db.cleared == [path]
+    store.close()
+
+
+def test_cleanup_keeps_everything_by_default(tmp_path):
+    db = RecordingDb()
+    store = ImageStore(str(tmp_path), db=db)
+    path = save_image(store, age_days=365)
+    assert store.cleanup(db) == (0, 0)
+    assert os.path.exists(path)
+    store.close()
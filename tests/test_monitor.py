@@ -0,0 +1,60 @@
+import logging
+import time
+
+from monitor import RateLimitFilter, RateLimitFormatter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def make_logger(name, handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = []
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    rate_limit = RateLimitFilter(rate=2, window=0.2)
+    for handler in handlers:
+        handler.setFormatter(RateLimitFormatter('%(message)s'))
+        handler.addFilter(rate_limit)
+        logger.addHandler(handler)
+    return logger
+
+
+def test_rate_limit_is_consistent_across_handlers():
+    console, log_file = ListHandler(), ListHandler()
+    logger = make_logger('helmet.test_rate_limit', [console, log_file])
+    for _ in range(5):
+        logger.warning('无法读取图片: %s', 'a.jpg')
+    time.sleep(0.25)
+    logger.warning('无法读取图片: %s', 'a.jpg')
+
+    expected = ['无法读取图片: a.jpg', '无法读取图片: a.jpg', '无法读取图片: a.jpg (已抑制 3 条重复日志)']
+    assert console.messages == expected
+    assert log_file.messages == expected
+
+
+def test_messages_with_different_arguments_share_one_counter():
+    handler = ListHandler()
+    logger = make_logger('helmet.test_rate_limit_args', [handler])
+    for i in range(5):
+        logger.warning('无法读取图片: %s', f'{i}.jpg')
+    assert handler.messages == ['无法读取图片: 0.jpg', '无法读取图片: 1.jpg']
+
+
+def test_expired_counters_are_pruned(monkeypatch):
+    import monitor
+    monkeypatch.setattr(monitor, 'RATE_LIMIT_MAX_KEYS', 10)
+    rate_limit = RateLimitFilter(rate=2, window=0.05)
+    logger = make_logger('helmet.test_rate_limit_prune', [ListHandler()])
+    logger.handlers[0].filters = [rate_limit]
+    for i in range(10):
+        logger.warning(f'消息 {i}')
+    time.sleep(0.1)
+    logger.warning('新的消息')
+    assert len(rate_limit._counters) == 1
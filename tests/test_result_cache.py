@@ -0,0 +1,81 @@
+import numpy as np
+from result_cache import CachingBackend, HashIndex, ResultCache, perceptual_hash
+
+
+class CountingBackend:
+    name = 'counting'
+
+    def __init__(self):
+        self.frames = 0
+
+    def predict(self, frames, imgsz, conf):
+        self.frames += len(frames)
+        return [np.array([[0, 0, 10, 10, float(frame.mean()) / 255, 0]], dtype=np.float32) for frame in frames]
+
+
+def make_frames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (48, 64, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def test_exact_hits_skip_inference():
+    backend = CountingBackend()
+    cached = CachingBackend(backend, ResultCache('test', near_distance=None))
+    frames = make_frames(4)
+    first = cached.predict(frames, 640, 0.25)
+    second = cached.predict([frame.copy() for frame in frames], 640, 0.25)
+    assert backend.frames == 4
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    # 推理参数不同时不复用
+    cached.predict(frames[:1], 320, 0.25)
+    assert backend.frames == 5
+
+
+def test_near_duplicates_and_eviction_keep_index_in_sync():
+    frames = make_frames(200, seed=1)
+    entry_bytes = 24 + 200
+    cache = ResultCache('test', max_bytes=entry_bytes * 50, near_distance=8)
+    backend = CountingBackend()
+    cached = CachingBackend(backend, cache)
+    cached.predict(frames, 640, 0.25)
+    assert len(cache._items) == 50
+    # 淘汰的条目同时从感知哈希索引中删除
+    assert sum(len(index) for index in cache._near_index.values()) == 50
+
+    noisy = frames[-1].astype(np.int16) + np.random.default_rng(2).integers(-2, 3, frames[-1].shape)
+    cached.predict([noisy.clip(0, 255).astype(np.uint8)], 640, 0.25)
+    assert cache.near_hits == 1
+    cached.predict([frames[0]], 640, 0.25)
+    assert cache.misses == 201
+
+
+def test_hash_index_reuses_rows_and_grows():
+    index = HashIndex(capacity=2)
+    hashes = [perceptual_hash(frame) for frame in make_frames(5, seed=3)]
+    for i, phash in enumerate(hashes[:3]):
+        index.add(i, phash)
+    assert len(index.keys) == 4
+    index.remove(1)
+    index.add(3, hashes[3])
+    assert len(index.keys) == 4
+    assert index.nearest(hashes[3]) == (3, 0)
+    assert index.nearest(hashes[0]) == (0, 0)
+    index.remove(0)
+    assert index.nearest(hashes[0])[0] != 0
+
+
+def test_with_result_cache_shares_model_and_leaves_original_uncached(monkeypatch):
+    import detector
+    backend = CountingBackend()
+    monkeypatch.setattr(detector, 'create_backend', lambda name, model_path: backend)
+    video_detector = detector.HelmetDetector()
+    image_detector = video_detector.with_result_cache()
+    assert image_detector._lock is video_detector._lock
+
+    frame = make_frames(1)[0]
+    for _ in range(2):
+        video_detector.detect_frame(frame.copy(), annotate=False)
+    assert backend.frames == 2
+    for _ in range(2):
+        image_detector.detect_frame(frame.copy(), annotate=False)
+    assert backend.frames == 3
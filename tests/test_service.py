@@ -0,0 +1,66 @@
+import threading
+import time
+
+import numpy as np
+from database import Database
+from service import CameraSource, DetectionService
+
+
+class StubCapture:
+    def __init__(self):
+        self.finished = threading.Event()
+
+
+class ConcurrencyCheckingDetector:
+    """记录同一路视频源的帧是否被多个线程同时检测（帧的像素值为视频源编号）"""
+
+    batch_size = 2
+
+    def __init__(self):
+        self.active = set()
+        self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def detect_batch(self, frames, annotate=True, with_candidates=False, regions=None):
+        ids = [int(frame[0, 0, 0]) for frame in frames]
+        with self.lock:
+            self.overlaps += len(self.active.intersection(ids))
+            self.active.update(ids)
+        time.sleep(0.002)
+        with self.lock:
+            self.active.difference_update(ids)
+        detections = np.array([[0, 0, 2, 2, 0.9, 0]], dtype=np.float32)
+        return [(frame, 1, 1, 0, detections, detections) for frame in frames]
+
+
+def test_each_source_is_processed_by_one_worker_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database(str(tmp_path / 'test.db'))
+    site_id = db.add_site('测试工地', '', '')
+    sources = [CameraSource(f'cam{i}', None, site_id, record_interval=3600, save_images=False)
+               for i in range(3)]
+    for source in sources:
+        source.capture_thread = StubCapture()
+    detector = ConcurrencyCheckingDetector()
+    service = DetectionService(sources, detector=detector, db=db, workers=4, store_detections=False)
+    service.writer.start()
+    threads = [threading.Thread(target=service._worker, args=(d,)) for d in service.detectors]
+    for thread in threads:
+        thread.start()
+
+    for _ in range(200):
+        for i, source in enumerate(sources):
+            source.queue.put(np.full((4, 4, 3), i, dtype=np.uint8))
+        time.sleep(0.001)
+    for source in sources:
+        source.capture_thread.finished.set()
+    for thread in threads:
+        thread.join(10)
+    service.writer.close()
+    service.images.close()
+
+    assert detector.overlaps == 0
+    # 记录间隔内每路视频源只写入第一条记录
+    assert [source.records_written for source in sources] == [1, 1, 1]
+    assert db.count_records() == 3
+    db.close()
@@ -0,0 +1,51 @@
+import numpy as np
+from box_store import BOX_DTYPE, BoxArchive, pack_boxes
+from config import CONF_THRESHOLD
+from tracker import IoUTracker
+
+
+def detections(boxes):
+    return np.array(boxes, dtype=np.float32).reshape(-1, 6)
+
+
+def test_window_detections_rescore_to_window_counts():
+    tracker = IoUTracker(min_hits=2)
+    # 两个目标持续出现并移动，一个只出现一次（不计入），一个中途离开
+    for i in range(6):
+        frame = [[10 + i, 10, 50 + i, 60, 0.8, 0], [200, 100 + i, 240, 150 + i, 0.6, 1]]
+        if i < 3:
+            frame.append([400, 300, 440, 350, 0.3, 1])
+        if i == 4:
+            frame.append([600, 50, 640, 100, 0.9, 0])
+        tracker.update(detections(frame), i)
+
+    assert tracker.window_counts() == (3, 1, 2)
+    counts, window_detections = tracker.pop_window()
+    assert tracker.window_counts() == (0, 0, 0)
+    blob = pack_boxes(window_detections)
+    boxes = np.frombuffer(blob, dtype=BOX_DTYPE)
+    archive = BoxArchive(np.array([1]), np.array([1]), np.array([len(boxes)]), boxes)
+    total, with_helmet, without_helmet = archive.rescore(CONF_THRESHOLD)
+    assert counts == (3, 1, 2)
+    assert (int(total[0]), int(with_helmet[0]), int(without_helmet[0])) == counts
+
+
+def test_pop_window_does_not_lose_tracks_confirmed_concurrently():
+    import threading
+    tracker = IoUTracker(min_hits=1)
+    stop = threading.Event()
+    counted = []
+
+    def update():
+        # 每帧出现一个新目标，各自立即计入窗口
+        for i in range(3000):
+            tracker.update(detections([[i * 50 % 4000, 0, i * 50 % 4000 + 40, 40, 0.9, 0]]), i * 100)
+        stop.set()
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    while not stop.is_set():
+        counted.append(tracker.pop_window()[0][0])
+    thread.join()
+    counted.append(tracker.pop_window()[0][0])
+    assert sum(counted) == tracker._next_id - 1
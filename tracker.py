@@ -0,0 +1,199 @@
+# tracker.py
+"""基于IoU的轻量级多目标跟踪，为检测框分配跨帧稳定的ID并统计唯一人数"""
+import threading
+import time
+
+import numpy as np
+from config import TRACK_IOU_THRESHOLD, TRACK_MAX_AGE, TRACK_MIN_HITS
+from detector import draw_detections
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """计算两组框 (N, 4) 与 (M, 4) 两两之间的IoU，返回 (N, M) 数组"""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class Track:
+    """单个跟踪目标"""
+
+    def __init__(self, track_id, detection, frame_index):
+        self.id = track_id
+        self.box = detection[:4].astype(np.float64)
+        self.score = float(detection[4])
+        self.velocity = np.zeros(4)
+        self.hits = 1
+        self.misses = 0
+        self.last_frame = frame_index
+        # 按置信度累计的类别投票：[Hardhat, NO-Hardhat]
+        self.class_votes = np.zeros(2)
+        self.class_votes[int(detection[5] != 0)] += detection[4]
+
+    @property
+    def class_id(self):
+        return int(self.class_votes[1] > self.class_votes[0])
+
+    def box_at(self, frame_index):
+        """按匀速运动推算目标在指定帧的位置"""
+        return self.box + self.velocity * (frame_index - self.last_frame)
+
+    def update(self, detection, frame_index):
+        elapsed = max(1, frame_index - self.last_frame)
+        new_box = detection[:4].astype(np.float64)
+        # 平滑估计每帧位移，用于两次检测之间的插值
+        self.velocity = 0.5 * self.velocity + 0.5 * (new_box - self.box) / elapsed
+        self.box = new_box
+        self.score = float(detection[4])
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame_index
+        self.class_votes[int(detection[5] != 0)] += detection[4]
+
+
+class IoUTracker:
+    """贪心IoU匹配的多目标跟踪器（线程安全）
+
+    update() 输入每次检测的 (N, 6) 数组，输出带跟踪ID的 (M, 7) 数组
+    [x1, y1, x2, y2, score, class_id, track_id]；predict() 在不运行检测器的
+    帧上推算目标位置。确认过的目标（命中 min_hits 次以上）计入时间窗口内的唯一人数。
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_age=TRACK_MAX_AGE,
+                 min_hits=TRACK_MIN_HITS):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._window_tracks = {}
+        self.window_start = time.time()
+
+    def _tracks_to_array(self, tracks, frame_index):
+        if not tracks:
+            return np.zeros((0, 7), dtype=np.float32)
+        return np.array([[*track.box_at(frame_index), track.score, track.class_id, track.id]
+                         for track in tracks], dtype=np.float32)
+
+    def update(self, detections, frame_index):
+        with self._lock:
+            predicted = np.array([track.box_at(frame_index) for track in self.tracks]).reshape(-1, 4)
+            matched_tracks = set()
+            matched_detections = set()
+
+            if len(self.tracks) and len(detections):
+                ious = iou_matrix(predicted, detections[:, :4])
+                # 按IoU从大到小贪心匹配
+                for flat_index in np.argsort(ious, axis=None)[::-1]:
+                    t, d = np.unravel_index(flat_index, ious.shape)
+                    if ious[t, d] < self.iou_threshold:
+                        break
+                    if t in matched_tracks or d in matched_detections:
+                        continue
+                    self.tracks[t].update(detections[d], frame_index)
+                    matched_tracks.add(t)
+                    matched_detections.add(d)
+
+            updated = [self.tracks[t] for t in matched_tracks]
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks:
+                    track.misses += 1
+
+            for d in range(len(detections)):
+                if d not in matched_detections:
+                    track = Track(self._next_id, detections[d], frame_index)
+                    self._next_id += 1
+                    self.tracks.append(track)
+                    updated.append(track)
+
+            self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
+            for track in updated:
+                if track.hits >= self.min_hits:
+                    self._window_tracks[track.id] = track
+            return self._tracks_to_array(updated, frame_index)
+
+    def predict(self, frame_index):
+        """推算上一次检测时仍可见的目标在指定帧的位置"""
+        with self._lock:
+            visible = [track for track in self.tracks if track.misses == 0]
+            return self._tracks_to_array(visible, frame_index)
+
+    @staticmethod
+    def _counts(tracks):
+        without_helmet = sum(track.class_id for track in tracks)
+        return len(tracks), len(tracks) - without_helmet, without_helmet
+
+    @staticmethod
+    def _detections(tracks):
+        if not tracks:
+            return np.zeros((0, 6), dtype=np.float32)
+        return np.array([[*track.box, track.score, track.class_id] for track in tracks], dtype=np.float32)
+
+    def window_counts(self):
+        """当前时间窗口内的唯一人数 (total, with_helmet, without_helmet)"""
+        with self._lock:
+            return self._counts(list(self._window_tracks.values()))
+
+    def window_detections(self):
+        """当前时间窗口内计入唯一人数的目标，每个目标一行 [x1, y1, x2, y2, score, class_id]
+
+        框和置信度取目标最后一次被检测到时的值，类别取投票结果，与 window_counts 的统计一致。
+        """
+        with self._lock:
+            return self._detections(list(self._window_tracks.values()))
+
+    def pop_window(self):
+        """取出当前时间窗口的唯一人数和对应的检测框并开始新的窗口
+
+        在同一次加锁中完成，其他线程同时调用 update() 时新确认的目标不会在两步之间被丢弃。
+        返回 ((total, with_helmet, without_helmet), detections)。
+        """
+        with self._lock:
+            tracks = list(self._window_tracks.values())
+            counts, detections = self._counts(tracks), self._detections(tracks)
+            self._window_tracks = {}
+            self.window_start = time.time()
+        return counts, detections
+
+    def reset(self):
+        with self._lock:
+            self.tracks = []
+            self._window_tracks = {}
+            self.window_start = time.time()
+
+
+class TrackingDetector:
+    """在 HelmetDetector 前加目标跟踪，接口与 detect_frame 一致
+
+    检测器只在 gate 允许的帧上运行（如每N帧一次），其余帧由跟踪器推算目标位置。
+    """
+
+    def __init__(self, detector, tracker=None, gate=None):
+        self.detector = detector
+        self.tracker = tracker or IoUTracker()
+        self.gate = gate
+        self._frame_index = 0
+
+    def detect_frame(self, frame, annotate=True):
+        if frame is None or frame.size == 0:
+            return self.detector.detect_frame(frame, annotate)
+
+        self._frame_index += 1
+        if self.gate is None or self.gate.should_infer(frame):
+            frame, _, _, _, detections = self.detector.detect_batch([frame], annotate=False)[0]
+            tracked = self.tracker.update(detections, self._frame_index)
+        else:
+            tracked = self.tracker.predict(self._frame_index)
+
+        without_helmet = int(np.count_nonzero(tracked[:, 5]))
+        total = len(tracked)
+        with_helmet = total - without_helmet
+        if annotate:
+            draw_detections(frame, tracked, total, with_helmet, without_helmet)
+        return frame, total, with_helmet, without_helmet
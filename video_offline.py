@@ -0,0 +1,177 @@
+# video_offline.py
+"""离线分析长视频文件
+
+把视频按帧号切分为若干时间段，由多个工作进程各自打开 cv2.VideoCapture 定位到段首并行处理，
+每隔 sample_interval 秒取一帧检测，中间的帧只用 grab() 跳过、不解码。各段的结果合并为
+一条时间线，每 record_interval 秒写入一条检测记录（取该时段内人数最多的一帧），
+检测时间为录像开始时间加上帧在视频中的时间。
+
+用法:
+    python video_offline.py recording.mp4 --site 工地名称 --start-time "2024-03-01 08:00:00"
+    python video_offline.py recording.mp4 --site 工地名称 --workers 4 --sample-interval 0.5
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+from config import (DB_PATH, DETECT_BATCH_SIZE, DETECTION_STORE_CONF, SERVICE_RECORD_INTERVAL,
+                    STORE_DETECTIONS)
+
+# 每个工作进程分到的段数，段数多于进程数时先完成的进程可以继续处理剩余的段
+SEGMENTS_PER_WORKER = 4
+
+# 工作进程中的检测器，由 _init_worker 创建
+_detector = None
+
+
+def video_info(path):
+    """返回视频的 (帧率, 总帧数)"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"无法打开视频文件: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return fps, frame_count
+
+
+def plan_segments(frame_count, step, segments):
+    """把 [0, frame_count) 切分为不超过 segments 段，段首对齐到采样步长，返回 (起始帧, 结束帧) 列表"""
+    samples = (frame_count + step - 1) // step
+    per_segment = max(1, (samples + segments - 1) // segments)
+    return [(start * step, min(frame_count, (start + per_segment) * step))
+            for start in range(0, samples, per_segment)]
+
+
+def _init_worker(threads, batch_size):
+    global _detector
+    # 多个进程并行时每个进程只用少量线程，避免线程数远超CPU核数
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    cv2.setNumThreads(threads)
+    from detector import HelmetDetector
+    _detector = HelmetDetector(batch_size=batch_size,
+                               candidate_conf=DETECTION_STORE_CONF if STORE_DETECTIONS else None)
+
+
+def process_segment(path, start, end, step):
+    """检测 [start, end) 内每隔 step 帧的一帧，返回 [(帧号, 总人数, 戴帽人数, 未戴帽人数, 打包的检测框)]"""
+    from box_store import pack_boxes
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    results = []
+    frames, indices = [], []
+
+    def flush():
+        for index, (_, total, with_helmet, without_helmet, _, candidates) in zip(
+                indices, _detector.detect_batch(frames, annotate=False, with_candidates=True)):
+            results.append((index, total, with_helmet, without_helmet,
+                            pack_boxes(candidates) if STORE_DETECTIONS else None))
+        frames.clear()
+        indices.clear()
+
+    for index in range(start, end):
+        # 不需要检测的帧只读取不解码
+        if not capture.grab():
+            break
+        if (index - start) % step:
+            continue
+        ok, frame = capture.retrieve()
+        if not ok:
+            continue
+        frames.append(frame)
+        indices.append(index)
+        if len(frames) >= _detector.batch_size:
+            flush()
+    if frames:
+        flush()
+    capture.release()
+    return results
+
+
+def merge_timeline(samples, fps, start_time, record_interval):
+    """按 record_interval 秒分组合并各段的采样结果，每组取人数最多的一帧，返回检测记录的字段列表
+
+    每项为 (检测时间, 总人数, 戴帽人数, 未戴帽人数, 打包的检测框)，没有检测到人的时段不产生记录。
+    """
+    peaks = {}
+    for sample in samples:
+        bucket = int(sample[0] / fps // record_interval)
+        if sample[1] > 0 and (bucket not in peaks or sample[1] > peaks[bucket][1]):
+            peaks[bucket] = sample
+    return [(start_time + timedelta(seconds=index / fps), total, with_helmet, without_helmet, boxes)
+            for index, total, with_helmet, without_helmet, boxes in (peaks[b] for b in sorted(peaks))]
+
+
+def analyze_video(path, workers=None, sample_interval=1.0, batch_size=DETECT_BATCH_SIZE, segments=None):
+    """多进程分段检测视频，返回 (帧率, 按帧号排序的采样结果)"""
+    fps, frame_count = video_info(path)
+    if frame_count <= 0:
+        raise RuntimeError(f"无法获取视频帧数: {path}")
+    workers = workers or os.cpu_count() or 1
+    step = max(1, round(fps * sample_interval))
+    plan = plan_segments(frame_count, step, segments or workers * SEGMENTS_PER_WORKER)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"视频 {frame_count} 帧，{fps:.1f} FPS，时长 {frame_count / fps / 60:.1f} 分钟，"
+          f"分为 {len(plan)} 段，{workers} 个进程，每 {step} 帧检测一帧")
+
+    samples = []
+    start = time.perf_counter()
+    # spawn 启动的工作进程不继承父进程的数据库连接和线程
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(threads, batch_size)) as executor:
+        futures = {executor.submit(process_segment, path, first, last, step): (first, last)
+                   for first, last in plan}
+        done_frames = 0
+        for i, future in enumerate(as_completed(futures), 1):
+            samples.extend(future.result())
+            first, last = futures[future]
+            done_frames += last - first
+            elapsed = time.perf_counter() - start
+            print(f"完成 {i}/{len(plan)} 段，视频处理速度 {done_frames / fps / elapsed:.1f} 倍实时")
+    samples.sort(key=lambda sample: sample[0])
+    return fps, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线分析长视频文件')
+    parser.add_argument('video', help='视频文件路径')
+    parser.add_argument('--site', required=True, help='检测记录所属的工地名称')
+    parser.add_argument('--db', default=DB_PATH, help='数据库文件路径')
+    parser.add_argument('--start-time', default=None,
+                        help='录像开始时间 "YYYY-MM-DD HH:MM:SS"，默认为文件修改时间减去视频时长')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--segments', type=int, default=None, help='切分的段数，默认为进程数的4倍')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='每隔多少秒检测一帧')
+    parser.add_argument('--record-interval', type=float, default=SERVICE_RECORD_INTERVAL,
+                        help='每隔多少秒写入一条检测记录')
+    parser.add_argument('--batch-size', type=int, default=DETECT_BATCH_SIZE, help='每次送入模型的帧数')
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database(args.db)
+    site = db.get_site_by_name(args.site)
+    if site is None:
+        raise SystemExit(f"工地不存在: {args.site}")
+
+    start = time.perf_counter()
+    fps, samples = analyze_video(args.video, args.workers, args.sample_interval, args.batch_size, args.segments)
+    if args.start_time:
+        start_time = datetime.strptime(args.start_time, '%Y-%m-%d %H:%M:%S')
+    else:
+        duration = video_info(args.video)[1] / fps
+        start_time = datetime.fromtimestamp(os.path.getmtime(args.video)) - timedelta(seconds=duration)
+
+    timeline = merge_timeline(samples, fps, start_time, args.record_interval)
+    db.add_detection_records([(site[0], detection_time, total, with_helmet, without_helmet, '', boxes)
+                              for detection_time, total, with_helmet, without_helmet, boxes in timeline])
+    db.close()
+    print(f"检测 {len(samples)} 帧，写入 {len(timeline)} 条记录，用时 {time.perf_counter() - start:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()